@@ -1,4 +1,5 @@
 import json
+import time
 from copy import copy
 from typing import Dict, Iterator, Optional
 
@@ -13,7 +14,11 @@ from pillowtop.feed.interface import Change, ChangeFeed, ChangeMeta
 from pillowtop.models import kafka_seq_to_str
 
 from corehq.apps.change_feed.data_sources import get_document_store
-from corehq.apps.change_feed.exceptions import UnknownDocumentStore
+from corehq.apps.change_feed.consumer.partitions import POLL_INTERVAL
+from corehq.apps.change_feed.exceptions import (
+    PartitionsReassigned,
+    UnknownDocumentStore,
+)
 from corehq.apps.change_feed.topics import validate_offsets
 
 MIN_TIMEOUT = 500
@@ -27,11 +32,14 @@ class KafkaChangeFeed(ChangeFeed):
     sequence_format = 'json'
 
     def __init__(self, topics, client_id, strict=False, num_processes=1,
-                 process_num=0, dedicated_migration_process=False,):
+                 process_num=0, dedicated_migration_process=False, partition_coordinator=None):
         """
         Create a change feed listener for a list of kafka topics, a client ID, and partition.
 
         See http://kafka.apache.org/documentation.html#introduction for a description of what these are.
+
+        :param partition_coordinator: a ``PartitionCoordinator`` to assign
+            partitions to processes based on their load rather than statically.
         """
         self._topics = topics
         self._client_id = client_id
@@ -40,6 +48,9 @@ class KafkaChangeFeed(ChangeFeed):
         self.num_processes = num_processes
         self.process_num = process_num
         self.dedicated_migration_process = dedicated_migration_process
+        self.partition_coordinator = partition_coordinator
+        self._partition_generation = None
+        self._next_partition_check = 0
         self._consumer = None
 
     def __str__(self):
@@ -97,9 +108,11 @@ class KafkaChangeFeed(ChangeFeed):
             for message in self.consumer:
                 self._processed_topic_offsets[(message.topic, message.partition)] = message.offset
                 yield change_from_kafka_message(message)
+                self._check_partitions()
             # consumer timed out
             if not forever:
                 break
+            self._check_partitions()
             yield None  # avoid excessive lag while waiting for the next change
 
     def get_current_checkpoint_offsets(self):
@@ -148,6 +161,9 @@ class KafkaChangeFeed(ChangeFeed):
             'enable_auto_commit': False,
             'api_version': settings.KAFKA_API_VERSION,
         }
+        if self._consumer is not None and self.partition_coordinator is not None:
+            # stop consuming partitions that may now be assigned to another process
+            self._consumer.close()
         self._consumer = KafkaConsumer(**config)
 
         topic_partitions = []
@@ -157,6 +173,9 @@ class KafkaChangeFeed(ChangeFeed):
 
         self.topic_partitions = self._filter_partitions(topic_partitions)
         self._consumer.assign(self.topic_partitions)
+        if self._partition_generation is not None:
+            consumer_num, num_consumers = self._get_consumer_num()
+            self.partition_coordinator.hand_off(self._partition_generation, consumer_num)
         return self._consumer
 
     def _filter_offsets(self, offsets) -> Optional[Dict[TopicPartition, int]]:
@@ -171,19 +190,50 @@ class KafkaChangeFeed(ChangeFeed):
 
     def _filter_partitions(self, topic_partitions):
         topic_partitions.sort()
-        num_processes = self.num_processes
-        process_num = self.process_num
-        if self.dedicated_migration_process:
-            if self.process_num == 0:
-                # Process 0 is the migration process.
-                # Returning None disables the Kafka consumer.
-                return None
-            num_processes -= 1
-            process_num -= 1
+        self._all_topic_partitions = topic_partitions
+        if self.dedicated_migration_process and self.process_num == 0:
+            # Process 0 is the migration process.
+            # Returning None disables the Kafka consumer.
+            return None
+        consumer_num, num_consumers = self._get_consumer_num()
+        if self.partition_coordinator is not None:
+            self._partition_generation, partitions = self.partition_coordinator.get_partitions(
+                topic_partitions, consumer_num, num_consumers)
+            return partitions
         return [
-            topic_partitions[num::num_processes]
-            for num in range(num_processes)
-        ][process_num]
+            topic_partitions[num::num_consumers]
+            for num in range(num_consumers)
+        ][consumer_num]
+
+    def _get_consumer_num(self):
+        """Get the number of this process among processes that consume changes
+
+        :returns: ``(consumer_num, num_consumers)``
+        """
+        if self.dedicated_migration_process:
+            return self.process_num - 1, self.num_processes - 1
+        return self.process_num, self.num_processes
+
+    def _check_partitions(self):
+        """Rebalance partitions and check whether those of this process changed
+
+        Only runs every ``POLL_INTERVAL`` seconds. The first consumer
+        process is responsible for rebalancing.
+
+        :raises: ``PartitionsReassigned`` if the partitions changed.
+        """
+        coordinator = self.partition_coordinator
+        if coordinator is None or time.monotonic() < self._next_partition_check:
+            return
+        self._next_partition_check = time.monotonic() + POLL_INTERVAL
+        consumer_num, num_consumers = self._get_consumer_num()
+        if consumer_num == 0 and coordinator.rebalance_due():
+            end_offsets = self.consumer.end_offsets(self._all_topic_partitions)
+            coordinator.rebalance(self._all_topic_partitions, end_offsets, num_consumers)
+        generation, partitions = coordinator.get_partitions(
+            self._all_topic_partitions, consumer_num, num_consumers)
+        if generation != self._partition_generation:
+            raise PartitionsReassigned(f"Partitions of {self._client_id} {self.process_num} changed")
 
 
 class KafkaCheckpointEventHandler(PillowCheckpointEventHandler):
@@ -0,0 +1,268 @@
+"""
+Lag-aware assignment of Kafka partitions to pillow processes
+
+By default each pillow process consumes a fixed slice of the partitions
+of its topics (see ``KafkaChangeFeed._filter_partitions``). A partition
+that receives most of the changes, for example from a large project,
+then leaves one process saturated while the others idle.
+
+With a ``PartitionCoordinator`` the first consumer process of a pillow
+periodically estimates the load of each partition from its lag (the
+offsets in the pillow's ``KafkaCheckpoint`` rows compared to the latest
+offsets in Kafka) and the rate at which changes are published to it, and
+publishes a new assignment to redis when that would noticeably reduce
+the load of the busiest process.
+
+Handoff: every process polls the assignment while consuming changes.
+When the generation of the assignment changes the process stops
+consuming (``PartitionsReassigned``), the pillow restarts from its
+checkpoint, and the process acknowledges the new generation once its
+consumer has been assigned the new partitions. A process waits for the
+previous owners of the partitions it gains to acknowledge the
+generation before it consumes them, so that a partition is not consumed
+by two processes at the same time. Processes that do not acknowledge
+within ``HANDOFF_TIMEOUT`` are assumed to have stopped.
+
+Changes are processed at least once: a partition is resumed from its
+last saved checkpoint, so changes processed by the previous owner after
+that checkpoint are processed again.
+"""
+import json
+import logging
+import time
+
+from django_redis import get_redis_connection
+from kafka import TopicPartition
+
+from pillowtop.models import KafkaCheckpoint
+
+from corehq.util.metrics import metrics_counter
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "pillow-partitions"
+# seconds between checks for a new assignment
+POLL_INTERVAL = 10
+# seconds between load estimates by the first consumer process
+REBALANCE_INTERVAL = 5 * 60
+# seconds to wait for previous owners to release partitions
+HANDOFF_TIMEOUT = 2 * 60
+# minimum relative reduction of the load of the busiest process for
+# which partitions are reassigned
+MIN_IMPROVEMENT = 0.2
+ACK_EXPIRY = 24 * 60 * 60
+
+
+def static_assignment(topic_partitions, num_consumers):
+    """Assign sorted partitions to consumers round robin"""
+    return [topic_partitions[num::num_consumers] for num in range(num_consumers)]
+
+
+def assign_partitions(loads, num_consumers, current=None):
+    """Assign partitions to consumers to balance their total load
+
+    Partitions are assigned from the largest load to the smallest, each to
+    the consumer with the least load so far, preferring its current
+    consumer when loads are equal.
+
+    :param loads: dict of load by partition.
+    :param current: current assignment, a list of partitions for each consumer.
+    :returns: a list of sorted partitions for each consumer.
+    """
+    owners = {}
+    for num, partitions in enumerate(current or []):
+        for tp in partitions:
+            owners[tp] = num
+    totals = [0] * num_consumers
+    assignment = [[] for num in range(num_consumers)]
+    for tp in sorted(loads, key=lambda tp: (-loads[tp], tp)):
+        num = min(range(num_consumers), key=lambda num: (totals[num], num != owners.get(tp), num))
+        totals[num] += loads[tp]
+        assignment[num].append(tp)
+    return [sorted(partitions) for partitions in assignment]
+
+
+def max_load(assignment, loads):
+    return max(sum(loads.get(tp, 0) for tp in partitions) for partitions in assignment)
+
+
+class Assignment:
+
+    def __init__(self, generation, partitions, previous=None):
+        self.generation = generation
+        self.partitions = partitions
+        self.previous = previous
+
+    def is_valid_for(self, topic_partitions, num_consumers):
+        assigned = [tp for partitions in self.partitions for tp in partitions]
+        return (
+            len(self.partitions) == num_consumers
+            and len(assigned) == len(topic_partitions)
+            and set(assigned) == set(topic_partitions)
+        )
+
+    def get_previous_owners(self, consumer_num):
+        """Get consumers that owned partitions now assigned to ``consumer_num``"""
+        if self.previous is None:
+            return set()
+        gained = set(self.partitions[consumer_num])
+        return {
+            num for num, partitions in enumerate(self.previous)
+            if num != consumer_num and gained.intersection(partitions)
+        }
+
+    def to_json(self):
+        return json.dumps({
+            'generation': self.generation,
+            'partitions': self.partitions,
+            'previous': self.previous,
+        })
+
+    @classmethod
+    def from_json(cls, value):
+        data = json.loads(value)
+
+        def wrap(assignment):
+            if assignment is None:
+                return None
+            return [[TopicPartition(*tp) for tp in partitions] for partitions in assignment]
+
+        return cls(data['generation'], wrap(data['partitions']), wrap(data['previous']))
+
+
+class PartitionCoordinator:
+    """Coordinates the partitions consumed by the processes of a pillow
+
+    :param checkpoint_id: the pillow's checkpoint id, which identifies
+        its ``KafkaCheckpoint`` rows.
+    """
+
+    def __init__(self, checkpoint_id, rebalance_interval=REBALANCE_INTERVAL):
+        self.checkpoint_id = checkpoint_id
+        self.rebalance_interval = rebalance_interval
+        self._next_rebalance = time.monotonic() + rebalance_interval
+        self._last_end_offsets = None
+
+    @property
+    def key(self):
+        return f"{REDIS_KEY_PREFIX}:{self.checkpoint_id}"
+
+    @property
+    def generation_key(self):
+        # separate from the assignment so generations keep increasing
+        # if the assignment is evicted
+        return f"{self.key}:generation"
+
+    def _ack_key(self, generation):
+        return f"{self.key}:acks:{generation}"
+
+    def get_assignment(self):
+        value = get_redis_connection().get(self.key)
+        if value is None:
+            return None
+        return Assignment.from_json(value)
+
+    def get_partitions(self, topic_partitions, consumer_num, num_consumers):
+        """Get the partitions to be consumed by a consumer
+
+        :param topic_partitions: sorted list of all partitions.
+        :returns: ``(generation, partitions)``. The generation is ``None``
+            for the static assignment used until an assignment matching
+            the partitions and number of consumers has been published.
+        """
+        assignment = self.get_assignment()
+        if assignment is None or not assignment.is_valid_for(topic_partitions, num_consumers):
+            return None, static_assignment(topic_partitions, num_consumers)[consumer_num]
+        return assignment.generation, assignment.partitions[consumer_num]
+
+    def hand_off(self, generation, consumer_num):
+        """Acknowledge an assignment and wait for gained partitions to be released
+
+        Must be called once the consumer has stopped consuming partitions
+        that are no longer assigned to it.
+        """
+        redis = get_redis_connection()
+        ack_key = self._ack_key(generation)
+        redis.sadd(ack_key, consumer_num)
+        redis.expire(ack_key, ACK_EXPIRY)
+
+        assignment = self.get_assignment()
+        if assignment is None or assignment.generation != generation:
+            return
+        owners = assignment.get_previous_owners(consumer_num)
+        deadline = time.monotonic() + HANDOFF_TIMEOUT
+        while owners:
+            owners -= {int(num) for num in redis.smembers(ack_key)}
+            if not owners:
+                break
+            if time.monotonic() > deadline:
+                logger.warning(
+                    "[%s %s] Partitions not released by %s, consuming them anyway",
+                    self.checkpoint_id, consumer_num, sorted(owners))
+                break
+            time.sleep(1)
+
+    def rebalance_due(self):
+        """Check whether ``rebalance_interval`` has passed since the last rebalance"""
+        return time.monotonic() >= self._next_rebalance
+
+    def rebalance(self, topic_partitions, end_offsets, num_consumers):
+        """Publish a new assignment if it reduces the load of the busiest consumer
+
+        Does nothing unless ``rebalance_interval`` has passed since the
+        last time it ran.
+
+        :param topic_partitions: sorted list of all partitions.
+        :param end_offsets: dict of latest offsets by partition.
+        :returns: The new assignment or ``None``.
+        """
+        if not self.rebalance_due():
+            return None
+        now = time.monotonic()
+        elapsed = now - self._next_rebalance + self.rebalance_interval
+        self._next_rebalance = now + self.rebalance_interval
+        last_end_offsets, self._last_end_offsets = self._last_end_offsets, end_offsets
+        if last_end_offsets is None:
+            # the publish rate is not known yet
+            return None
+
+        loads = self._get_loads(topic_partitions, end_offsets, last_end_offsets, elapsed)
+        assignment = self.get_assignment()
+        if assignment is None or not assignment.is_valid_for(topic_partitions, num_consumers):
+            current = static_assignment(topic_partitions, num_consumers)
+        else:
+            current = assignment.partitions
+        new = assign_partitions(loads, num_consumers, current)
+        if new == current or max_load(new, loads) > max_load(current, loads) * (1 - MIN_IMPROVEMENT):
+            return None
+
+        redis = get_redis_connection()
+        generation = redis.incr(self.generation_key)
+        # acknowledgements of an earlier assignment with the same generation,
+        # which is only possible if the generation counter was evicted
+        redis.delete(self._ack_key(generation))
+        new_assignment = Assignment(generation, new, previous=current)
+        redis.set(self.key, new_assignment.to_json())
+        metrics_counter('commcare.change_feed.partitions_reassigned', tags={'checkpoint_id': self.checkpoint_id})
+        logger.info("[%s] Reassigned partitions: %s", self.checkpoint_id, new)
+        return new_assignment
+
+    def _get_loads(self, topic_partitions, end_offsets, last_end_offsets, elapsed):
+        """Estimate the changes each partition has to process before the next rebalance
+
+        This is the lag of the partition plus the changes expected to be
+        published to it at its current rate.
+        """
+        checkpoint_offsets = {
+            TopicPartition(topic, partition): offset
+            for topic, partition, offset in KafkaCheckpoint.objects.filter(
+                checkpoint_id=self.checkpoint_id,
+            ).values_list('topic', 'partition', 'offset')
+        }
+        loads = {}
+        for tp in topic_partitions:
+            end = end_offsets.get(tp, 0)
+            lag = max(0, end - checkpoint_offsets.get(tp, end))
+            rate = max(0, end - last_end_offsets.get(tp, end)) / elapsed if elapsed > 0 else 0
+            loads[tp] = lag + rate * self.rebalance_interval
+        return loads
@@ -1,5 +1,8 @@
 
 
+from pillowtop.exceptions import PillowtopCheckpointReset
+
+
 class UnknownDocumentStore(ValueError):
     pass
 
@@ -10,3 +13,7 @@ class MissingMetaInformationError(Exception):
 
 class UnavailableKafkaOffset(Exception):
     pass
+
+
+class PartitionsReassigned(PillowtopCheckpointReset):
+    """Raised to restart a pillow from its checkpoint after its partitions changed"""
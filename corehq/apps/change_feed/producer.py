@@ -1,6 +1,8 @@
 import json
 import logging
+import threading
 import uuid
+from contextlib import contextmanager
 from functools import partial
 
 from django.conf import settings
@@ -20,6 +22,7 @@ class ChangeProducer(object):
     def __init__(self, auto_flush=True):
         self.auto_flush = auto_flush
         self._producer = None
+        self._local = threading.local()
 
     @property
     def producer(self):
@@ -40,20 +43,45 @@ class ChangeProducer(object):
         message = change_meta.to_json()
         message_json_dump = json.dumps(message).encode('utf-8')
         change_meta._transaction_id = uuid.uuid4().hex
+        batch = getattr(self._local, 'batch', None)
         try:
             future = self.producer.send(topic, message_json_dump, key=change_meta.document_id)
-            if self.auto_flush:
+            if self.auto_flush and batch is None:
                 future.get()
         except Exception as e:
             raise KafkaPublishingError(e)
 
-        if not self.auto_flush:
+        if batch is not None:
+            batch.append(future)
+        elif not self.auto_flush:
             on_error = partial(_on_error, change_meta)
             future.add_errback(on_error)
 
     def flush(self, timeout=None):
         self.producer.flush(timeout=timeout)
 
+    @contextmanager
+    def batch(self):
+        """Send changes without waiting for each one to be acknowledged
+
+        All changes sent in the block are flushed together on exit, which
+        raises ``KafkaPublishingError`` if any of them failed. Nested
+        blocks join the outermost batch.
+        """
+        if getattr(self._local, 'batch', None) is not None:
+            yield
+            return
+        self._local.batch = futures = []
+        try:
+            yield
+        finally:
+            self._local.batch = None
+            if futures:
+                self.flush()
+        errors = [future.exception for future in futures if future.failed()]
+        if errors:
+            raise KafkaPublishingError(errors[0])
+
 
 def _on_error(change_meta, exc_info):
     notify_exception(
@@ -0,0 +1,149 @@
+import uuid
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase, TestCase
+from django_redis import get_redis_connection
+from kafka import TopicPartition
+
+from pillowtop.models import KafkaCheckpoint
+
+from corehq.apps.change_feed.consumer.feed import KafkaChangeFeed
+from corehq.apps.change_feed.consumer.partitions import (
+    Assignment,
+    PartitionCoordinator,
+    assign_partitions,
+    static_assignment,
+)
+from corehq.apps.change_feed.exceptions import PartitionsReassigned
+
+TOPIC = 'case-sql'
+TPS = [TopicPartition(TOPIC, num) for num in range(4)]
+
+
+class AssignPartitionsTest(SimpleTestCase):
+
+    def test_balances_load(self):
+        loads = {TPS[0]: 100, TPS[1]: 10, TPS[2]: 10, TPS[3]: 10}
+        self.assertEqual(assign_partitions(loads, 2), [[TPS[0]], TPS[1:]])
+
+    def test_keeps_current_consumer_for_equal_loads(self):
+        loads = {tp: 10 for tp in TPS}
+        current = [[TPS[1], TPS[3]], [TPS[0], TPS[2]]]
+        self.assertEqual(assign_partitions(loads, 2, current), current)
+
+    def test_every_consumer_gets_a_partition(self):
+        loads = {TPS[0]: 100, TPS[1]: 0, TPS[2]: 0, TPS[3]: 0}
+        self.assertTrue(all(assign_partitions(loads, 4)))
+
+    def test_previous_owners(self):
+        assignment = Assignment(2, [[TPS[0]], TPS[1:]], previous=static_assignment(TPS, 2))
+        self.assertEqual(assignment.get_previous_owners(0), set())
+        self.assertEqual(assignment.get_previous_owners(1), {0})
+
+    def test_json(self):
+        assignment = Assignment(2, [[TPS[0]], TPS[1:]], previous=static_assignment(TPS, 2))
+        copy = Assignment.from_json(assignment.to_json())
+        self.assertEqual(
+            (copy.generation, copy.partitions, copy.previous),
+            (assignment.generation, assignment.partitions, assignment.previous),
+        )
+
+
+class PartitionCoordinatorTest(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.coordinator = PartitionCoordinator(uuid.uuid4().hex, rebalance_interval=0)
+        self.addCleanup(get_redis_connection().delete, self.coordinator.key, self.coordinator.generation_key)
+        for tp in TPS:
+            KafkaCheckpoint.objects.create(
+                checkpoint_id=self.coordinator.checkpoint_id,
+                topic=tp.topic, partition=tp.partition, offset=100,
+            )
+
+    def test_static_assignment_by_default(self):
+        self.assertEqual(self.coordinator.get_partitions(TPS, 1, 2), (None, [TPS[1], TPS[3]]))
+
+    def test_rebalance_lagging_partition(self):
+        self.assertIsNone(self.coordinator.rebalance(TPS, self._end_offsets(), 2))
+        end_offsets = self._end_offsets({TPS[0]: 10000, TPS[2]: 10000})
+        assignment = self.coordinator.rebalance(TPS, end_offsets, 2)
+        self.assertEqual(assignment.generation, 1)
+        self.assertEqual(self.coordinator.get_partitions(TPS, 0, 2), (1, [TPS[0]]))
+        self.assertEqual(self.coordinator.get_partitions(TPS, 1, 2), (1, TPS[1:]))
+
+    def test_generations_increase_after_eviction(self):
+        redis = get_redis_connection()
+        self.addCleanup(redis.delete, self.coordinator._ack_key(2))
+        self.coordinator.rebalance(TPS, self._end_offsets(), 2)
+        self.coordinator.rebalance(TPS, self._end_offsets({TPS[0]: 10000, TPS[2]: 10000}), 2)
+        redis.delete(self.coordinator.key)
+        redis.sadd(self.coordinator._ack_key(2), 1)
+        assignment = self.coordinator.rebalance(TPS, self._end_offsets({TPS[0]: 20000, TPS[2]: 20000}), 2)
+        self.assertEqual(assignment.generation, 2)
+        self.assertEqual(redis.smembers(self.coordinator._ack_key(2)), set())
+
+    def test_no_rebalance_without_improvement(self):
+        self.coordinator.rebalance(TPS, self._end_offsets(), 2)
+        end_offsets = self._end_offsets({TPS[0]: 1000, TPS[1]: 1000})
+        self.assertIsNone(self.coordinator.rebalance(TPS, end_offsets, 2))
+
+    def test_assignment_for_other_number_of_consumers_is_ignored(self):
+        self.coordinator.rebalance(TPS, self._end_offsets(), 2)
+        self.coordinator.rebalance(TPS, self._end_offsets({TPS[0]: 10000, TPS[2]: 10000}), 2)
+        self.assertEqual(self.coordinator.get_partitions(TPS, 0, 4), (None, [TPS[0]]))
+
+    def test_hand_off_waits_for_previous_owners(self):
+        self.coordinator.rebalance(TPS, self._end_offsets(), 2)
+        self.coordinator.rebalance(TPS, self._end_offsets({TPS[0]: 10000, TPS[2]: 10000}), 2)
+        self.addCleanup(get_redis_connection().delete, self.coordinator._ack_key(1))
+        # consumer 1 gains partition 2 from consumer 0
+        self.coordinator.hand_off(1, 0)
+        with patch('corehq.apps.change_feed.consumer.partitions.time.sleep') as sleep:
+            self.coordinator.hand_off(1, 1)
+        sleep.assert_not_called()
+
+    def _end_offsets(self, offsets=None):
+        return {tp: 100 for tp in TPS} | (offsets or {})
+
+
+class KafkaChangeFeedPartitionsTest(SimpleTestCase):
+
+    def test_filter_partitions_with_coordinator(self):
+        coordinator = PartitionCoordinator('test')
+        feed = KafkaChangeFeed(
+            topics=[TOPIC], client_id='test-kafka-feed', num_processes=3, process_num=2,
+            dedicated_migration_process=True, partition_coordinator=coordinator,
+        )
+        with patch.object(coordinator, 'get_partitions', return_value=(3, [TPS[0]])) as get_partitions:
+            self.assertEqual(feed._filter_partitions(list(TPS)), [TPS[0]])
+        get_partitions.assert_called_once_with(TPS, 1, 2)
+
+    def test_partitions_reassigned(self):
+        coordinator = PartitionCoordinator('test')
+        feed = KafkaChangeFeed(
+            topics=[TOPIC], client_id='test-kafka-feed', num_processes=2, process_num=1,
+            partition_coordinator=coordinator,
+        )
+        with patch.object(coordinator, 'get_partitions', return_value=(None, [TPS[1], TPS[3]])):
+            feed._filter_partitions(list(TPS))
+        with (
+            patch.object(coordinator, 'get_partitions', return_value=(1, TPS[1:])),
+            self.assertRaises(PartitionsReassigned),
+        ):
+            feed._check_partitions()
+
+    def test_end_offsets_only_fetched_when_rebalance_is_due(self):
+        coordinator = PartitionCoordinator('test')
+        feed = KafkaChangeFeed(
+            topics=[TOPIC], client_id='test-kafka-feed', num_processes=2, process_num=0,
+            partition_coordinator=coordinator,
+        )
+        feed._consumer = Mock()
+        with (
+            patch.object(coordinator, 'get_partitions', return_value=(None, [TPS[0], TPS[2]])),
+            patch.object(coordinator, 'rebalance_due', return_value=False),
+        ):
+            feed._filter_partitions(list(TPS))
+            feed._check_partitions()
+        feed._consumer.end_offsets.assert_not_called()
@@ -6,11 +6,13 @@ from casexml.apps.case.mock import CaseFactory
 from corehq.apps.commtrack.helpers import make_product
 from corehq.apps.commtrack.tests.util import get_single_balance_block
 from corehq.apps.hqcase.utils import submit_case_blocks
+from corehq.form_processor.backends.sql.dbaccessors import LedgerAccessorSQL
+from corehq.form_processor.exceptions import LedgerValueNotFound
 from corehq.form_processor.interfaces.dbaccessors import LedgerAccessors
 from corehq.form_processor.interfaces.processor import FormProcessorInterface
 from corehq.form_processor.models import CommCareCase, RebuildWithReason
 from corehq.form_processor.parsers.ledgers.helpers import UniqueLedgerReference
-from corehq.util.test_utils import softer_assert
+from corehq.util.test_utils import flag_enabled, softer_assert
 
 LEDGER_BLOCKS_SIMPLE = """
 <transfer xmlns="http://commcarehq.org/ledger/v1" dest="{case_id}" date="2000-01-02" section-id="stock">
@@ -115,3 +117,28 @@ class RebuildStockStateTest(TestCase):
 
         self._assert_stats(1, edit_quantity, edit_quantity)
         self.assertEqual([form.form_id], case.xform_ids[1:])
+
+
+@flag_enabled('SET_BASED_LEDGER_REBUILD')
+class SetBasedRebuildStockStateTest(RebuildStockStateTest):
+
+    def test_rebuild_ledgers(self):
+        self._submit_ledgers(LEDGER_BLOCKS_INFERRED)
+
+        updated, deleted = LedgerAccessorSQL.rebuild_ledgers([self.unique_reference])
+
+        self.assertEqual(updated, {self.unique_reference})
+        self.assertEqual(deleted, set())
+        self._assert_stats(2, 150, 150)
+        self.assertEqual(LedgerAccessorSQL.rebuild_ledgers([self.unique_reference]), (set(), set()))
+
+    def test_rebuild_ledgers_without_transactions(self):
+        form_id = self._submit_ledgers(LEDGER_BLOCKS_SIMPLE)
+        LedgerAccessorSQL.delete_ledger_transactions_for_form([self.case.case_id], form_id)
+
+        updated, deleted = LedgerAccessorSQL.rebuild_ledgers([self.unique_reference])
+
+        self.assertEqual(updated, set())
+        self.assertEqual(deleted, {self.unique_reference})
+        with self.assertRaises(LedgerValueNotFound):
+            LedgerAccessorSQL.get_ledger_value(**self.unique_reference._asdict())
@@ -13,7 +13,6 @@ from corehq.apps.receiverwrapper.auth import AuthContext
 from corehq.apps.users.dbaccessors import get_all_commcare_users_by_domain
 from corehq.apps.users.models import WebUser
 from corehq.form_processor.submission_post import SubmissionPost
-from corehq.form_processor.utils import convert_xform_to_json
 
 
 class Command(BaseCommand):
@@ -60,11 +59,9 @@ class Command(BaseCommand):
     def create_fake_data(self, domain, web_user, data_cleaning_fake_users, fake_app):
         fake_data = get_plant_case_data_with_issues(data_cleaning_fake_users)
         instance = bytes(self.get_form_data(fake_data), 'utf-8')
-        instance_json = convert_xform_to_json(instance)
 
         submission_post = SubmissionPost(
             instance=instance,
-            instance_json=instance_json,
             attachments={},
             domain=domain,
             app_id=fake_app.get_id,
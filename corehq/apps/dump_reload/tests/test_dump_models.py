@@ -71,6 +71,7 @@ IGNORE_MODELS = {
     "experiments.ExperimentEnabler",
     "export.DefaultExportSettings",     # tied to an account, not a domain
     "export.EmailExportWhenDoneRequest",  # transient model tied to an export task
+    "form_processor.CaseSnapshot",  # derived from case transactions, recreated by rebuilds
     "form_processor.DeprecatedXFormAttachmentSQL",
     "hqadmin.HistoricalPillowCheckpoint",
     "hqadmin.HqDeploy",
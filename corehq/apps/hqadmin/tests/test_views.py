@@ -13,7 +13,11 @@ from corehq import privileges
 from corehq.apps.accounting.utils import is_accounting_admin
 from corehq.apps.app_manager.tests.util import TestXmlMixin
 from corehq.apps.domain.shortcuts import create_domain
-from corehq.apps.hqadmin.views.users import AdminRestoreView, DisableUserView
+from corehq.apps.hqadmin.views.users import (
+    AdminRestoreView,
+    DisableUserView,
+    RestoreProfilesView,
+)
 from corehq.apps.users.models import WebUser
 from corehq.toggles import TAG_RELEASE, TAG_GA_PATH
 from corehq.toggles.sql_models import ToggleEditPermission
@@ -76,6 +80,24 @@ class AdminRestoreViewTests(TestXmlMixin, SimpleTestCase):
         })
 
 
+class RestoreProfilesViewTests(SimpleTestCase):
+
+    def test_get_timing_rows(self):
+        timer_dict = {
+            'name': 'restore', 'duration': 2.0, 'percent_total': 100.0, 'percent_parent': None,
+            'subs': [{
+                'name': 'CasePayloadProvider', 'duration': 1.0, 'percent_total': 50.0,
+                'percent_parent': 50.0, 'counts': {'items': 3, 'bytes': 100}, 'subs': [],
+            }],
+        }
+        self.assertEqual(RestoreProfilesView.get_timing_rows(timer_dict), [
+            {'id': 0, 'parent_id': None, 'name': 'restore', 'duration': 2.0,
+             'percent_parent': 100, 'percent_total': 100.0, 'counts': []},
+            {'id': 1, 'parent_id': 0, 'name': 'CasePayloadProvider', 'duration': 1.0,
+             'percent_parent': 50.0, 'percent_total': 50.0, 'counts': [('bytes', 100), ('items', 3)]},
+        ])
+
+
 class DisableUserViewTests(SimpleTestCase):
 
     def test_redirect_url_username_is_encoded(self):
@@ -26,6 +26,7 @@ from corehq.apps.hqadmin.views.users import (
     DisableUserView,
     SuperuserManagement,
     OffboardingUserList,
+    RestoreProfilesView,
     WebUserDataView,
     email_status,
     offboard_staff_user,
@@ -54,6 +55,7 @@ urlpatterns = [
     url(r'^create_tombstone/$', create_tombstone, name='create_tombstone'),
     url(r'^phone/restore/$', AdminRestoreView.as_view(), name="admin_restore"),
     url(r'^phone/restore/(?P<app_id>[\w-]+)/$', AdminRestoreView.as_view(), name='app_aware_admin_restore'),
+    url(r'^phone/restore_profiles/$', RestoreProfilesView.as_view(), name=RestoreProfilesView.urlname),
     url(r'^app_build_timings/$', AppBuildTimingsView.as_view(), name="app_build_timings"),
     url(r'^do_pillow_op/$', pillow_operation_api, name="pillow_operation_api"),
     url(r'^web_user_lookup/$', web_user_lookup, name='web_user_lookup'),
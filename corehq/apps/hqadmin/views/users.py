@@ -33,6 +33,7 @@ from lxml import etree
 from lxml.builder import E
 from two_factor.utils import default_device
 
+from casexml.apps.phone.restore_caching import RestoreProfileCache
 from casexml.apps.phone.xml import SYNC_XMLNS
 from casexml.apps.stock.const import COMMTRACK_REPORT_XMLNS
 from couchexport.models import Format
@@ -71,7 +72,7 @@ from corehq.toggles import ALL_TAGS, IS_CONTRACTOR
 from corehq.toggles.sql_models import ToggleEditPermission
 from corehq.util import reverse
 from corehq.util.bounced_email_utils import get_email_statuses
-from corehq.util.timer import TimingContext
+from corehq.util.timer import TimingContext, timing_dict_to_folded_stacks
 
 
 class UserAdministration(BaseAdminSectionView):
@@ -488,6 +489,82 @@ class AdminRestoreView(TemplateView):
         return context
 
 
+class RestoreProfilesView(TemplateView):
+    """Timing profiles saved for a user's recent restores
+
+    See ``RestoreConfig._should_save_profile`` for which restores are
+    profiled.
+    """
+    urlname = 'restore_profiles'
+    template_name = 'hqadmin/restore_profiles.html'
+
+    @method_decorator(require_superuser)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        self.domain = request.GET.get('domain', '')
+        username = request.GET.get('username', '')
+        if not self.domain or not username:
+            return HttpResponseBadRequest('Please specify a user using ?domain=domain&username=username')
+        full_username = username if '@' in username else format_username(username, self.domain)
+        self.user = CouchUser.get_by_username(full_username)
+        if not self.user:
+            return HttpResponseNotFound('User %s not found.' % full_username)
+
+        self.profiles = RestoreProfileCache(self.domain, self.user.user_id).get_value()
+        try:
+            self.selected = int(request.GET.get('profile', 0))
+        except ValueError:
+            self.selected = 0
+
+        if request.GET.get('format') == 'folded':
+            if not 0 <= self.selected < len(self.profiles):
+                raise Http404()
+            response = HttpResponse(
+                timing_dict_to_folded_stacks(self.profiles[self.selected]['timing']),
+                content_type='text/plain',
+            )
+            response['Content-Disposition'] = 'attachment; filename={}-restore-{}.folded'.format(
+                self.user.raw_username, self.selected)
+            return response
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'domain': self.domain,
+            'username': self.user.username,
+            'profiles': self.profiles,
+            'selected': self.selected,
+        })
+        if 0 <= self.selected < len(self.profiles):
+            context['timing_rows'] = self.get_timing_rows(self.profiles[self.selected]['timing'])
+        return context
+
+    @staticmethod
+    def get_timing_rows(timer_dict):
+        """Flatten a ``TimingContext.to_dict()`` tree into table rows in hierarchy order"""
+        rows = []
+
+        def visit(timer, parent_id):
+            row_id = len(rows)
+            rows.append({
+                'id': row_id,
+                'parent_id': parent_id,
+                'name': timer['name'],
+                'duration': timer['duration'] or 0,
+                'percent_parent': timer.get('percent_parent') or 100,
+                'percent_total': timer.get('percent_total') or 0,
+                'counts': sorted(timer.get('counts', {}).items()),
+            })
+            for sub in timer['subs']:
+                visit(sub, row_id)
+
+        visit(timer_dict, None)
+        return rows
+
+
 class DomainAdminRestoreView(AdminRestoreView):
     urlname = 'domain_admin_restore'
 
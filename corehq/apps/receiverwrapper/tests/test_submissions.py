@@ -20,7 +20,7 @@ from corehq.apps.users.models import CommCareUser
 from corehq.form_processor.models import CommCareCase, XFormInstance
 from corehq.form_processor.tests.utils import FormProcessorTestUtils, sharded
 from corehq.util.json import CommCareJSONEncoder
-from corehq.util.test_utils import TestFileMixin, softer_assert
+from corehq.util.test_utils import TestFileMixin, flag_enabled, softer_assert
 
 from couchforms.exceptions import (
     InvalidAttachmentFileError,
@@ -247,6 +247,49 @@ class SubmissionTest(BaseSubmissionTest):
         self.assertEqual(len(form.get_attachments()), 3)
 
 
+@sharded
+class BatchSubmissionTest(BaseSubmissionTest):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("receiver_batch_post", args=[self.domain])
+
+    def _submit_batch(self, *formnames, **data):
+        files = [open(os.path.join(os.path.dirname(__file__), "data", name), "rb") for name in formnames]
+        try:
+            return self.client.post(self.url, {"xml_submission_file": files, **data})
+        finally:
+            for f in files:
+                f.close()
+
+    @flag_enabled('BATCH_FORM_SUBMISSIONS')
+    def test_submit_batch(self):
+        response = self._submit_batch('simple_form.xml', 'form_with_case.xml')
+        self.assertEqual(response.status_code, 200)
+        batch = response.json()
+        self.assertEqual((batch['total'], batch['processed']), (2, 2))
+        self.assertEqual([r['status_code'] for r in batch['results']], [201, 201])
+        self.assertEqual([r['submission_type'] for r in batch['results']], ['normal', 'normal'])
+        form_ids = [r['form_id'] for r in batch['results']]
+        forms = XFormInstance.objects.get_forms(form_ids, self.domain.name)
+        self.assertEqual({form.form_id for form in forms}, set(form_ids))
+
+    @flag_enabled('BATCH_FORM_SUBMISSIONS')
+    def test_submit_batch_with_duplicate(self):
+        response = self._submit_batch('simple_form.xml', 'simple_form.xml')
+        batch = response.json()
+        self.assertEqual([r['submission_type'] for r in batch['results']], ['normal', 'duplicate'])
+
+    @flag_enabled('BATCH_FORM_SUBMISSIONS')
+    def test_submit_batch_with_attachment(self):
+        response = self._submit_batch('simple_form.xml', file=BytesIO(b"a"))
+        self.assertEqual(response.status_code, 422)
+
+    def test_submit_batch_not_enabled(self):
+        response = self._submit_batch('simple_form.xml')
+        self.assertEqual(response.status_code, 404)
+
+
 @patch('corehq.apps.receiverwrapper.views.domain_requires_auth', return_value=True)
 class NoAuthSubmissionTest(BaseSubmissionTest):
     def setUp(self):
@@ -2,7 +2,13 @@ import os
 import logging
 from contextlib import nullcontext
 
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotFound,
+    JsonResponse,
+)
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
@@ -28,6 +34,7 @@ from dimagi.utils.decorators.profile import profile_dump
 from dimagi.utils.logging import notify_exception
 
 from corehq import toggles
+from corehq.apps.change_feed.producer import producer
 from corehq.apps.domain.auth import (
     BASIC,
     DIGEST,
@@ -61,9 +68,11 @@ from corehq.apps.receiverwrapper.util import (
     should_ignore_submission,
 )
 from corehq.apps.users.models import CouchUser
-from corehq.form_processor.exceptions import XFormLockError
+from corehq.form_processor.exceptions import KafkaPublishingError, XFormLockError
 from corehq.form_processor.models import CommCareCase
+from corehq.form_processor.parsers.form import stream_xform
 from corehq.form_processor.submission_post import SubmissionPost
+from corehq.form_processor.submission_process_tracker import defer_submission_completion
 from corehq.form_processor.utils.xform import convert_xform_to_json, extract_meta_instance_id
 from corehq.util.metrics import metrics_counter, metrics_histogram
 from corehq.util.timer import TimingContext, set_request_duration_reporting_threshold
@@ -74,6 +83,10 @@ PROFILE_PROBABILITY = float(os.getenv('COMMCARE_PROFILE_SUBMISSION_PROBABILITY',
 PROFILE_LIMIT = os.getenv('COMMCARE_PROFILE_SUBMISSION_LIMIT')
 PROFILE_LIMIT = int(PROFILE_LIMIT) if PROFILE_LIMIT is not None else 1
 
+# a batch submission stops at the first form with one of these responses,
+# which the device must submit again
+BATCH_RETRY_STATUS_CODES = {406, 423, 429}
+
 
 # This mirrors the logic of require_mobile_access
 def _has_mobile_access(domain, user_id, request):
@@ -134,25 +147,20 @@ def _process_form(request, domain, app_id, user_id, authenticated,
         _record_metrics(metric_tags, 'blacklisted', response)
         return response
 
-    instance_json = None
+    streamed_form = None
     try:
-        instance_json = convert_xform_to_json(instance)
+        streamed_form = stream_xform(instance)
     except couchforms.XMLSyntaxError:
         # let normal response handle invalid xml
         pass
     else:
-        meta = instance_json.get('meta', {})
-        device_id = meta.get('deviceID')
-        submitting_user_id = meta.get('userID')
-        submitting_user = CouchUser.get_by_user_id(submitting_user_id) if submitting_user_id else None
-        should_limit = device_rate_limiter.rate_limit_device(domain, submitting_user, device_id)
-        if should_limit:
+        if _is_device_rate_limited(domain, streamed_form.head):
             return HttpNotAcceptable(DEVICE_RATE_LIMIT_MESSAGE)
 
     couch_user = getattr(request, 'couch_user', None)
-    is_public = isinstance(couch_user, PublicFormUser) and instance_json is not None
+    is_public = isinstance(couch_user, PublicFormUser) and streamed_form is not None
     if is_public:
-        error = validate_public_form_submission(couch_user.session, instance_json)
+        error = validate_public_form_submission(couch_user.session, streamed_form.form_json)
         if error is not None:
             metrics_counter(
                 'commcare.public_form.rejected_submission',
@@ -178,27 +186,10 @@ def _process_form(request, domain, app_id, user_id, authenticated,
 
         with TimingContext() as timer:
             app_id, build_id = get_app_and_build_ids(domain, app_id)
-            submission_post = SubmissionPost(
-                instance=instance,
-                instance_json=instance_json,
-                attachments=attachments,
-                domain=domain,
-                app_id=app_id,
-                build_id=build_id,
-                auth_context=auth_cls(
-                    domain=domain,
-                    user_id=user_id,
-                    authenticated=authenticated,
-                ),
-                location=couchforms.get_location(request),
-                received_on=couchforms.get_received_on(request),
-                date_header=couchforms.get_date_header(request),
-                path=couchforms.get_path(request),
-                submit_ip=couchforms.get_submit_ip(request),
-                last_sync_token=couchforms.get_last_sync_token(request),
-                openrosa_headers=couchforms.get_openrosa_headers(request),
-                force_logs=request.GET.get('force_logs', 'false') == 'true',
-                timing_context=timer
+            submission_post = _get_submission_post(
+                request, instance, streamed_form, attachments, domain, app_id, build_id,
+                auth_cls(domain=domain, user_id=user_id, authenticated=authenticated),
+                timer,
             )
             try:
                 result = submission_post.run()
@@ -207,7 +198,7 @@ def _process_form(request, domain, app_id, user_id, authenticated,
                 metrics_counter('commcare.xformlocked.count', tags={
                     'domain': domain, 'authenticated': authenticated
                 })
-                locked_form_id = extract_meta_instance_id(instance_json) if instance_json else None
+                locked_form_id = extract_meta_instance_id(streamed_form.head) if streamed_form else None
                 return _submission_error(
                     request, "XFormLockError: %s" % locked_form_id,
                     metric_tags, domain, app_id, user_id, authenticated, status=423,
@@ -225,6 +216,158 @@ def _process_form(request, domain, app_id, user_id, authenticated,
     return response
 
 
+def _process_form_batch(request, domain, app_id, user_id, authenticated,
+                        auth_cls=AuthContext, is_api=False):
+    """Process a batch of forms submitted in one request
+
+    Forms are processed in order, each one as if it had been submitted on
+    its own, and changes are published to Kafka in one flush at the end.
+    Processing stops at the first form that the device must submit again
+    so that later forms are never processed before the forms they depend
+    on. The response lists the result of each processed form.
+    """
+    if not toggles.BATCH_FORM_SUBMISSIONS.enabled(domain, namespace=toggles.NAMESPACE_DOMAIN):
+        return HttpResponseNotFound()
+
+    if authenticated and not is_api and not _has_mobile_access(domain, user_id, request):
+        return HttpResponseForbidden()
+
+    if rate_limit_submission(domain):
+        return HttpTooManyRequests()
+
+    metric_tags = {
+        'backend': 'sql',
+        'domain': domain
+    }
+
+    try:
+        instances = couchforms.get_batch_instances(request)
+    except MultimediaBug:
+        return _submission_error(
+            request, "Received a batch submission with POST.keys()", metric_tags,
+            domain, app_id, user_id, authenticated,
+        )
+    except UnprocessableFormSubmission as e:
+        return openrosa_response.OpenRosaResponse(
+            message=e.message, nature=openrosa_response.ResponseNature.PROCESSING_FAILURE, status=e.status_code,
+        ).response()
+    except BadSubmissionRequest as e:
+        response = HttpResponse(e.message, status=e.status_code)
+        _record_metrics(metric_tags, 'known_failures', response)
+        return response
+
+    if should_ignore_submission(request):
+        response = openrosa_response.SUBMISSION_IGNORED_RESPONSE
+        _record_metrics(metric_tags, 'ignored', response)
+        return response
+
+    if toggles.FORM_SUBMISSION_BLACKLIST.enabled(domain):
+        response = openrosa_response.BLACKLISTED_RESPONSE
+        _record_metrics(metric_tags, 'blacklisted', response)
+        return response
+
+    app_id, build_id = get_app_and_build_ids(domain, app_id)
+    results = []
+    try:
+        with defer_submission_completion(), producer.batch():
+            for instance in instances:
+                with TimingContext() as timer:
+                    response, submission_type, xform = _process_batch_form(
+                        request, instance, domain, app_id, build_id,
+                        auth_cls(domain=domain, user_id=user_id, authenticated=authenticated),
+                        timer,
+                    )
+                _record_metrics(dict(metric_tags), submission_type, response, timer, xform)
+                results.append({
+                    'form_id': response.get('X-CommCareHQ-FormID'),
+                    'status_code': response.status_code,
+                    'submission_type': submission_type,
+                    'response': response.content.decode('utf-8'),
+                })
+                if response.status_code >= 500 or response.status_code in BATCH_RETRY_STATUS_CODES:
+                    break
+    except KafkaPublishingError:
+        # the forms are saved and their submission stubs are kept, so the
+        # reprocessing queue will publish their changes
+        notify_exception(request, "Error publishing changes of batch submission", [
+            "domain:{}".format(domain),
+            "forms:{}".format(len(results)),
+        ])
+
+    metrics_histogram(
+        'commcare.xform_submissions.batch_size', len(instances),
+        bucket_tag='size', buckets=(1, 10, 50, 100, 300),
+        tags={'domain': domain},
+    )
+    return JsonResponse({'total': len(instances), 'processed': len(results), 'results': results})
+
+
+def _process_batch_form(request, instance, domain, app_id, build_id, auth_context, timer):
+    """Process one form of a batch submission
+
+    :returns: Tuple ``(response, submission_type, xform)``.
+    """
+    streamed_form = None
+    try:
+        streamed_form = stream_xform(instance)
+    except couchforms.XMLSyntaxError:
+        # let normal response handle invalid xml
+        pass
+    else:
+        if _is_device_rate_limited(domain, streamed_form.head):
+            return HttpNotAcceptable(DEVICE_RATE_LIMIT_MESSAGE), 'known_failures', None
+
+    submission_post = _get_submission_post(
+        request, instance, streamed_form, {}, domain, app_id, build_id, auth_context, timer)
+    try:
+        result = submission_post.run()
+    except XFormLockError as err:
+        logging.warning('Unable to get lock for form %s', err)
+        metrics_counter('commcare.xformlocked.count', tags={
+            'domain': domain, 'authenticated': auth_context.authenticated
+        })
+        locked_form_id = extract_meta_instance_id(streamed_form.head) if streamed_form else None
+        response = HttpResponse("XFormLockError: %s" % locked_form_id, status=423, content_type="text/plain")
+        return response, 'error', None
+    except Exception:
+        notify_exception(request, "Error processing form of batch submission", [
+            "domain:{}".format(domain),
+        ])
+        response = HttpResponse("Error processing form", status=500, content_type="text/plain")
+        return response, 'error', None
+    return result.response, result.submission_type, result.xform
+
+
+def _get_submission_post(request, instance, streamed_form, attachments,
+                         domain, app_id, build_id, auth_context, timer):
+    return SubmissionPost(
+        instance=instance,
+        streamed_form=streamed_form,
+        attachments=attachments,
+        domain=domain,
+        app_id=app_id,
+        build_id=build_id,
+        auth_context=auth_context,
+        location=couchforms.get_location(request),
+        received_on=couchforms.get_received_on(request),
+        date_header=couchforms.get_date_header(request),
+        path=couchforms.get_path(request),
+        submit_ip=couchforms.get_submit_ip(request),
+        last_sync_token=couchforms.get_last_sync_token(request),
+        openrosa_headers=couchforms.get_openrosa_headers(request),
+        force_logs=request.GET.get('force_logs', 'false') == 'true',
+        timing_context=timer
+    )
+
+
+def _is_device_rate_limited(domain, instance_json):
+    meta = instance_json.get('meta', {})
+    device_id = meta.get('deviceID')
+    submitting_user_id = meta.get('userID')
+    submitting_user = CouchUser.get_by_user_id(submitting_user_id) if submitting_user_id else None
+    return device_rate_limiter.rate_limit_device(domain, submitting_user, device_id)
+
+
 def _submission_error(request, message, metric_tags,
         domain, app_id, user_id, authenticated, meta=None, status=400,
         notify=True):
@@ -392,9 +535,9 @@ def _noauth_post(request, domain, app_id=None):
 @login_or_digest_ex(allow_cc_users=True)
 @two_factor_exempt
 @set_request_duration_reporting_threshold(60)
-def _secure_post_digest(request, domain, app_id=None):
+def _secure_post_digest(request, domain, app_id=None, process=_process_form):
     """only ever called from secure post"""
-    return _process_form(
+    return process(
         request=request,
         domain=domain,
         app_id=app_id,
@@ -407,9 +550,9 @@ def _secure_post_digest(request, domain, app_id=None):
 @login_or_basic_or_api_key_ex(allow_cc_users=True)
 @two_factor_exempt
 @set_request_duration_reporting_threshold(60)
-def _secure_post_basic(request, domain, app_id=None):
+def _secure_post_basic(request, domain, app_id=None, process=_process_form):
     """only ever called from secure post"""
-    return _process_form(
+    return process(
         request=request,
         domain=domain,
         app_id=app_id,
@@ -422,9 +565,9 @@ def _secure_post_basic(request, domain, app_id=None):
 @login_or_oauth2_ex(allow_cc_users=True, oauth_scopes=['sync'])
 @two_factor_exempt
 @set_request_duration_reporting_threshold(60)
-def _secure_post_oauth2(request, domain, app_id=None):
+def _secure_post_oauth2(request, domain, app_id=None, process=_process_form):
     """only ever called from secure post"""
-    return _process_form(
+    return process(
         request=request,
         domain=domain,
         app_id=app_id,
@@ -437,9 +580,9 @@ def _secure_post_oauth2(request, domain, app_id=None):
 @require_permission(HqPermissions.edit_data)
 @require_permission(HqPermissions.access_api)
 @set_request_duration_reporting_threshold(60)
-def _secure_post_api_key(request, domain, app_id=None):
+def _secure_post_api_key(request, domain, app_id=None, process=_process_form):
     """only ever called from secure post"""
-    return _process_form(
+    return process(
         request=request,
         domain=domain,
         app_id=app_id,
@@ -462,7 +605,27 @@ def secure_post(request, domain, app_id=None):
         API_KEY: _secure_post_api_key,
         OAUTH2: _secure_post_oauth2,
     }
+    return _dispatch_secure_post(request, domain, app_id, authtype_map)
+
+
+@waf_allow('XSS_BODY')
+@location_safe
+@csrf_exempt
+@require_POST
+@check_domain_mobile_access
+@set_request_duration_reporting_threshold(300)
+def secure_post_batch(request, domain, app_id=None):
+    """Submit several forms in one request. See ``_process_form_batch``"""
+    authtype_map = {
+        DIGEST: _secure_post_digest,
+        BASIC: _secure_post_basic,
+        API_KEY: _secure_post_api_key,
+        OAUTH2: _secure_post_oauth2,
+    }
+    return _dispatch_secure_post(request, domain, app_id, authtype_map, process=_process_form_batch)
+
 
+def _dispatch_secure_post(request, domain, app_id, authtype_map, **kwargs):
     if request.GET.get('authtype'):
         authtype = request.GET['authtype']
     else:
@@ -475,4 +638,4 @@ def secure_post(request, domain, app_id=None):
             'authtype must be one of: {0}'.format(','.join(authtype_map))
         )
 
-    return decorated_view(request, domain, app_id=app_id)
+    return decorated_view(request, domain, app_id=app_id, **kwargs)
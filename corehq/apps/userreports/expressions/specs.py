@@ -11,6 +11,7 @@ from dimagi.ext.jsonobject import (
     ListProperty,
     StringProperty,
 )
+from pillowtop.chunk_documents import get_chunk_document
 from pillowtop.dao.exceptions import DocumentNotFoundError
 
 from corehq.apps.change_feed.data_sources import (
@@ -714,12 +715,15 @@ def _get_user(domain, doc_id):
 
 
 def _get_doc(domain, doc_type, doc_id):
-    document_store = get_document_store_for_doc_type(
-        domain, doc_type, load_source="related_doc_expression")
-    try:
-        doc = document_store.get_document(doc_id)
-    except DocumentNotFoundError:
-        return None
+    # documents already loaded by the pillow for the chunk being processed
+    doc = get_chunk_document(doc_type, doc_id)
+    if doc is None:
+        document_store = get_document_store_for_doc_type(
+            domain, doc_type, load_source="related_doc_expression")
+        try:
+            doc = document_store.get_document(doc_id)
+        except DocumentNotFoundError:
+            return None
     if domain != doc.get('domain'):
         return None
     return doc
@@ -1,5 +1,6 @@
 import uuid
 from datetime import datetime, timedelta
+from unittest.mock import patch
 
 from django.test import TestCase
 
@@ -9,8 +10,9 @@ from casexml.apps.case.tests.util import delete_all_cases
 from casexml.apps.case.util import primary_actions
 from corehq.apps.change_feed import topics
 from corehq.apps.hqcase.utils import submit_case_blocks
-from corehq.form_processor.models import CommCareCase, RebuildWithReason, XFormInstance
+from corehq.form_processor.models import CaseSnapshot, CommCareCase, RebuildWithReason, XFormInstance
 from corehq.form_processor.tests.utils import sharded
+from corehq.util.test_utils import flag_enabled
 from testapps.test_pillowtop.utils import capture_kafka_changes_context
 
 REBUILD_TEST_DOMAIN = 'rebuild-test'
@@ -261,3 +263,52 @@ class CaseRebuildTest(TestCase):
 
         case = CommCareCase.objects.get_case(child_case_id, 'test-domain')
         self.assertEqual(0, len(case.indices))
+
+
+@sharded
+@flag_enabled('CASE_REBUILD_SNAPSHOTS')
+@patch('corehq.form_processor.backends.sql.update_strategy.CASE_SNAPSHOT_INTERVAL', 2)
+class CaseRebuildSnapshotTest(TestCase):
+
+    def test_rebuild_resumes_from_snapshot(self):
+        now = datetime.utcnow()
+        parent_id = _post_util(create=True, submission_extras={'received_on': now})
+        case_id = _post_util(create=True, p1='1', submission_extras={'received_on': now})
+        submit_case_blocks([
+            CaseBlock(case_id, index={'mom': ('mother', parent_id)}, update={'p2': '2'}).as_text()
+        ], REBUILD_TEST_DOMAIN, submission_extras={'received_on': now + timedelta(seconds=1)})
+        _post_util(case_id=case_id, p3='3', submission_extras={'received_on': now + timedelta(seconds=2)})
+        _post_util(case_id=case_id, p4='4', submission_extras={'received_on': now + timedelta(seconds=3)})
+        _post_util(case_id=case_id, p1='5', close=True,
+                   submission_extras={'received_on': now + timedelta(seconds=4)})
+        rebuild_case_from_forms(REBUILD_TEST_DOMAIN, case_id, RebuildWithReason(reason='test'))
+        self.assertEqual(self._snapshot_counts(case_id), [2, 4])
+
+        [f1, f2, f3, f4, f5] = CommCareCase.objects.get_case(case_id, REBUILD_TEST_DOMAIN).xform_ids
+        with patch('corehq.form_processor.backends.sql.update_strategy.form_load_counter') as counter:
+            XFormInstance.objects.get_form(f5).archive()
+        counter.return_value.assert_called_once_with(0)
+        case = CommCareCase.objects.get_case(case_id, REBUILD_TEST_DOMAIN)
+        self.assertFalse(case.closed)
+        self.assertEqual(case.get_case_property('p1'), '1')
+        self.assertEqual(case.get_case_property('p4'), '4')
+        self.assertEqual([i.referenced_id for i in case.indices], [parent_id])
+
+        with patch('corehq.form_processor.backends.sql.update_strategy.form_load_counter') as counter:
+            XFormInstance.objects.get_form(f5).unarchive()
+        counter.return_value.assert_called_once_with(1)
+        case = CommCareCase.objects.get_case(case_id, REBUILD_TEST_DOMAIN)
+        self.assertTrue(case.closed)
+        self.assertEqual(case.get_case_property('p1'), '5')
+        self.assertEqual(self._snapshot_counts(case_id), [2, 4])
+
+        XFormInstance.objects.get_form(f2).archive()
+        case = CommCareCase.objects.get_case(case_id, REBUILD_TEST_DOMAIN)
+        self.assertEqual(case.indices, [])
+        self.assertNotIn('p2', case.dynamic_case_properties())
+        self.assertEqual(case.get_case_property('p3'), '3')
+        self.assertEqual(case.get_case_property('p1'), '5')
+        self.assertEqual(self._snapshot_counts(case_id), [2])
+
+    def _snapshot_counts(self, case_id):
+        return [s.transaction_count for s in CaseSnapshot.objects.get_snapshots(case_id)]
@@ -179,9 +179,15 @@ def extract_case_blocks(doc, include_path=False):
 
     Repeat nodes will all share the same path.
     """
+    from corehq.form_processor.utils import extract_meta_instance_id
     if isinstance(doc, dict):
         form = doc
     else:
+        streamed_form = getattr(doc, 'streamed_form', None)
+        if streamed_form is not None:
+            # case blocks were read when the form was submitted
+            form_id = extract_meta_instance_id(streamed_form.head)
+            return list(_validate_case_blocks(streamed_form.case_blocks, form_id, include_path))
         form = doc.form_data
 
     return list(_extract_case_blocks(form, [] if include_path else None))
@@ -197,9 +203,20 @@ def _extract_case_blocks(data, path=None, form_id=Ellipsis):
     if form_id is Ellipsis:
         form_id = extract_meta_instance_id(data)
 
+    case_blocks = find_case_blocks(data, [] if path is None else path)
+    return _validate_case_blocks(case_blocks, form_id, include_path=path is not None)
+
+
+def find_case_blocks(data, path):
+    """
+    Find the case blocks in json representing a node in an xform submission
+
+    :returns: ``(case_block, path)`` pairs in the order that
+    ``extract_case_blocks`` returns them. The case blocks are not validated.
+    """
     if isinstance(data, list):
         for item in data:
-            yield from _extract_case_blocks(item, path, form_id=form_id)
+            yield from find_case_blocks(item, path)
     elif isinstance(data, dict) and not is_device_report(data):
         for key, value in data.items():
             if const.CASE_TAG == key:
@@ -210,17 +227,21 @@ def _extract_case_blocks(data, path=None, form_id=Ellipsis):
                     case_blocks = [value]
 
                 for case_block in case_blocks:
-                    if has_case_id(case_block):
-                        validate_phone_datetime(
-                            case_block.get('@date_modified'), none_ok=True, form_id=form_id
-                        )
-                        if path is None:
-                            yield case_block
-                        else:
-                            yield CaseBlockWithPath(caseblock=case_block, path=path)
+                    yield case_block, path
+            else:
+                yield from find_case_blocks(value, path + [key])
+
+
+def _validate_case_blocks(case_blocks, form_id, include_path):
+    for case_block, path in case_blocks:
+        if has_case_id(case_block):
+            validate_phone_datetime(
+                case_block.get('@date_modified'), none_ok=True, form_id=form_id
+            )
+            if include_path:
+                yield CaseBlockWithPath(caseblock=case_block, path=path)
             else:
-                new_path = None if path is None else path + [key]
-                yield from _extract_case_blocks(value, new_path, form_id=form_id)
+                yield case_block
 
 
 def get_case_updates(xform, for_case=None):
@@ -1,7 +1,4 @@
 import hashlib
-import binascii
-from copy import copy
-from functools import reduce
 
 
 EMPTY_HASH = ""
@@ -44,13 +41,43 @@ class Checksum(object):
     >>> Checksum().hexdigest()
     ''
 
+    The digest is an XOR of the hashes of all ids, so ids can be removed
+    again without rehashing the rest.
+
+    >>> c.add('xyz')
+    >>> c.remove('xyz')
+    >>> c.hexdigest()
+    '409c5c597fa2c2a693b769f0d2ad432b'
+
+    >>> c = Checksum.from_hexdigest('409c5c597fa2c2a693b769f0d2ad432b', 2)
+    >>> c.remove('abc123')
+    >>> c.remove('123abc')
+    >>> c.hexdigest()
+    ''
+
     """
 
     def __init__(self, init=None):
-        self._list = init or []
+        self._digest = 0
+        self._count = 0
+        for id in init or []:
+            self.add(id)
+
+    @classmethod
+    def from_hexdigest(cls, hexdigest, count):
+        """Resume a checksum of ``count`` ids from its ``hexdigest()``"""
+        checksum = cls()
+        checksum._digest = int(hexdigest, 16) if hexdigest else 0
+        checksum._count = count
+        return checksum
 
     def add(self, id):
-        self._list.append(id)
+        self._digest ^= int.from_bytes(Checksum.hash(id), 'big')
+        self._count += 1
+
+    def remove(self, id):
+        self._digest ^= int.from_bytes(Checksum.hash(id), 'big')
+        self._count -= 1
 
     @classmethod
     def hash(cls, line):
@@ -64,10 +91,6 @@ class Checksum(object):
         return bytearray([b1 ^ b2 for (b1, b2) in zip(bytes1, bytes2)])
 
     def hexdigest(self):
-        if not self._list:
+        if not self._count:
             return EMPTY_HASH
-        x = copy(self._list)
-        x = list(map(Checksum.hash, x))
-        x = reduce(Checksum.xor, x)
-        x = binascii.hexlify(bytes(x)).decode('utf-8')
-        return x
+        return '%032x' % self._digest
@@ -15,6 +15,22 @@ ASYNC_RETRY_AFTER = 5
 
 ASYNC_RESTORE_CACHE_KEY_PREFIX = "async-restore-task"
 RESTORE_CACHE_KEY_PREFIX = "ota-restore"
+LIVE_CASE_GRAPH_CACHE_KEY_PREFIX = "livequery-case-graph"
+CASE_XML_CACHE_KEY_PREFIX = "restore-case-xml"
+SHARED_CASE_PAYLOAD_CACHE_KEY_PREFIX = "shared-restore-cases"
+RESTORE_PROFILE_CACHE_KEY_PREFIX = "restore-profile"
+PRECOMPUTED_RESTORE_CACHE_KEY_PREFIX = "precomputed-restore"
+
+# restores that take longer than this (in seconds) are logged and their
+# timing profile is saved
+SLOW_RESTORE_THRESHOLD = 20
+
+# maximum number of fixture providers run concurrently by one restore,
+# each holding its own database connections
+FIXTURE_PROVIDER_WORKERS = 4
+# maximum number of elements a concurrently run fixture provider generates
+# before they are added to the restore
+FIXTURE_PROVIDER_QUEUE_SIZE = 100
 
 # case sync algorithms
 LIVEQUERY = 'livequery'
@@ -24,14 +24,30 @@ Example case graphs with outcomes:
 import logging
 from collections import defaultdict
 from contextlib import contextmanager
+from datetime import datetime, timedelta
 from functools import partial
 from itertools import chain, islice
+from uuid import uuid4
 
 from casexml.apps.case.const import CASE_INDEX_EXTENSION as EXTENSION
 from casexml.apps.phone.const import ASYNC_RETRY_AFTER
+from casexml.apps.phone.restore_caching import (
+    CaseXMLCache,
+    LiveCaseGraphCache,
+    SharedCasePayloadCache,
+)
+from corehq.blobs import CODES, get_blob_db
+from corehq.blobs.exceptions import NotFound
 from corehq.celery_monitoring.signals import CELERY_STATE_SENT
 from corehq.form_processor.models import CommCareCase, CommCareCaseIndex
-from corehq.toggles import CHUNKED_LIVEQUERY, NAMESPACE_DOMAIN
+from corehq.toggles import (
+    CHUNKED_LIVEQUERY,
+    LIVEQUERY_CASE_GRAPH_CACHE,
+    MM_CASE_PROPERTIES,
+    NAMESPACE_DOMAIN,
+    RESTORE_CASE_XML_CACHE,
+    SHARED_RESTORE_CASE_PAYLOAD,
+)
 from corehq.util.metrics import metrics_counter, metrics_histogram
 from corehq.util.metrics.load_counters import case_load_counter
 from corehq.util.timer import TimingContext
@@ -44,6 +60,11 @@ from .utils import get_case_sync_updates
 
 MAX_RELATED_CHUNK = 1000
 
+# Cases are stamped with server_modified_on when form processing starts,
+# which may be well before the change is committed. Snapshots are dated
+# this far in the past so such changes are still seen as modifications.
+CASE_GRAPH_SNAPSHOT_MARGIN = timedelta(minutes=5)
+
 
 def do_livequery(timing_context, restore_state, response, async_task=None):
     """Get case sync restore response
@@ -59,12 +80,20 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
 
     debug("sync %s for %r", restore_state.current_sync_log._id, owner_ids)
     with timing_context("livequery"):
+        if _use_shared_case_payload(restore_state):
+            do_shared_livequery(timing_context, restore_state, response, async_task)
+            return
+
         with timing_context("get_case_ids_by_owners"):
             owned_ids = CommCareCase.objects.get_case_ids_in_domain_by_owners(
                 domain, owner_ids, closed=False)
             debug("owned: %r", owned_ids)
 
-        live_ids, indices = get_live_case_ids_and_indices(domain, owned_ids, timing_context)
+        if LIVEQUERY_CASE_GRAPH_CACHE.enabled(domain, namespace=NAMESPACE_DOMAIN):
+            live_ids, indices = get_cached_live_case_ids_and_indices(
+                domain, owner_ids, owned_ids, timing_context)
+        else:
+            live_ids, indices = get_live_case_ids_and_indices(domain, owned_ids, timing_context)
 
         if restore_state.last_sync_log:
             with timing_context("discard_already_synced_cases"):
@@ -75,10 +104,11 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
 
         dependent_ids = live_ids - set(owned_ids)
         debug('updating synclog: live=%r dependent=%r', live_ids, dependent_ids)
-        restore_state.current_sync_log.case_ids_on_phone = live_ids
+        restore_state.current_sync_log.set_case_ids_on_phone(live_ids, restore_state.last_sync_log, indices)
         restore_state.current_sync_log.dependent_case_ids_on_phone = dependent_ids
 
         total_cases = len(sync_ids)
+        _add_case_counts(timing_context, len(owned_ids), len(live_ids), len(indices), total_cases)
         with timing_context("compile_response(%s cases)" % total_cases):
             iaccessor = PrefetchIndexCaseAccessor(domain, indices)
             metrics_histogram(
@@ -102,6 +132,149 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
             )
 
 
+def _add_case_counts(timing_context, num_owned, num_live, num_indices, num_synced):
+    timing_context.add_count('owned_cases', num_owned)
+    timing_context.add_count('live_cases', num_live)
+    timing_context.add_count('indices', num_indices)
+    timing_context.add_count('synced_cases', num_synced)
+
+
+def _use_shared_case_payload(restore_state):
+    return (
+        restore_state.last_sync_log is None
+        and bool(restore_state.owner_ids - {restore_state.restore_user.user_id})
+        and restore_state.restore_user.loadtest_factor == 1
+        and SHARED_RESTORE_CASE_PAYLOAD.enabled(restore_state.domain, namespace=NAMESPACE_DOMAIN)
+    )
+
+
+def do_shared_livequery(timing_context, restore_state, response, async_task=None):
+    """Get case payload for an initial restore, sharing the part owned
+    by groups and locations with other users having the same owners
+
+    A case is live if it is made live by any owned case, so the live
+    cases of a set of owners are the union of the live cases of each
+    subset. The payload for the owners other than the user is built
+    once and reused; only cases made live by cases owned directly by
+    the user are added to it for each restore.
+    """
+    domain = restore_state.domain
+    user_id = restore_state.restore_user.user_id
+    shared_owner_ids = restore_state.owner_ids - {user_id}
+    with timing_context("get_case_ids_by_owners"):
+        shared_owned_ids = CommCareCase.objects.get_case_ids_in_domain_by_owners(
+            domain, list(shared_owner_ids), closed=False)
+        user_owned_ids = CommCareCase.objects.get_case_ids_in_domain_by_owners(
+            domain, [user_id], closed=False)
+
+    shared_live_ids, shared_indices = _add_shared_case_payload(
+        timing_context, restore_state, response, shared_owner_ids, shared_owned_ids)
+
+    user_live_ids, indices = get_live_case_ids_and_indices(domain, user_owned_ids, timing_context)
+    live_ids = shared_live_ids | user_live_ids
+    # a case in both graphs has the same indices in each
+    all_indices = {**shared_indices, **indices}
+    restore_state.current_sync_log.set_case_ids_on_phone(live_ids, indices=all_indices)
+    restore_state.current_sync_log.dependent_case_ids_on_phone = (
+        live_ids - set(shared_owned_ids) - set(user_owned_ids))
+
+    sync_ids = user_live_ids - shared_live_ids
+    total_cases = len(sync_ids)
+    _add_case_counts(
+        timing_context,
+        len(shared_owned_ids) + len(user_owned_ids),
+        len(live_ids),
+        len(all_indices),
+        len(shared_live_ids) + total_cases,  # the shared payload is part of this response
+    )
+    with timing_context("compile_response(%s cases)" % total_cases):
+        metrics_histogram(
+            'commcare.restore.case_load',
+            len(live_ids),
+            'cases',
+            RESTORE_CASE_LOAD_BUCKETS,
+            tags={'domain': domain, 'restore_type': 'fresh'}
+        )
+        metrics_counter('commcare.restore.case_load.count', len(live_ids), {'domain': domain})
+        compile_response(
+            timing_context,
+            restore_state,
+            response,
+            batch_cases(PrefetchIndexCaseAccessor(domain, indices), sync_ids),
+            init_progress(async_task, total_cases),
+            total_cases,
+        )
+
+
+def _add_shared_case_payload(timing_context, restore_state, response, owner_ids, owned_ids):
+    """Extend response with the shared case payload for owner ids
+
+    The payload is saved to the blob db along with a snapshot of the
+    case graph it was built from, and reused while the snapshot is
+    current (see `_is_case_graph_snapshot_current`).
+
+    :returns: Two-tuple `(live_ids, indices)` of the case graph of the
+    payload.
+    """
+    from casexml.apps.phone.restore import RestoreContent
+
+    domain = restore_state.domain
+    cache = SharedCasePayloadCache(domain, owner_ids, restore_state.version)
+    shared = cache.get_value()
+    if shared is not None:
+        with timing_context("get_shared_case_payload"):
+            fileobj = _get_shared_case_payload(domain, shared, owned_ids)
+        result = 'stale' if fileobj is None else 'hit'
+    else:
+        fileobj = None
+        result = 'miss'
+    metrics_counter('commcare.restore.shared_case_payload', tags={'domain': domain, 'result': result})
+    if fileobj is not None:
+        with fileobj, timing_context("append_shared_case_payload"):
+            response.append_file(fileobj)
+        return set(shared['graph']['live_ids']), _get_snapshot_indices(domain, shared['graph'])
+
+    as_of = datetime.utcnow() - CASE_GRAPH_SNAPSHOT_MARGIN
+    live_ids, indices, walked_ids = _walk_case_graph(domain, owned_ids, timing_context)
+    total_cases = len(live_ids)
+    with RestoreContent() as content:
+        with timing_context("compile_response(%s shared cases)" % total_cases):
+            compile_response(
+                timing_context,
+                restore_state,
+                content,
+                batch_cases(PrefetchIndexCaseAccessor(domain, indices), live_ids),
+                init_progress(None, total_cases),
+                total_cases,
+            )
+        with content.get_items_fileobj() as fileobj, timing_context("save_shared_case_payload"):
+            name = 'restore-cases-{}.xml'.format(uuid4().hex)
+            get_blob_db().put(
+                fileobj,
+                domain=domain,
+                parent_id=domain,
+                type_code=CODES.restore,
+                key=name,
+                timeout=cache.timeout // 60,
+            )
+            fileobj.seek(0)
+            response.append_file(fileobj)
+    cache.set_value({
+        'name': name,
+        'graph': _make_case_graph_snapshot(domain, as_of, owned_ids, live_ids, indices, walked_ids),
+    })
+    return live_ids, indices
+
+
+def _get_shared_case_payload(domain, shared, owned_ids):
+    if not _is_case_graph_snapshot_current(domain, shared['graph'], owned_ids):
+        return None
+    try:
+        return get_blob_db().get(key=shared['name'], type_code=CODES.restore)
+    except NotFound:
+        return None
+
+
 def get_case_hierarchy(domain, cases):
     """Get the combined case hierarchy for the input cases"""
     domains = {case.domain for case in cases}
@@ -121,6 +294,123 @@ def get_all_related_live_cases(domain, case_ids):
 
 
 def get_live_case_ids_and_indices(domain, owned_ids, timing_context):
+    live_ids, indices, walked_ids = _walk_case_graph(domain, owned_ids, timing_context)
+    return live_ids, indices
+
+
+def get_cached_live_case_ids_and_indices(domain, owner_ids, owned_ids, timing_context):
+    """Get live case ids and indices, reusing a snapshot when possible
+
+    The snapshot is shared by all users with the same owner ids. It is
+    reused if the owned cases are the same as when it was taken and no
+    case in the graph has been modified or gained a new index since.
+    Otherwise the graph is walked again and a new snapshot is saved.
+    """
+    cache = LiveCaseGraphCache(domain, owner_ids)
+    snapshot = cache.get_value()
+    if snapshot is not None:
+        with timing_context("validate_case_graph_snapshot"):
+            is_current = _is_case_graph_snapshot_current(domain, snapshot, owned_ids)
+        result = 'hit' if is_current else 'stale'
+    else:
+        is_current = False
+        result = 'miss'
+    metrics_counter('commcare.restore.case_graph_cache', tags={'domain': domain, 'result': result})
+    if is_current:
+        return set(snapshot['live_ids']), _get_snapshot_indices(domain, snapshot)
+
+    as_of = datetime.utcnow() - CASE_GRAPH_SNAPSHOT_MARGIN
+    live_ids, indices, walked_ids = _walk_case_graph(domain, owned_ids, timing_context)
+    cache.set_value(_make_case_graph_snapshot(domain, as_of, owned_ids, live_ids, indices, walked_ids))
+    return live_ids, indices
+
+
+def _get_snapshot_indices(domain, snapshot):
+    indices = defaultdict(list)
+    for case_id, identifier, referenced_type, referenced_id, relationship_id in snapshot['indices']:
+        indices[case_id].append(CommCareCaseIndex(
+            domain=domain,
+            case_id=case_id,
+            identifier=identifier,
+            referenced_type=referenced_type,
+            referenced_id=referenced_id,
+            relationship_id=relationship_id,
+        ))
+    return indices
+
+
+def _make_case_graph_snapshot(domain, as_of, owned_ids, live_ids, indices, walked_ids):
+    snapshot = {
+        'as_of': as_of,
+        'owned_ids': list(owned_ids),
+        'walked_ids': list(walked_ids),
+        'live_ids': list(live_ids),
+        'indices': [
+            (ix.case_id, ix.identifier, ix.referenced_type, ix.referenced_id, ix.relationship_id)
+            for case_indices in indices.values()
+            for ix in case_indices
+        ],
+    }
+    # indices may reference cases that are deleted or do not exist
+    snapshot['absent_ids'] = [
+        case_id for case_id, modified_on in _iter_case_graph_modified_dates(domain, snapshot)
+        if modified_on is None
+    ]
+    return snapshot
+
+
+def _is_case_graph_snapshot_current(domain, snapshot, owned_ids):
+    """Check that nothing affecting liveness changed since the snapshot
+
+    Closing, re-owning or re-indexing a case updates its
+    `server_modified_on`, so only cases outside the graph that gained
+    an index into it (new open extensions) need a related index query.
+    Deleting a case does not, so a case that was deleted or removed
+    from the database since the snapshot (or was restored) also makes
+    it stale.
+    """
+    if set(owned_ids) != set(snapshot['owned_ids']):
+        return False
+    absent_ids = set(snapshot['absent_ids'])
+    as_of = snapshot['as_of']
+    for case_id, modified_on in _iter_case_graph_modified_dates(domain, snapshot):
+        if modified_on is None:
+            if case_id not in absent_ids:
+                return False
+        elif case_id in absent_ids or modified_on >= as_of:
+            return False
+    seen = {'{} {}'.format(row[0], row[1]) for row in snapshot['indices']}
+    new_indices = CommCareCaseIndex.objects.get_related_indices(
+        domain, list(snapshot['walked_ids']), seen)
+    return not new_indices
+
+
+def _iter_case_graph_modified_dates(domain, snapshot):
+    """Get the last modified date of each case in a case graph snapshot
+
+    :returns: Iterable of `(case_id, server_modified_on)`, where
+    `server_modified_on` is `None` for cases that are deleted or do
+    not exist.
+    """
+    graph_ids = set(snapshot['walked_ids'])
+    for case_id, identifier, referenced_type, referenced_id, relationship_id in snapshot['indices']:
+        graph_ids.add(case_id)
+        if referenced_id:
+            graph_ids.add(referenced_id)
+    for chunk in chunked(graph_ids, MAX_RELATED_CHUNK, collection=list):
+        modified_dates = CommCareCase.objects.get_last_modified_dates_and_deleted(domain, chunk)
+        for case_id in chunk:
+            modified_on, deleted = modified_dates.get(case_id, (None, True))
+            yield case_id, None if deleted else modified_on
+
+
+def _walk_case_graph(domain, owned_ids, timing_context):
+    """Walk indices from owned cases to find live cases
+
+    :returns: Three-tuple `(live_ids, indices, walked_ids)` where
+    `walked_ids` is the set of case ids whose related indices were
+    fetched while walking the graph.
+    """
     def index_key(index):
         return index.case_id, index.identifier
 
@@ -335,7 +625,7 @@ def get_live_case_ids_and_indices(domain, owned_ids, timing_context):
                 enliven(case_id)
 
         debug('live: %r', live_ids)
-    return live_ids, indices
+    return live_ids, indices, all_ids
 
 
 def discard_already_synced_cases(live_ids, restore_state):
@@ -410,6 +700,7 @@ def compile_response(
     total_cases,
 ):
     done = 0
+    xml_cache = get_case_xml_cache(restore_state, total_cases)
     for cases in batches:
         with timing_context("get_stock_payload"):
             response.extend(get_stock_payload(
@@ -423,15 +714,49 @@ def compile_response(
                 restore_state.domain, cases, restore_state.last_sync_log)
 
         with timing_context("get_xml_for_response (%s updates)" % len(updates)):
-            response.extend(
-                item for update in updates
-                for item in get_xml_for_response(
-                    update, restore_state, total_cases
+            if xml_cache is None:
+                response.extend(
+                    item for update in updates
+                    for item in get_xml_for_response(
+                        update, restore_state, total_cases
+                    )
                 )
-            )
+            else:
+                response.extend(get_cached_xml_for_response(
+                    xml_cache, updates, restore_state, total_cases))
 
         done += len(cases)
         update_progress(done)
 
 
+def get_case_xml_cache(restore_state, total_cases):
+    domain = restore_state.domain
+    if not RESTORE_CASE_XML_CACHE.enabled(domain, namespace=NAMESPACE_DOMAIN):
+        return None
+    if not total_cases or restore_state.get_safe_loadtest_factor(total_cases) > 1:
+        # load test copies of cases are not worth caching
+        return None
+    return CaseXMLCache(domain, restore_state.version, MM_CASE_PROPERTIES.enabled(domain))
+
+
+def get_cached_xml_for_response(xml_cache, updates, restore_state, total_cases):
+    """Get case XML for updates, serializing only cases not found in cache
+
+    Expects a load test factor of 1 (one XML element per update).
+    """
+    cached = xml_cache.get_many(updates)
+    new_xml = {}
+    elements = []
+    for update in updates:
+        xml = cached.get(update.case.case_id)
+        if xml is None:
+            xml, = get_xml_for_response(update, restore_state, total_cases)
+            new_xml[update] = xml
+        elements.append(xml)
+    metrics_counter('commcare.restore.case_xml_cache.hits', len(updates) - len(new_xml),
+                    tags={'domain': restore_state.domain})
+    xml_cache.set_many(new_xml)
+    return elements
+
+
 RESTORE_CASE_LOAD_BUCKETS = [100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000]
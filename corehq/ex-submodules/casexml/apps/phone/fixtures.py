@@ -1,13 +1,21 @@
+import queue
+import threading
 from abc import ABCMeta, abstractmethod, abstractproperty
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
+from django.db import connections
 
 from memoized import memoized
 
 from casexml.apps.case.xml import V1
+from casexml.apps.phone.const import FIXTURE_PROVIDER_QUEUE_SIZE, FIXTURE_PROVIDER_WORKERS
 from casexml.apps.phone.models import OTARestoreUser
 from dimagi.utils.modules import to_function
 
+from corehq.toggles import NAMESPACE_DOMAIN, PARALLEL_RESTORE_FIXTURES
+from corehq.util.timer import TimingContext
+
 
 class FixtureProvider(metaclass=ABCMeta):
     @abstractproperty
@@ -56,7 +64,104 @@ def get_fixture_elements(restore_state, timing_context):
     if not isinstance(restore_state.restore_user, OTARestoreUser):
         return
 
-    for provider in _fixture_generators():
+    providers = _fixture_generators()
+    if PARALLEL_RESTORE_FIXTURES.enabled(restore_state.domain, namespace=NAMESPACE_DOMAIN):
+        yield from _get_fixture_elements_concurrently(providers, restore_state, timing_context)
+        return
+
+    for provider in providers:
         with timing_context('fixture:{}'.format(provider.id)):
             for element in provider(restore_state):
                 yield element
+
+
+def _get_fixture_elements_concurrently(providers, restore_state, timing_context):
+    """Run fixture providers concurrently
+
+    Providers are independent of each other so they are run in a small
+    pool of threads, each using its own database connections and its own
+    copy of the restore state. Elements are yielded in provider order, so
+    the payload is the same as when run sequentially.
+
+    Each provider passes its elements through a bounded queue, so a
+    provider that runs ahead of the one being yielded holds at most
+    ``FIXTURE_PROVIDER_QUEUE_SIZE`` elements in memory. A provider's
+    timer is the current timer while its elements are yielded, so that
+    they are counted on it as they are when run sequentially.
+    """
+    runs = [_FixtureProviderRun(provider, restore_state, timing_context) for provider in providers]
+    with ThreadPoolExecutor(max_workers=FIXTURE_PROVIDER_WORKERS) as pool:
+        try:
+            # runs start in order, so the run being yielded always has a thread
+            for run in runs:
+                pool.submit(run)
+            for run in runs:
+                timing_context.stack.append(run.timing.root)
+                try:
+                    yield from run.get_elements()
+                finally:
+                    timing_context.stack.pop()
+        finally:
+            # stop runs that are waiting for the elements to be consumed
+            for run in runs:
+                run.cancelled.set()
+
+
+class _FixtureProviderRun(object):
+    """Run a fixture provider in a worker thread"""
+
+    def __init__(self, provider, restore_state, timing_context):
+        self.provider = provider
+        self.timing = TimingContext('fixture:{}'.format(provider.id))
+        timing_context.peek().append(self.timing.root)
+        # created in the calling thread, which loads the values it shares
+        self.restore_state = restore_state.copy_for_thread(self.timing)
+        self.elements = queue.Queue(maxsize=FIXTURE_PROVIDER_QUEUE_SIZE)
+        self.cancelled = threading.Event()
+
+    def __call__(self):
+        try:
+            if self.cancelled.is_set():
+                return
+            with self.timing:
+                for element in self.provider(self.restore_state):
+                    if not self._put(element):
+                        return
+        except BaseException as err:
+            self._put(_FixtureProviderError(err))
+        else:
+            self._put(_FIXTURE_PROVIDER_DONE)
+        finally:
+            # connections are thread local and would otherwise outlive the pool
+            connections.close_all()
+
+    def get_elements(self):
+        while True:
+            item = self.elements.get()
+            if item is _FIXTURE_PROVIDER_DONE:
+                return
+            if isinstance(item, _FixtureProviderError):
+                raise item.error
+            yield item
+
+    def _put(self, item):
+        """Put an item on the queue
+
+        :returns: ``False`` if the run was cancelled while the queue was full.
+        """
+        while not self.cancelled.is_set():
+            try:
+                self.elements.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+class _FixtureProviderError(object):
+
+    def __init__(self, error):
+        self.error = error
+
+
+_FIXTURE_PROVIDER_DONE = object()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.16 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone', '0007_delete_ownershipcleanlinessflag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synclogsql',
+            name='doc_compact',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.16 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone', '0008_synclogsql_doc_compact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synclogsql',
+            name='is_precomputed',
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AddField(
+            model_name='synclogsql',
+            name='fetched_date',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
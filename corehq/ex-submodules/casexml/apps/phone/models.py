@@ -4,6 +4,7 @@ import uuid
 from collections import defaultdict, namedtuple
 from copy import copy
 from datetime import datetime
+from itertools import chain
 
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -18,6 +19,10 @@ from casexml.apps.phone.exceptions import (
     IncompatibleSyncLogType,
     MissingSyncLog,
 )
+from casexml.apps.phone.synclog_encoding import (
+    compact_sync_log_doc,
+    expand_sync_log_doc,
+)
 from dimagi.ext.couchdbkit import (
     BooleanProperty,
     DateTimeProperty,
@@ -358,10 +363,19 @@ def synclog_to_sql_object(synclog_json_object):
     ]
     for from_field, to_field in field_mapping:
         setattr(synclog, to_field, getattr(synclog_json_object, from_field, None))
-    synclog.doc = synclog_json_object.to_json()
+    doc = synclog_json_object.to_json()
+    if _use_compact_encoding(synclog_json_object.domain):
+        synclog.doc, synclog.doc_compact = compact_sync_log_doc(doc)
+    else:
+        synclog.doc, synclog.doc_compact = doc, None
     return synclog
 
 
+def _use_compact_encoding(domain):
+    from corehq.toggles import COMPACT_SYNCLOG_ENCODING, NAMESPACE_DOMAIN
+    return bool(domain) and COMPACT_SYNCLOG_ENCODING.enabled(domain, namespace=NAMESPACE_DOMAIN)
+
+
 @architect.install('partition', type='range', subtype='date', constraint='week', column='date')
 class SyncLogSQL(models.Model):
 
@@ -371,6 +385,10 @@ class SyncLogSQL(models.Model):
     date = models.DateTimeField(db_index=True, null=True, blank=True)
     previous_synclog_id = models.UUIDField(max_length=255, default=None, null=True, blank=True)
     doc = models.JSONField()
+    # case state (ids on phone, index trees) encoded with
+    # synclog_encoding. When set, doc holds only the remaining fields,
+    # which is all that change feed consumers need.
+    doc_compact = models.BinaryField(null=True)
     log_format = models.CharField(
         max_length=10,
         choices=[
@@ -391,6 +409,10 @@ class SyncLogSQL(models.Model):
     case_count = models.IntegerField(null=True)
     request_user_id = models.CharField(max_length=255, null=True)
     auth_type = models.CharField(max_length=128, null=True)
+    # set on sync logs created by a precomputed restore, with the time
+    # the device fetched the payload (see casexml.apps.phone.precompute)
+    is_precomputed = models.BooleanField(null=True)
+    fetched_date = models.DateTimeField(null=True)
 
     def save(self, *args, **kwargs):
         super(SyncLogSQL, self).save(*args, **kwargs)
@@ -412,10 +434,19 @@ class IndexTree(DocumentSchema):
     # and the values are the referenced case IDs
     indices = SchemaDictProperty()
 
+    _reverse_indices = None
+
     @property
-    @memoized
     def reverse_indices(self):
-        return _reverse_index_map(self.indices)
+        """Mapping of referenced case ids to the set of ids of cases referencing them
+
+        Built on first access and then kept up to date by `set_index`,
+        `delete_index` and `delete_case` rather than being rebuilt after
+        each change.
+        """
+        if self._reverse_indices is None:
+            self._reverse_indices = _reverse_index_map(self.indices)
+        return self._reverse_indices
 
     def __repr__(self):
         return json.dumps(self.indices, indent=2)
@@ -427,80 +458,61 @@ class IndexTree(DocumentSchema):
         Traverse each incoming index, return each touched case.
         Traverse each outgoing index in the extension tree, return each touched case
         """
-        all_cases = set()
-        cases_to_check = set([case_id])
+        all_cases = {case_id}
+        cases_to_check = [case_id]
         while cases_to_check:
             case_to_check = cases_to_check.pop()
-            all_cases.add(case_to_check)
-            incoming_extension_indices = extension_index_tree.get_cases_that_directly_depend_on_case(
-                case_to_check
+            related = chain(
+                extension_index_tree.get_cases_that_directly_depend_on_case(case_to_check),
+                child_index_tree.get_cases_that_directly_depend_on_case(case_to_check),
+                extension_index_tree.indices.get(case_to_check, {}).values(),
             )
-            incoming_child_indices = child_index_tree.get_cases_that_directly_depend_on_case(case_to_check)
-            all_incoming_indices = incoming_extension_indices | incoming_child_indices
-            new_outgoing_cases_to_check = set(extension_index_tree.indices.get(case_to_check, {}).values())
-            new_cases_to_check = (new_outgoing_cases_to_check | all_incoming_indices) - all_cases
-
-            cases_to_check |= new_cases_to_check
-
-        return all_cases
-
-    @staticmethod
-    @memoized
-    def get_all_outgoing_cases(case_id, child_index_tree, extension_index_tree):
-        """traverse all outgoing child and extension indices"""
-        all_cases = set([case_id])
-        new_cases = set([case_id])
-        while new_cases:
-            case_to_check = new_cases.pop()
-            parent_cases = set(child_index_tree.indices.get(case_to_check, {}).values())
-            host_cases = set(extension_index_tree.indices.get(case_to_check, {}).values())
-            new_cases = (new_cases | parent_cases | host_cases) - all_cases
-            all_cases = all_cases | parent_cases | host_cases
-        return all_cases
-
-    @staticmethod
-    @memoized
-    def traverse_incoming_extensions(case_id, extension_index_tree, closed_cases):
-        """traverse open incoming extensions"""
-        all_cases = set([case_id])
-        new_cases = set([case_id])
-        while new_cases:
-            case_to_check = new_cases.pop()
-            open_incoming_extension_indices = {
-                case for case in
-                extension_index_tree.get_cases_that_directly_depend_on_case(case_to_check)
-                if case not in closed_cases
-            }
-            for incoming_case in open_incoming_extension_indices:
-                new_cases.add(incoming_case)
-                all_cases.add(incoming_case)
+            for related_case in related:
+                if related_case not in all_cases:
+                    all_cases.add(related_case)
+                    cases_to_check.append(related_case)
         return all_cases
 
     def get_cases_that_directly_depend_on_case(self, case_id):
-        return self.reverse_indices.get(case_id, set([]))
+        return self.reverse_indices.get(case_id, _EMPTY_SET)
 
     def delete_index(self, from_case_id, index_name):
         prior_ids = self.indices.pop(from_case_id, {})
-        prior_ids.pop(index_name, None)
+        to_case_id = prior_ids.pop(index_name, None)
         if prior_ids:
             self.indices[from_case_id] = prior_ids
-        self._clear_index_caches()
+        if to_case_id is not None:
+            self._discard_reverse_index(from_case_id, to_case_id, prior_ids)
+
+    def delete_case(self, case_id):
+        """Delete all indices of a case
+
+        :returns: Dict of deleted indices `{identifier: referenced_id}`.
+        """
+        prior_ids = self.indices.pop(case_id, {})
+        for to_case_id in set(prior_ids.values()):
+            self._discard_reverse_index(case_id, to_case_id, {})
+        return prior_ids
 
     def set_index(self, from_case_id, index_name, to_case_id):
         prior_ids = self.indices.get(from_case_id, {})
+        old_to_case_id = prior_ids.get(index_name)
         prior_ids[index_name] = to_case_id
         self.indices[from_case_id] = prior_ids
-        self._clear_index_caches()
-
-    def _clear_index_caches(self):
-        try:
-            # self.reverse_indices is a memoized property, so we can't just call self.reverse_indices.reset_cache
-            self._reverse_indices_cache.clear()
-        except AttributeError:
-            pass
-
-        self.get_all_outgoing_cases.reset_cache()
-        self.traverse_incoming_extensions.reset_cache()
+        if old_to_case_id is not None and old_to_case_id != to_case_id:
+            self._discard_reverse_index(from_case_id, old_to_case_id, prior_ids)
+        if self._reverse_indices is not None:
+            self._reverse_indices.setdefault(to_case_id, set()).add(from_case_id)
+
+    def _discard_reverse_index(self, from_case_id, to_case_id, remaining_ids):
+        """Remove reverse index unless another remaining index still references the same case"""
+        if self._reverse_indices is None or to_case_id in remaining_ids.values():
+            return
+        referencing_ids = self._reverse_indices.get(to_case_id)
+        if referencing_ids is not None:
+            referencing_ids.discard(from_case_id)
+            if not referencing_ids:
+                del self._reverse_indices[to_case_id]
 
     def apply_updates(self, other_tree):
         """
@@ -517,6 +529,9 @@ class IndexTree(DocumentSchema):
         return new
 
 
+_EMPTY_SET = frozenset()
+
+
 def _reverse_index_map(index_map):
     reverse_indices = defaultdict(set)
     for case_id, indices in index_map.items():
@@ -544,9 +559,18 @@ class SimplifiedSyncLog(AbstractSyncLog):
     extensions_checked = BooleanProperty(default=False)
     device_id = StringProperty()
     auth_type = StringProperty()
+    # state hash of case_ids_on_phone, kept up to date as cases are added
+    # and removed so that it does not need to be recomputed from all ids
+    case_ids_hash = StringProperty()
 
     _purged_cases = None
 
+    def __setattr__(self, name, value):
+        super(SimplifiedSyncLog, self).__setattr__(name, value)
+        if name == 'case_ids_on_phone':
+            # replaced wholesale, the running hash no longer applies
+            super(SimplifiedSyncLog, self).__setattr__('case_ids_hash', None)
+
     @property
     def purged_cases(self):
         if self._purged_cases is None:
@@ -569,6 +593,62 @@ class SimplifiedSyncLog(AbstractSyncLog):
     def get_footprint_of_cases_on_phone(self):
         return list(self.case_ids_on_phone)
 
+    def get_state_hash(self):
+        if self.case_ids_hash is None:
+            self.case_ids_hash = Checksum(self.get_footprint_of_cases_on_phone()).hexdigest()
+        return CaseStateHash(self.case_ids_hash)
+
+    def set_case_ids_on_phone(self, case_ids, previous_sync_log=None, indices=None):
+        """Replace the cases on the phone
+
+        If ``previous_sync_log`` has a state hash, the new hash is derived
+        from it by hashing only the case ids that changed.
+
+        :param indices: Optional dict of ``{case_id: [CommCareCaseIndex, ...]}``.
+        If given, the index trees are replaced with the indices of the cases.
+        """
+        self.case_ids_on_phone = case_ids
+        if indices is not None:
+            self.index_tree = IndexTree()
+            self.extension_index_tree = IndexTree()
+            for case_id in case_ids:
+                for index in indices.get(case_id, []):
+                    if not index.referenced_id:
+                        continue  # removed index
+                    if index.relationship == const.CASE_INDEX_EXTENSION:
+                        tree = self.extension_index_tree
+                    else:
+                        tree = self.index_tree
+                    tree.set_index(index.case_id, index.identifier, index.referenced_id)
+        previous_hash = previous_sync_log.case_ids_hash if previous_sync_log else None
+        if previous_hash is None:
+            checksum = Checksum(list(case_ids))
+        else:
+            previous_ids = previous_sync_log.case_ids_on_phone
+            checksum = Checksum.from_hexdigest(previous_hash, len(previous_ids))
+            for case_id in case_ids - previous_ids:
+                checksum.add(case_id)
+            for case_id in previous_ids - case_ids:
+                checksum.remove(case_id)
+        self.case_ids_hash = checksum.hexdigest()
+
+    def _add_case_id_on_phone(self, case_id):
+        if case_id not in self.case_ids_on_phone:
+            self._update_case_ids_hash(Checksum.add, case_id)
+            self.case_ids_on_phone.add(case_id)
+
+    def _remove_case_id_on_phone(self, case_id):
+        if case_id not in self.case_ids_on_phone:
+            raise KeyError(case_id)
+        self._update_case_ids_hash(Checksum.remove, case_id)
+        self.case_ids_on_phone.remove(case_id)
+
+    def _update_case_ids_hash(self, update, case_id):
+        if self.case_ids_hash is not None:
+            checksum = Checksum.from_hexdigest(self.case_ids_hash, len(self.case_ids_on_phone))
+            update(checksum, case_id)
+            self.case_ids_hash = checksum.hexdigest()
+
     @property
     def primary_case_ids(self):
         return self.case_ids_on_phone - self.dependent_case_ids_on_phone
@@ -639,48 +719,68 @@ class SimplifiedSyncLog(AbstractSyncLog):
         as available. Traverse incoming extension indexes which don't lead to closed
         cases, mark all touched cases as available
         """
-        incoming_extensions = self.extension_index_tree.reverse_indices
         available = {case for case in relevant
                      if case not in self.closed_cases
                      and (not self.extension_index_tree.indices.get(case) or self.index_tree.indices.get(case))}
-        new_available = set() | available
-        while new_available:
-            case_to_check = new_available.pop()
-            for incoming_extension in incoming_extensions.get(case_to_check, []):
-                closed = incoming_extension in self.closed_cases
-                purged = incoming_extension in self.purged_cases
-                if not closed and not purged:
-                    new_available.add(incoming_extension)
-            available = available | new_available
+        cases_to_check = list(available)
+        while cases_to_check:
+            case_to_check = cases_to_check.pop()
+            for incoming_extension in self.extension_index_tree.get_cases_that_directly_depend_on_case(
+                    case_to_check):
+                if (incoming_extension not in available
+                        and incoming_extension not in self.closed_cases
+                        and incoming_extension not in self.purged_cases):
+                    available.add(incoming_extension)
+                    cases_to_check.append(incoming_extension)
         _get_logger().debug("Available cases: {}".format(available))
 
         return available
 
     def _get_live_cases(self, available):
         """
-        Mark all relevant, owned, available cases as live. Traverse incoming
-        extension indexes which don't lead to closed cases, mark all touched
-        cases as available.
+        Mark all relevant, owned, available cases as live. Traverse all outgoing
+        indexes and incoming extension indexes which don't lead to closed cases,
+        mark all touched cases as live.
+
+        Purged cases are never live, but are traversed through. Live cases
+        are not traversed through since each live case is checked in turn.
         """
-        primary_case_ids = self.primary_case_ids
-        live = available & primary_case_ids
-        new_live = set() | live
-        checked = set()
-        while new_live:
-            case_to_check = new_live.pop()
-            checked.add(case_to_check)
-            new_live = new_live | IndexTree.get_all_outgoing_cases(
-                case_to_check,
-                self.index_tree,
-                self.extension_index_tree
-            ) - self.purged_cases
-            new_live = new_live | IndexTree.traverse_incoming_extensions(
-                case_to_check,
-                self.extension_index_tree,
-                frozenset(self.closed_cases),
-            ) - self.purged_cases
-            new_live = new_live - checked
-            live = live | new_live
+        def get_outgoing(case_id):
+            return chain(
+                self.index_tree.indices.get(case_id, {}).values(),
+                self.extension_index_tree.indices.get(case_id, {}).values(),
+            )
+
+        def get_open_incoming_extensions(case_id):
+            return (
+                case for case in
+                self.extension_index_tree.get_cases_that_directly_depend_on_case(case_id)
+                if case not in self.closed_cases
+            )
+
+        def traverse(case_id, get_next):
+            seen = {case_id}
+            cases_to_traverse = [case_id]
+            while cases_to_traverse:
+                for next_case in get_next(cases_to_traverse.pop()):
+                    if next_case not in seen:
+                        seen.add(next_case)
+                        yield next_case
+                        if next_case not in live:
+                            cases_to_traverse.append(next_case)
+
+        live = available & self.primary_case_ids
+        cases_to_check = list(live)
+        while cases_to_check:
+            case_to_check = cases_to_check.pop()
+            related = chain(
+                traverse(case_to_check, get_outgoing),
+                traverse(case_to_check, get_open_incoming_extensions),
+            )
+            for related_case in related:
+                if related_case not in live and related_case not in self.purged_cases:
+                    live.add(related_case)
+                    cases_to_check.append(related_case)
 
         _get_logger().debug("live cases: {}".format(live))
 
@@ -703,11 +803,11 @@ class SimplifiedSyncLog(AbstractSyncLog):
         """Removes case from index trees, case_ids_on_phone and dependent_case_ids_on_phone if pertinent"""
         _get_logger().debug('removing: {}'.format(to_remove))
 
-        deleted_indices = self.index_tree.indices.pop(to_remove, {})
-        deleted_indices.update(self.extension_index_tree.indices.pop(to_remove, {}))
+        self.index_tree.delete_case(to_remove)
+        self.extension_index_tree.delete_case(to_remove)
 
         try:
-            self.case_ids_on_phone.remove(to_remove)
+            self._remove_case_id_on_phone(to_remove)
         except KeyError:
             if xform_id:
                 # this is only a soft assert for now because of http://manage.dimagi.com/default.asp?181443
@@ -725,7 +825,7 @@ class SimplifiedSyncLog(AbstractSyncLog):
             self.dependent_case_ids_on_phone.remove(to_remove)
 
     def _add_primary_case(self, case_id):
-        self.case_ids_on_phone.add(case_id)
+        self._add_case_id_on_phone(case_id)
         if case_id in self.dependent_case_ids_on_phone:
             self.dependent_case_ids_on_phone.remove(case_id)
 
@@ -862,7 +962,7 @@ class SimplifiedSyncLog(AbstractSyncLog):
             )
             if is_dependent:
                 _get_logger().debug('adding dependent case %s', case_id)
-                self.case_ids_on_phone.add(case_id)
+                self._add_case_id_on_phone(case_id)
                 self.dependent_case_ids_on_phone.add(case_id)
 
                 for update in non_live_updates_by_case_id[case_id]:
@@ -874,7 +974,7 @@ class SimplifiedSyncLog(AbstractSyncLog):
             for update in non_live_updates_by_case_id[case_id]:
                 if update.has_extension_indices_to_add():
                     # non-live cases with extension indices should be added and processed
-                    self.case_ids_on_phone.add(update.case_id)
+                    self._add_case_id_on_phone(update.case_id)
                     for index in update.indices_to_add:
                         self._add_index(index, update)
                     made_changes = True
@@ -969,6 +1069,8 @@ def get_properly_wrapped_sync_log(doc_id):
 
 
 def properly_wrap_sync_log(doc, synclog_sql=None):
+    if synclog_sql is not None and synclog_sql.doc_compact is not None:
+        doc = expand_sync_log_doc(doc, synclog_sql.doc_compact)
     synclog = SimplifiedSyncLog.wrap(doc)
     if synclog_sql:
         synclog._synclog_sql = synclog_sql
@@ -0,0 +1,161 @@
+"""
+Precompute restores for devices that are predicted to sync soon
+
+Many mobile workers sync at about the same time every day. Devices
+that synced during the upcoming window of the day on enough recent days
+get their next restore generated ahead of time. The payload is cached
+with ``RestorePayloadPathCache`` under the device's latest sync log, so
+the sync is served from the cache exactly like a cached async restore,
+and is invalidated the same way: by form submissions against that sync
+log or by ``invalidate_restore_cache``.
+
+A precomputed restore creates a sync log that the device does not know
+about until it fetches the payload. ``PrecomputedRestoreCache`` records
+it so that later precomputations for the device start from the sync log
+the device actually has.
+
+Fetching a cached payload does not create a sync log, so the sync log of
+a precomputed restore records when the device fetched it
+(``fetched_date``). Predictions use that time instead of the time it was
+precomputed, and ignore precomputed sync logs that were not fetched, so
+that precomputing does not move the predicted window.
+"""
+from datetime import datetime, timedelta
+
+from django.db.models import Count, Q
+from django.db.models.functions import Coalesce, TruncDate
+from django.http import Http404
+
+from casexml.apps.case.xml import V2
+from casexml.apps.phone.exceptions import RestoreException
+from casexml.apps.phone.models import SyncLogSQL
+from casexml.apps.phone.restore_caching import PrecomputedRestoreCache
+
+from corehq.apps.app_manager.dbaccessors import get_app_cached
+from corehq.apps.domain.models import Domain
+from corehq.apps.users.models import CouchUser
+from corehq.util.metrics import metrics_counter
+
+# a device is predicted to sync if it synced during the same time of
+# day on at least PRECOMPUTE_MIN_DAYS of the last PRECOMPUTE_HISTORY_DAYS
+PRECOMPUTE_HISTORY_DAYS = 7
+PRECOMPUTE_MIN_DAYS = 3
+
+# restores are precomputed PRECOMPUTE_LEAD before the start of the
+# PRECOMPUTE_WINDOW in which the device is predicted to sync
+PRECOMPUTE_LEAD = timedelta(minutes=30)
+PRECOMPUTE_WINDOW = timedelta(minutes=30)
+PRECOMPUTE_CACHE_TIMEOUT = int((PRECOMPUTE_LEAD + PRECOMPUTE_WINDOW * 2).total_seconds())
+
+
+def get_predicted_syncs(domain, now):
+    """Get devices predicted to sync in the window starting at ``now + PRECOMPUTE_LEAD``
+
+    :returns: List of ``(user_id, device_id)`` pairs.
+    """
+    start = now + PRECOMPUTE_LEAD
+    windows = Q()
+    for days in range(1, PRECOMPUTE_HISTORY_DAYS + 1):
+        window_start = start - timedelta(days=days)
+        windows |= Q(sync_date__gte=window_start, sync_date__lt=window_start + PRECOMPUTE_WINDOW)
+    return list(
+        SyncLogSQL.objects
+        .filter(domain=domain, device_id__isnull=False)
+        .exclude(is_formplayer=True)
+        .exclude(device_id__startswith='WebAppsLogin')
+        .exclude(is_precomputed=True, fetched_date__isnull=True)
+        .annotate(sync_date=Coalesce('fetched_date', 'date'))
+        .filter(windows)
+        .values('user_id', 'device_id')
+        .annotate(days=Count(TruncDate('sync_date'), distinct=True))
+        .filter(days__gte=PRECOMPUTE_MIN_DAYS)
+        .values_list('user_id', 'device_id')
+    )
+
+
+def precompute_restore(domain, user_id, device_id, now=None):
+    """Generate and cache the payload of the next sync of a device
+
+    :returns: True if a payload was generated.
+    """
+    from casexml.apps.phone.restore import (
+        RestoreCacheSettings,
+        RestoreConfig,
+        RestoreParams,
+    )
+    now = now or datetime.utcnow()
+    sync_log = _get_base_sync_log(domain, user_id, device_id)
+    if sync_log is None or sync_log.date > now - PRECOMPUTE_WINDOW:
+        return _skip(domain, 'no_recent_sync' if sync_log is None else 'synced_recently')
+
+    user = CouchUser.get_by_user_id(user_id, domain)
+    if not user or not user.is_active or not user.is_commcare_user() or user.is_demo_user:
+        return _skip(domain, 'user')
+    restore_user = user.to_ota_restore_user(domain)
+    if restore_user.loadtest_factor > 1:
+        return _skip(domain, 'user')
+
+    try:
+        app = get_app_cached(domain, sync_log.build_id) if sync_log.build_id else None
+    except Http404:
+        app = None
+    restore_config = RestoreConfig(
+        project=Domain.get_by_name(domain),
+        restore_user=restore_user,
+        params=RestoreParams(
+            sync_log_id=sync_log.synclog_id.hex,
+            version=V2,
+            include_item_count=True,
+            app=app,
+            device_id=device_id,
+        ),
+        cache_settings=RestoreCacheSettings(force_cache=True, cache_timeout=PRECOMPUTE_CACHE_TIMEOUT),
+    )
+    if restore_config.restore_payload_path_cache.exists():
+        return _skip(domain, 'cached')
+    try:
+        restore_config.validate()
+    except RestoreException:
+        return _skip(domain, 'invalid_state')
+
+    response = restore_config.generate_payload()
+    response.as_file().close()
+    sync_log_id = restore_config.restore_state.current_sync_log._id
+    SyncLogSQL.objects.filter(synclog_id=sync_log_id).update(is_precomputed=True)
+    PrecomputedRestoreCache(domain, user_id, device_id).set_value({
+        'base': sync_log.synclog_id.hex,
+        'sync_log_id': sync_log_id,
+    })
+    metrics_counter('commcare.restore.precompute', tags={'domain': domain, 'result': 'generated'})
+    return True
+
+
+def claim_precomputed_restore(domain, user_id, device_id, sync_log_id):
+    """Record that a device fetched a cached payload for ``sync_log_id``
+
+    If it was precomputed, the sync log it created is now on the device,
+    and the device synced now rather than when it was precomputed.
+    """
+    cache = PrecomputedRestoreCache(domain, user_id, device_id or '')
+    precomputed = cache.get_value()
+    if precomputed and precomputed['base'] == sync_log_id:
+        SyncLogSQL.objects.filter(
+            synclog_id=precomputed['sync_log_id'],
+        ).update(fetched_date=datetime.utcnow())
+        cache.invalidate()
+        metrics_counter('commcare.restore.precompute.used', tags={'domain': domain})
+
+
+def _get_base_sync_log(domain, user_id, device_id):
+    """Get the latest sync log of the device, ignoring an unfetched precomputed one"""
+    sync_logs = SyncLogSQL.objects.filter(domain=domain, user_id=user_id, device_id=device_id)
+    sync_log = sync_logs.order_by('-date').first()
+    precomputed = PrecomputedRestoreCache(domain, user_id, device_id).get_value()
+    if sync_log is not None and precomputed and precomputed['sync_log_id'] == sync_log.synclog_id.hex:
+        sync_log = sync_logs.filter(synclog_id=precomputed['base']).first()
+    return sync_log
+
+
+def _skip(domain, reason):
+    metrics_counter('commcare.restore.precompute', tags={'domain': domain, 'result': reason})
+    return False
@@ -1,8 +1,11 @@
+import io
 import logging
 import os
 import shutil
 import tempfile
 import uuid
+from contextlib import contextmanager
+from copy import copy
 from datetime import datetime, timedelta
 from io import BytesIO
 from typing import Optional
@@ -17,7 +20,7 @@ from couchforms.openrosa_response import (
     get_response_element,
     get_simple_response_xml,
 )
-from dimagi.utils.logging import notify_error
+from dimagi.utils.logging import notify_error, notify_exception
 from django.conf import settings
 from django.http import HttpResponse, StreamingHttpResponse
 from django.utils.text import slugify
@@ -31,7 +34,13 @@ from corehq.blobs import CODES, get_blob_db
 from corehq.blobs.exceptions import NotFound
 from corehq.celery_monitoring.signals import CELERY_STATE_SENT
 from corehq.const import LOADTEST_HARD_LIMIT
-from corehq.toggles import EXTENSION_CASES_SYNC_ENABLED
+from corehq.toggles import (
+    EXTENSION_CASES_SYNC_ENABLED,
+    NAMESPACE_DOMAIN,
+    NAMESPACE_USER,
+    PRECOMPUTE_RESTORES,
+    RESTORE_PROFILING,
+)
 from corehq.util.metrics import limit_domains, metrics_counter, metrics_histogram
 from corehq.util.timer import TimingContext
 
@@ -41,6 +50,7 @@ from .const import (
     INITIAL_ASYNC_TIMEOUT_THRESHOLD,
     INITIAL_SYNC_CACHE_THRESHOLD,
     INITIAL_SYNC_CACHE_TIMEOUT,
+    SLOW_RESTORE_THRESHOLD,
 )
 from .data_providers.case.livequery import do_livequery
 from .exceptions import (
@@ -56,9 +66,14 @@ from .models import (
     SimplifiedSyncLog,
     get_properly_wrapped_sync_log,
 )
-from .restore_caching import AsyncRestoreTaskIdCache, RestorePayloadPathCache
+from .precompute import claim_precomputed_restore
+from .restore_caching import (
+    AsyncRestoreTaskIdCache,
+    RestorePayloadPathCache,
+    RestoreProfileCache,
+)
 from .tasks import get_async_restore_payload
-from .utils import get_cached_items_with_count
+from .utils import ITEMS_COMMENT_PREFIX, get_cached_items_with_count
 from .xml import (
     get_progress_element,
     get_registration_element,
@@ -121,7 +136,8 @@ class RestoreContent(object):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.response_body.close()
+        if self.response_body is not None:
+            self.response_body.close()
 
     def append(self, xml_element):
         self.num_items += 1
@@ -136,31 +152,118 @@ class RestoreContent(object):
         for element in iterable:
             self.append(element)
 
-    def _write_to_file(self, fileobj):
+    @property
+    def num_bytes(self):
+        """Number of body bytes written so far"""
+        return self.response_body.tell() if self.response_body is not None else 0
+
+    def append_file(self, fileobj):
+        """Append XML elements read from a file
+
+        The file may start with an item count as described in
+        `get_cached_items_with_count`.
+        """
+        # long enough for the item count comment
+        head, num = get_cached_items_with_count(fileobj.read(64))
+        self.num_items += num
+        self.response_body.write(head)
+        shutil.copyfileobj(fileobj, self.response_body)
+
+    def get_items_fileobj(self):
+        """Get the body prefixed with its item count
+
+        The result can be passed to `append_file`. Like `get_fileobj`
+        this takes ownership of the body and may only be called once.
+        """
+        prefix = ITEMS_COMMENT_PREFIX + str(self.num_items).encode('utf-8') + b'-->'
+        body, self.response_body = self.response_body, None
+        try:
+            return RestorePayloadFile(prefix, body, b'')
+        except:  # noqa
+            body.close()
+            raise
+
+    def get_fileobj(self):
+        """Get the complete response as a file-like object
+
+        The body is not copied: the returned file reads the start tag,
+        the body and the closing tag in sequence. It takes ownership of
+        the body, so this may only be called once.
+        """
         # Add 1 to num_items to account for message element
         items = (self.items_template % ('%s' % (self.num_items + 1)).encode('utf-8')) if self.items else b''
-        fileobj.write(self.start_tag_template % {
+        start_tag = self.start_tag_template % {
             b"items": items,
             b"username": self.username.encode("utf8"),
             b"nature": ResponseNature.OTA_RESTORE_SUCCESS.encode("utf8"),
-        })
-
-        self.response_body.seek(0)
-        shutil.copyfileobj(self.response_body, fileobj)
-
-        fileobj.write(self.closing_tag)
-
-    def get_fileobj(self):
-        fileobj = tempfile.TemporaryFile('w+b')
+        }
+        body, self.response_body = self.response_body, None
         try:
-            self._write_to_file(fileobj)
-            fileobj.seek(0)
-            return fileobj
+            return RestorePayloadFile(start_tag, body, self.closing_tag)
         except:  # noqa
-            fileobj.close()
+            body.close()
             raise
 
 
+class RestorePayloadFile(io.RawIOBase):
+    """Read-only, seekable file presenting several files as one
+
+    :param head: Bytes to be read before `body`.
+    :param body: A seekable binary file. It will be closed when this
+    file is closed.
+    :param tail: Bytes to be read after `body`.
+    """
+
+    def __init__(self, head, body, tail):
+        body.seek(0, os.SEEK_END)
+        self._parts = [
+            (BytesIO(head), len(head)),
+            (body, body.tell()),
+            (BytesIO(tail), len(tail)),
+        ]
+        self._size = sum(size for part, size in self._parts)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position {}".format(offset))
+        self._pos = offset
+        return offset
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)
+        total = 0
+        start = 0
+        for part, size in self._parts:
+            end = start + size
+            if self._pos < end and total < len(view):
+                part.seek(self._pos - start)
+                num = part.readinto(view[total:total + end - self._pos])
+                self._pos += num
+                total += num
+            start = end
+        return total
+
+    def close(self):
+        if not self.closed:
+            for part, size in self._parts:
+                part.close()
+        super().close()
+
+
 class RestoreResponse(object):
 
     def __init__(self, fileobj):
@@ -439,6 +542,21 @@ class RestoreState:
     def is_initial(self):
         return self.last_sync_log is None
 
+    def copy_for_thread(self, timing_context):
+        """Get a copy of this state for a data provider run in another thread
+
+        The lazily loaded values that the copies share are loaded first so
+        that threads do not load and set them concurrently. The copy has its
+        own timing context since the timer stack is not thread safe.
+        """
+        self.last_sync_log
+        self.owner_ids
+        self.stock_settings
+        self.restore_user.project
+        state = copy(self)
+        state.timing_context = timing_context
+        return state
+
     @property
     def version(self):
         return self.params.version
@@ -623,6 +741,9 @@ class RestoreConfig(object):
         }
         if cached_response:
             metrics_counter('commcare.restores.cache_hits.count', tags=tags)
+            if self.sync_log and PRECOMPUTE_RESTORES.enabled(self.domain, namespace=NAMESPACE_DOMAIN):
+                claim_precomputed_restore(
+                    self.domain, self.restore_user.user_id, self.params.device_id, self.sync_log._id)
             return cached_response
         metrics_counter('commcare.restores.cache_misses.count', tags=tags)
 
@@ -726,22 +847,38 @@ class RestoreConfig(object):
         username = self.restore_user.username
         count_items = self.params.include_item_count
         with RestoreContent(username, count_items) as content:
-            with self.timing_context('SyncElementProvider'):
+            with self._provider_timing('SyncElementProvider', content):
                 content.append(get_sync_element(self.restore_state.current_sync_log._id))
 
-            with self.timing_context('RegistrationElementProvider'):
+            with self._provider_timing('RegistrationElementProvider', content):
                 content.append(get_registration_element(self.restore_state.restore_user))
 
             if not self.skip_fixtures:
-                with self.timing_context('FixtureElementProvider'):
+                with self._provider_timing('FixtureElementProvider', content):
                     for element in get_fixture_elements(self.restore_state, self.timing_context):
-                        content.append(element)
+                        # counted on the timer of the fixture provider that yielded it
+                        with self._count_content(content):
+                            content.append(element)
 
-            with self.timing_context('CasePayloadProvider'):
+            with self._provider_timing('CasePayloadProvider', content):
                 do_livequery(self.timing_context, self.restore_state, content, async_task)
 
             return content.get_fileobj()
 
+    @contextmanager
+    def _provider_timing(self, name, content):
+        with self.timing_context(name), self._count_content(content):
+            yield
+
+    @contextmanager
+    def _count_content(self, content):
+        """Add items and bytes appended to content to the current timer"""
+        num_items = content.num_items
+        num_bytes = content.num_bytes
+        yield
+        self.timing_context.add_count('items', content.num_items - num_items)
+        self.timing_context.add_count('bytes', content.num_bytes - num_bytes)
+
     def set_cached_payload_if_necessary(self, fileobj, duration, is_async):
         # must cache if the duration was longer than the threshold
         is_long_restore = duration > timedelta(seconds=INITIAL_SYNC_CACHE_THRESHOLD)
@@ -785,7 +922,9 @@ class RestoreConfig(object):
         timing = self.timing_context
         assert timing.is_finished()
         duration = timing.duration
-        if duration > 20 or status == 412:
+        if self._should_save_profile(duration):
+            self._save_profile(status)
+        if duration > SLOW_RESTORE_THRESHOLD or status == 412:
             if status == 412:
                 # use last sync log since there is no current sync log
                 sync_log_id = self.params.sync_log_id or 'N/A'
@@ -841,6 +980,31 @@ class RestoreConfig(object):
             tags=tags
         )
 
+    def _should_save_profile(self, duration):
+        return (
+            duration > SLOW_RESTORE_THRESHOLD
+            or RESTORE_PROFILING.enabled(self.domain, namespace=NAMESPACE_DOMAIN)
+            or RESTORE_PROFILING.enabled(self.restore_user.username, namespace=NAMESPACE_USER)
+        )
+
+    def _save_profile(self, status):
+        sync_log = self.restore_state.current_sync_log
+        profile = {
+            'date': datetime.utcnow().isoformat(),
+            'status_code': status,
+            'sync_log_id': sync_log._id if sync_log else None,
+            'since': self.params.sync_log_id or None,
+            'device_id': self.params.device_id,
+            'app_id': self.params.app_id,
+            'is_async': bool(self.is_async),
+            'duration': self.timing_context.duration,
+            'timing': self.timing_context.to_dict(),
+        }
+        try:
+            RestoreProfileCache(self.domain, self.restore_user.user_id).add_profile(profile)
+        except Exception:
+            notify_exception(None, "Could not save restore profile")
+
     def __repr__(self):
         return \
             "RestoreConfig(project='{}', domain={}, restore_user={}, cache_settings='{}', " \
@@ -8,7 +8,15 @@ from corehq import privileges
 from corehq.apps.accounting.utils import domain_has_privilege
 from corehq.util.quickcache import quickcache
 
-from .const import ASYNC_RESTORE_CACHE_KEY_PREFIX, RESTORE_CACHE_KEY_PREFIX
+from .const import (
+    ASYNC_RESTORE_CACHE_KEY_PREFIX,
+    CASE_XML_CACHE_KEY_PREFIX,
+    LIVE_CASE_GRAPH_CACHE_KEY_PREFIX,
+    PRECOMPUTED_RESTORE_CACHE_KEY_PREFIX,
+    RESTORE_CACHE_KEY_PREFIX,
+    RESTORE_PROFILE_CACHE_KEY_PREFIX,
+    SHARED_CASE_PAYLOAD_CACHE_KEY_PREFIX,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -101,3 +109,147 @@ class RestorePayloadPathCache(_RestoreCache):
 class AsyncRestoreTaskIdCache(_RestoreCache):
     timeout = 24 * 60 * 60
     prefix = ASYNC_RESTORE_CACHE_KEY_PREFIX
+
+
+class LiveCaseGraphCache(_CacheAccessor):
+    """Snapshot of the livequery case graph for a set of owner ids
+
+    Keyed by owner ids rather than user so users sharing a caseload
+    share a snapshot. Invalidated along with the domain restore cache.
+    """
+    timeout = 24 * 60 * 60
+
+    def __init__(self, domain, owner_ids):
+        self.cache_key = self._make_cache_key(domain, owner_ids)
+        self.debug_info = (self.__class__.__name__, domain, len(owner_ids))
+
+    @classmethod
+    def _make_cache_key(cls, domain, owner_ids):
+        hashable_key = ','.join([
+            domain,
+            LIVE_CASE_GRAPH_CACHE_KEY_PREFIX,
+            _get_domain_freshness_token(domain),
+        ] + sorted(owner_ids))
+        return hashlib.md5(hashable_key.encode('utf-8')).hexdigest()
+
+
+class SharedCasePayloadCache(_CacheAccessor):
+    """Blob name and case graph snapshot of the initial restore case
+    payload shared by users with the same owner ids
+    """
+    timeout = 24 * 60 * 60
+
+    def __init__(self, domain, owner_ids, version):
+        self.cache_key = self._make_cache_key(domain, owner_ids, version)
+        self.debug_info = (self.__class__.__name__, domain, len(owner_ids), version)
+
+    @classmethod
+    def _make_cache_key(cls, domain, owner_ids, version):
+        hashable_key = ','.join([
+            domain,
+            SHARED_CASE_PAYLOAD_CACHE_KEY_PREFIX,
+            version,
+            _get_domain_freshness_token(domain),
+        ] + sorted(owner_ids))
+        return hashlib.md5(hashable_key.encode('utf-8')).hexdigest()
+
+
+class RestoreProfileCache(_CacheAccessor):
+    """Timing profiles of the most recent profiled restores of a user
+
+    Not keyed by freshness token: profiles are diagnostic history and
+    should outlive restore cache invalidation.
+    """
+    timeout = 7 * 24 * 60 * 60
+    max_profiles = 20
+
+    def __init__(self, domain, user_id):
+        self.cache_key = self._make_cache_key(domain, user_id)
+        self.debug_info = (self.__class__.__name__, domain, user_id)
+
+    @classmethod
+    def _make_cache_key(cls, domain, user_id):
+        hashable_key = ','.join([domain, RESTORE_PROFILE_CACHE_KEY_PREFIX, user_id])
+        return hashlib.md5(hashable_key.encode('utf-8')).hexdigest()
+
+    def get_value(self):
+        """Get profiles, most recent first"""
+        return super().get_value() or []
+
+    def add_profile(self, profile):
+        profiles = [profile] + self.get_value()
+        self.set_value(profiles[:self.max_profiles])
+
+
+class PrecomputedRestoreCache(_CacheAccessor):
+    """The last restore precomputed for a device
+
+    Value is a dict ``{'base': <sync log id>, 'sync_log_id': <sync log id>}``
+    where ``base`` is the sync log the restore was precomputed from and
+    ``sync_log_id`` the sync log it created. Cleared when the device
+    fetches the precomputed payload.
+    """
+    timeout = 7 * 24 * 60 * 60
+
+    def __init__(self, domain, user_id, device_id):
+        self.cache_key = self._make_cache_key(domain, user_id, device_id)
+        self.debug_info = (self.__class__.__name__, domain, user_id, device_id)
+
+    @classmethod
+    def _make_cache_key(cls, domain, user_id, device_id):
+        hashable_key = ','.join([domain, PRECOMPUTED_RESTORE_CACHE_KEY_PREFIX, user_id, device_id])
+        return hashlib.md5(hashable_key.encode('utf-8')).hexdigest()
+
+
+class CaseXMLCache(object):
+    """Serialized case XML shared across restores
+
+    The XML for a case only depends on the case (including its indices
+    and attachments), the restore version and the updates being synced,
+    so it is keyed by the case's `server_modified_on` and reused by every
+    restore that syncs the same case until it is modified again.
+    """
+    timeout = 7 * 24 * 60 * 60
+
+    def __init__(self, domain, version, sync_attachments):
+        self.key_prefix = ','.join([
+            domain,
+            CASE_XML_CACHE_KEY_PREFIX,
+            _get_domain_freshness_token(domain),
+            version,
+            str(bool(sync_attachments)),
+        ])
+
+    def _make_cache_key(self, update):
+        hashable_key = ','.join([
+            self.key_prefix,
+            update.case.case_id,
+            update.case.server_modified_on.isoformat(),
+        ] + list(update.required_updates))
+        return hashlib.md5(hashable_key.encode('utf-8')).hexdigest()
+
+    def get_many(self, updates):
+        """Get cached XML for updates
+
+        :returns: Dict `{case_id: xml_bytes}` for updates that were found.
+        """
+        keys = {
+            self._make_cache_key(update): update.case.case_id
+            for update in updates
+            if update.case.server_modified_on is not None
+        }
+        cached = get_redis_default_cache().get_many(list(keys))
+        return {keys[key]: value for key, value in cached.items()}
+
+    def set_many(self, xml_by_update):
+        """Cache XML for updates
+
+        :param xml_by_update: Dict `{update: xml_bytes}`.
+        """
+        values = {
+            self._make_cache_key(update): xml
+            for update, xml in xml_by_update.items()
+            if update.case.server_modified_on is not None
+        }
+        if values:
+            get_redis_default_cache().set_many(values, timeout=self.timeout)
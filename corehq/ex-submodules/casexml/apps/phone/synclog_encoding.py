@@ -0,0 +1,211 @@
+"""
+Compact binary encoding of the case state held in a sync log document
+
+The case id sets and index trees of a ``SimplifiedSyncLog`` make up
+almost all of its JSON document, and every case id appears in it several
+times (on the phone, in the index trees, as an index target). The
+encoding stores each distinct case id once in a table, packing uuid
+formatted ids into 16 bytes, and refers to them by position elsewhere.
+Sets are stored as delta encoded sorted positions. The result is zlib
+compressed.
+
+Layout (all integers are unsigned varints)::
+
+    version byte
+    zlib(
+        hex uuid ids:    count, 16 bytes each
+        dashed uuid ids: count, 16 bytes each
+        other ids:       count, (length, utf-8 bytes) each
+        index names:     count, (length, utf-8 bytes) each
+        for each of SET_FIELDS:
+            count, position deltas
+        for each of TREE_FIELDS:
+            count, case position deltas
+            for each case: index count, (name position, case position) each
+    )
+"""
+import zlib
+
+COMPACT_FORMAT_VERSION = 1
+
+SET_FIELDS = ('case_ids_on_phone', 'dependent_case_ids_on_phone', 'closed_cases')
+TREE_FIELDS = ('index_tree', 'extension_index_tree')
+COMPACT_FIELDS = SET_FIELDS + TREE_FIELDS
+
+
+def compact_sync_log_doc(doc):
+    """Split a sync log document into a light JSON doc and compact case state
+
+    :param doc: Sync log JSON as returned by ``SimplifiedSyncLog.to_json()``.
+    :returns: Tuple ``(light_doc, data)`` where ``light_doc`` is ``doc``
+    without ``COMPACT_FIELDS`` and ``data`` is the encoded case state.
+    """
+    light_doc = {key: value for key, value in doc.items() if key not in COMPACT_FIELDS}
+    sets = [doc.get(field) or [] for field in SET_FIELDS]
+    trees = [_get_indices(doc.get(field)) for field in TREE_FIELDS]
+
+    case_ids = set()
+    index_names = set()
+    for case_set in sets:
+        case_ids.update(case_set)
+    for indices in trees:
+        for case_id, case_indices in indices.items():
+            case_ids.add(case_id)
+            case_ids.update(case_indices.values())
+            index_names.update(case_indices)
+
+    hex_ids, dashed_ids, other_ids = _partition_case_ids(case_ids)
+    table = hex_ids + dashed_ids + other_ids
+    positions = {case_id: i for i, case_id in enumerate(table)}
+    names = sorted(index_names)
+    name_positions = {name: i for i, name in enumerate(names)}
+
+    writer = _Writer()
+    writer.uint(len(hex_ids))
+    for case_id in hex_ids:
+        writer.raw(bytes.fromhex(case_id))
+    writer.uint(len(dashed_ids))
+    for case_id in dashed_ids:
+        writer.raw(bytes.fromhex(case_id.replace('-', '')))
+    writer.uint(len(other_ids))
+    for case_id in other_ids:
+        writer.string(case_id)
+    writer.uint(len(names))
+    for name in names:
+        writer.string(name)
+    for case_set in sets:
+        writer.ascending(sorted(positions[case_id] for case_id in case_set))
+    for indices in trees:
+        from_positions = sorted(positions[case_id] for case_id in indices)
+        writer.ascending(from_positions)
+        for from_position in from_positions:
+            case_indices = indices[table[from_position]]
+            writer.uint(len(case_indices))
+            for name in sorted(case_indices):
+                writer.uint(name_positions[name])
+                writer.uint(positions[case_indices[name]])
+
+    data = bytes([COMPACT_FORMAT_VERSION]) + zlib.compress(bytes(writer.buf))
+    return light_doc, data
+
+
+def expand_sync_log_doc(light_doc, data):
+    """Inverse of ``compact_sync_log_doc``
+
+    :returns: A new sync log document with ``COMPACT_FIELDS`` restored.
+    """
+    data = bytes(data)  # BinaryField values may be memoryview
+    if not data or data[0] != COMPACT_FORMAT_VERSION:
+        raise ValueError("Unknown compact sync log format: {!r}".format(data[:1]))
+    reader = _Reader(zlib.decompress(data[1:]))
+
+    table = [reader.raw(16).hex() for i in range(reader.uint())]
+    table.extend(_format_dashed(reader.raw(16).hex()) for i in range(reader.uint()))
+    table.extend(reader.string() for i in range(reader.uint()))
+    names = [reader.string() for i in range(reader.uint())]
+
+    doc = dict(light_doc)
+    for field in SET_FIELDS:
+        doc[field] = [table[position] for position in reader.ascending()]
+    for field in TREE_FIELDS:
+        indices = {}
+        for from_position in list(reader.ascending()):
+            indices[table[from_position]] = {
+                names[reader.uint()]: table[reader.uint()]
+                for i in range(reader.uint())
+            }
+        doc[field] = {'doc_type': 'IndexTree', 'indices': indices}
+    return doc
+
+
+def _get_indices(tree):
+    return (tree or {}).get('indices') or {}
+
+
+def _partition_case_ids(case_ids):
+    hex_ids = []
+    dashed_ids = []
+    other_ids = []
+    for case_id in case_ids:
+        if len(case_id) == 32 and _is_hex(case_id):
+            hex_ids.append(case_id)
+        elif len(case_id) == 36 and _is_hex(case_id.replace('-', '')) \
+                and _format_dashed(case_id.replace('-', '')) == case_id:
+            dashed_ids.append(case_id)
+        else:
+            other_ids.append(case_id)
+    return sorted(hex_ids), sorted(dashed_ids), sorted(other_ids)
+
+
+def _is_hex(value):
+    """Check that value round trips exactly through 16 packed bytes"""
+    try:
+        packed = bytes.fromhex(value)
+    except ValueError:
+        return False
+    return len(packed) == 16 and packed.hex() == value
+
+
+def _format_dashed(hex_id):
+    return '-'.join([hex_id[:8], hex_id[8:12], hex_id[12:16], hex_id[16:20], hex_id[20:]])
+
+
+class _Writer(object):
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def uint(self, value):
+        while value >= 0x80:
+            self.buf.append((value & 0x7f) | 0x80)
+            value >>= 7
+        self.buf.append(value)
+
+    def raw(self, value):
+        self.buf += value
+
+    def string(self, value):
+        value = value.encode('utf-8')
+        self.uint(len(value))
+        self.buf += value
+
+    def ascending(self, values):
+        self.uint(len(values))
+        previous = 0
+        for value in values:
+            self.uint(value - previous)
+            previous = value
+
+
+class _Reader(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def uint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.data[self.pos]
+            self.pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def raw(self, length):
+        value = self.data[self.pos:self.pos + length]
+        if len(value) != length:
+            raise ValueError("Truncated compact sync log")
+        self.pos += length
+        return value
+
+    def string(self):
+        return self.raw(self.uint()).decode('utf-8')
+
+    def ascending(self):
+        value = 0
+        for i in range(self.uint()):
+            value += self.uint()
+            yield value
@@ -1,4 +1,5 @@
 import logging
+import random
 from datetime import datetime, timedelta
 
 from django.conf import settings
@@ -44,6 +45,35 @@ def get_async_restore_payload(restore_config, domain=None, username=None):
     return response.name
 
 
+@periodic_task(
+    run_every=crontab(minute="*/30"),
+    queue=getattr(settings, 'CELERY_PERIODIC_QUEUE', 'celery')
+)
+def schedule_restore_precomputation():
+    """Queue precomputed restores for devices predicted to sync soon
+
+    Tasks are spread over the first half of the lead time so that the
+    precomputation does not become a spike of its own.
+    """
+    from casexml.apps.phone.precompute import PRECOMPUTE_LEAD, get_predicted_syncs
+    from corehq.toggles import PRECOMPUTE_RESTORES
+
+    now = datetime.utcnow()
+    spread = int(PRECOMPUTE_LEAD.total_seconds() / 2)
+    for domain in PRECOMPUTE_RESTORES.get_enabled_domains():
+        for user_id, device_id in get_predicted_syncs(domain, now):
+            precompute_restore_payload.apply_async(
+                args=[domain, user_id, device_id],
+                countdown=random.randint(0, spread),
+            )
+
+
+@task(queue='background_queue', ignore_result=True)
+def precompute_restore_payload(domain, user_id, device_id):
+    from casexml.apps.phone.precompute import precompute_restore
+    precompute_restore(domain, user_id, device_id)
+
+
 @periodic_task(
     run_every=crontab(hour="1", minute="0"),
     queue=getattr(settings, 'CELERY_PERIODIC_QUEUE', 'celery')
@@ -2,6 +2,7 @@ import json
 import os.path
 import re
 import uuid
+from datetime import timedelta
 from itertools import count
 from unittest import mock
 
@@ -10,8 +11,10 @@ from django.test import TestCase
 from corehq.tests.tools import nottest
 
 from casexml.apps.case.mock import CaseFactory, CaseIndex, CaseStructure
+from casexml.apps.phone.data_providers.case import livequery
 from casexml.apps.phone.data_providers.case.livequery import get_live_case_ids_and_indices
 from casexml.apps.phone.tests.test_sync_mode import BaseSyncTest
+from corehq.form_processor.models import CommCareCase
 from corehq.form_processor.tests.utils import sharded
 from corehq.util.test_utils import flag_enabled, softer_assert
 from corehq.util.timer import TimingContext
@@ -198,6 +201,84 @@ class ChunkedLiveQueryIndexTreeTest(IndexTreeTest):
     pass
 
 
+@flag_enabled('LIVEQUERY_CASE_GRAPH_CACHE')
+class CachedLiveQueryIndexTreeTest(IndexTreeTest):
+    pass
+
+
+@sharded
+@flag_enabled('LIVEQUERY_CASE_GRAPH_CACHE')
+@mock.patch.object(livequery, 'CASE_GRAPH_SNAPSHOT_MARGIN', timedelta(0))
+class LiveQueryCaseGraphCacheTest(BaseSyncTest):
+
+    def setUp(self):
+        super().setUp()
+        self.host_id = uuid.uuid4().hex
+        self.device.post_changes(case_id=self.host_id, create=True)
+
+    def test_unchanged_graph_is_not_walked_again(self):
+        self.device.sync(restore_id='')
+        with mock.patch.object(livequery, '_walk_case_graph', wraps=livequery._walk_case_graph) as walk:
+            sync = self.device.sync(restore_id='')
+        walk.assert_not_called()
+        self.assertEqual(set(sync.cases), {self.host_id})
+
+    def test_new_extension_of_live_case(self):
+        self.device.sync(restore_id='')
+        ext_id = self.create_extension(self.host_id)
+        sync = self.device.sync(restore_id='')
+        self.assertEqual(set(sync.cases), {self.host_id, ext_id})
+
+    def test_closed_case_is_not_synced(self):
+        self.device.sync(restore_id='')
+        CaseFactory(domain=self.project.name).close_case(self.host_id)
+        sync = self.device.sync(restore_id='')
+        self.assertEqual(set(sync.cases), set())
+
+    def test_deleted_case_is_not_synced(self):
+        ext_id = self.create_extension(self.host_id)
+        self.assertEqual(set(self.device.sync(restore_id='').cases), {self.host_id, ext_id})
+        CommCareCase.objects.soft_delete_cases(self.project.name, [ext_id])
+        sync = self.device.sync(restore_id='')
+        self.assertEqual(set(sync.cases), {self.host_id})
+
+    def test_hard_deleted_case_is_not_synced(self):
+        ext_id = self.create_extension(self.host_id)
+        self.assertEqual(set(self.device.sync(restore_id='').cases), {self.host_id, ext_id})
+        CommCareCase.objects.hard_delete_cases(self.project.name, [ext_id])
+        sync = self.device.sync(restore_id='')
+        self.assertEqual(set(sync.cases), {self.host_id})
+
+    def test_index_to_missing_case_does_not_make_graph_stale(self):
+        self.device.post_changes(CaseStructure(
+            case_id=self.host_id,
+            indices=[CaseIndex(
+                related_structure=CaseStructure(case_id=uuid.uuid4().hex),
+                identifier='parent',
+            )],
+            walk_related=False,
+        ))
+        self.device.sync(restore_id='')
+        with mock.patch.object(livequery, '_walk_case_graph', wraps=livequery._walk_case_graph) as walk:
+            sync = self.device.sync(restore_id='')
+        walk.assert_not_called()
+        self.assertEqual(set(sync.cases), {self.host_id})
+
+    def create_extension(self, host_id):
+        ext_id = uuid.uuid4().hex
+        CaseFactory(domain=self.project.name).create_or_update_case(CaseStructure(
+            case_id=ext_id,
+            attrs={'create': True, 'owner_id': uuid.uuid4().hex},
+            indices=[CaseIndex(
+                related_structure=CaseStructure(case_id=host_id),
+                relationship='extension',
+                identifier='host',
+            )],
+            walk_related=False,
+        ))
+        return ext_id
+
+
 class ChunkedLiveQueryDuplicateIndexTest(TestCase):
 
     domain = 'test-chunked-livequery-duplicate-index'
@@ -100,6 +100,38 @@ class TestExtendedFootprint(SimpleTestCase):
         self.assertEqual(set(all_ids), extension_dependencies)
 
 
+class ReverseIndexTest(SimpleTestCase):
+
+    def test_reverse_indices_follow_changes(self):
+        tree = IndexTree(indices={
+            'child': convert_list_to_dict(['parent']),
+        })
+        self.assertEqual(tree.get_cases_that_directly_depend_on_case('parent'), {'child'})
+
+        tree.set_index('child_2', 'parent', 'parent')
+        tree.set_index('child', '0', 'other_parent')
+        self.assertEqual(tree.get_cases_that_directly_depend_on_case('parent'), {'child_2'})
+        self.assertEqual(tree.get_cases_that_directly_depend_on_case('other_parent'), {'child'})
+
+        tree.delete_index('child_2', 'parent')
+        self.assertEqual(tree.get_cases_that_directly_depend_on_case('parent'), set())
+
+        tree.delete_case('child')
+        self.assertEqual(tree.get_cases_that_directly_depend_on_case('other_parent'), set())
+        self.assertNotIn('child', tree.indices)
+
+    def test_purge_updates_reverse_indices(self):
+        [parent_id, child_id] = all_ids = ['parent', 'child']
+        tree = IndexTree(indices={
+            child_id: convert_list_to_dict([parent_id]),
+        })
+        sync_log = SimplifiedSyncLog(index_tree=tree, case_ids_on_phone=set(all_ids))
+        self.assertEqual(tree.get_cases_that_directly_depend_on_case(parent_id), {child_id})
+        sync_log.purge(child_id)
+        self.assertEqual(sync_log.case_ids_on_phone, set())
+        self.assertEqual(sync_log.index_tree.get_cases_that_directly_depend_on_case(parent_id), set())
+
+
 class PurgingTest(SimpleTestCase):
 
     def test_purge_parent_then_child(self):
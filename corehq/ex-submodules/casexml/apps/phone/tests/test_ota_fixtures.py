@@ -1,5 +1,9 @@
-from django.test import TestCase
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 from corehq.blobs import get_blob_db
+from casexml.apps.phone.fixtures import _get_fixture_elements_concurrently
 from casexml.apps.phone.utils import MockDevice
 from corehq.apps.domain.models import Domain
 from corehq.apps.fixtures.models import (
@@ -14,6 +18,8 @@ from corehq.apps.fixtures.models import (
 from corehq.apps.groups.models import Group
 from corehq.apps.users.models import CommCareUser
 from corehq.form_processor.tests.utils import sharded
+from corehq.util.test_utils import flag_enabled
+from corehq.util.timer import TimingContext
 
 DOMAIN = 'fixture-test'
 SA_PROVINCES = 'sa_provinces'
@@ -63,6 +69,144 @@ class OtaFixtureTest(TestCase):
         self.assertNotIn('alberta', restore)  # user fixture (not owned)
 
 
+@sharded
+class ConcurrentFixtureCountsTest(TransactionTestCase):
+    """Concurrent providers query in their own threads and connections,
+    which only see committed data"""
+
+    def setUp(self):
+        super().setUp()
+        self.domain = Domain.get_or_create_with_name(DOMAIN, is_active=True)
+        self.addCleanup(self.domain.delete)
+        self.user = CommCareUser.create(DOMAIN, 'bob', 'mechanic', None, None)
+        self.addCleanup(self.user.delete, None, None)
+        group = Group(domain=DOMAIN, name='group1', case_sharing=True, users=[self.user._id])
+        group.save()
+        self.addCleanup(group.delete)
+
+        sa_data_type, _ = make_item_lists(SA_PROVINCES, 'western cape')
+        fr_data_type, _ = make_item_lists(FR_PROVINCES, 'burgundy', group)
+        self.addCleanup(get_blob_db().delete, key=fixture_bucket(sa_data_type.id, DOMAIN))
+        self.addCleanup(get_blob_db().delete, key=fixture_bucket(fr_data_type.id, DOMAIN))
+
+        self.restore_user = self.user.to_ota_restore_user(DOMAIN)
+
+    def test_fixture_counts_with_concurrent_providers(self):
+        def get_fixture_counts():
+            config = MockDevice(self.domain, self.restore_user).get_restore_config()
+            config.get_payload()
+            providers = {timer['name']: timer for timer in config.timing_context.to_dict()['subs']}
+            fixtures = providers['FixtureElementProvider']
+            return fixtures['counts'], {timer['name']: timer.get('counts', {}) for timer in fixtures['subs']}
+
+        counts, fixture_counts = get_fixture_counts()
+        self.assertGreater(counts['items'], 0)
+        self.assertEqual(counts['items'], sum(c.get('items', 0) for c in fixture_counts.values()))
+        with flag_enabled('PARALLEL_RESTORE_FIXTURES'):
+            self.assertEqual(get_fixture_counts(), (counts, fixture_counts))
+
+
+class ConcurrentFixtureProvidersTest(SimpleTestCase):
+
+    def test_elements_in_provider_order(self):
+        providers = [
+            FakeProvider('slow', ['a', 'b'], delay=0.05),
+            FakeProvider('empty', []),
+            FakeProvider('fast', ['c']),
+        ]
+        timing = TimingContext('restore')
+        with timing:
+            elements = list(_get_fixture_elements_concurrently(providers, FakeRestoreState(), timing))
+        self.assertEqual(elements, ['a', 'b', 'c'])
+        self.assertEqual(
+            [timer.name for timer in timing.to_list(exclude_root=True)],
+            ['fixture:slow', 'fixture:empty', 'fixture:fast'],
+        )
+
+    def test_provider_error(self):
+        providers = [FakeProvider('ok', ['a']), FakeProvider('broken', ValueError('boom'))]
+        timing = TimingContext('restore')
+        with self.assertRaisesMessage(ValueError, 'boom'), timing:
+            list(_get_fixture_elements_concurrently(providers, FakeRestoreState(), timing))
+
+    def test_elements_counted_on_provider_timer(self):
+        providers = [FakeProvider('slow', ['a', 'b'], delay=0.05), FakeProvider('fast', ['c'])]
+        timing = TimingContext('restore')
+        with timing:
+            for element in _get_fixture_elements_concurrently(providers, FakeRestoreState(), timing):
+                timing.add_count('items')
+        self.assertEqual(
+            [(timer.name, timer.counts) for timer in timing.to_list()],
+            [('restore', {}), ('fixture:slow', {'items': 2}), ('fixture:fast', {'items': 1})],
+        )
+
+    def test_each_provider_has_its_own_restore_state(self):
+        providers = [FakeProvider('one', ['a']), FakeProvider('two', ['b'])]
+        timing = TimingContext('restore')
+        with timing:
+            list(_get_fixture_elements_concurrently(providers, FakeRestoreState(), timing))
+        one, two = [provider.restore_state for provider in providers]
+        self.assertIsNot(one, two)
+        self.assertEqual(one.timing_context.root.name, 'fixture:one')
+        self.assertEqual(two.timing_context.root.name, 'fixture:two')
+
+    @patch('casexml.apps.phone.fixtures.FIXTURE_PROVIDER_QUEUE_SIZE', 2)
+    def test_providers_do_not_run_ahead(self):
+        ahead = FakeProvider('ahead', [str(i) for i in range(10)])
+        providers = [FakeProvider('first', ['a', 'b']), ahead]
+        timing = TimingContext('restore')
+        with timing:
+            elements = _get_fixture_elements_concurrently(providers, FakeRestoreState(), timing)
+            self.assertEqual(next(elements), 'a')
+            time.sleep(0.2)
+            # two queued and one waiting to be queued
+            self.assertLessEqual(ahead.num_generated, 3)
+            self.assertEqual(list(elements), ['b'] + [str(i) for i in range(10)])
+
+    @patch('casexml.apps.phone.fixtures.FIXTURE_PROVIDER_QUEUE_SIZE', 2)
+    def test_close_stops_providers(self):
+        ahead = FakeProvider('ahead', [str(i) for i in range(10)])
+        providers = [FakeProvider('first', ['a', 'b']), ahead]
+        timing = TimingContext('restore')
+        with timing:
+            elements = _get_fixture_elements_concurrently(providers, FakeRestoreState(), timing)
+            self.assertEqual(next(elements), 'a')
+            elements.close()
+        self.assertLessEqual(ahead.num_generated, 3)
+
+
+class FakeProvider(object):
+
+    def __init__(self, id, elements, delay=0):
+        self.id = id
+        self.elements = elements
+        self.delay = delay
+        self.restore_state = None
+        self.num_generated = 0
+
+    def __call__(self, restore_state):
+        self.restore_state = restore_state
+        time.sleep(self.delay)
+        if isinstance(self.elements, Exception):
+            raise self.elements
+        return self._generate()
+
+    def _generate(self):
+        for element in self.elements:
+            self.num_generated += 1
+            yield element
+
+
+class FakeRestoreState(object):
+
+    timing_context = None
+
+    def copy_for_thread(self, timing_context):
+        state = FakeRestoreState()
+        state.timing_context = timing_context
+        return state
+
+
 def make_item_lists(tag, item_name, group=None):
     data_type = LookupTable(
         domain=DOMAIN,
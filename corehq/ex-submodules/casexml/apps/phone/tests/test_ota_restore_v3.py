@@ -1,3 +1,5 @@
+import os
+
 from django.test import TestCase
 from django.test.testcases import SimpleTestCase
 from corehq.apps.users.dbaccessors import delete_all_users
@@ -8,8 +10,10 @@ from casexml.apps.case.tests.util import (
 )
 from casexml.apps.case.mock import CaseBlock
 from casexml.apps.phone.restore import RestoreContent
+from casexml.apps.phone.restore_caching import RestoreProfileCache
 from casexml.apps.phone.tests.utils import create_restore_user
 from casexml.apps.phone.utils import MockDevice
+from corehq.util.test_utils import flag_enabled
 
 
 class OtaV3RestoreTest(TestCase):
@@ -40,6 +44,35 @@ class OtaV3RestoreTest(TestCase):
         ))
         self.assertIn(case_id, device.sync().cases)
 
+    @flag_enabled('RESTORE_PROFILING')
+    def test_restore_profile(self):
+        restore_user = create_restore_user(domain=self.domain)
+        profiles = RestoreProfileCache(self.domain, restore_user.user_id)
+        self.addCleanup(profiles.invalidate)
+        device = MockDevice(self.project, restore_user)
+        device.change_cases(CaseBlock(
+            create=True,
+            case_id='my-case-id',
+            user_id=restore_user.user_id,
+            owner_id=restore_user.user_id,
+            case_type='test-case-type',
+        ))
+        device.post_changes()
+
+        response = device.get_restore_config().get_response()
+        self.assertEqual(response.status_code, 200)
+
+        [profile] = profiles.get_value()
+        self.assertEqual(profile['status_code'], 200)
+        self.assertEqual(profile['device_id'], device.id)
+        providers = {timer['name']: timer for timer in profile['timing']['subs']}
+        case_counts = providers['CasePayloadProvider']['counts']
+        self.assertEqual(case_counts['items'], 1)
+        self.assertGreater(case_counts['bytes'], 0)
+        [livequery] = providers['CasePayloadProvider']['subs']
+        self.assertEqual(livequery['counts']['live_cases'], 1)
+        self.assertEqual(livequery['counts']['synced_cases'], 1)
+
 
 class TestRestoreContent(SimpleTestCase):
 
@@ -73,3 +106,16 @@ class TestRestoreContent(SimpleTestCase):
             response.append(body.encode('utf-8'))
             with response.get_fileobj() as fileobj:
                 self.assertEqual(expected, fileobj.read().decode('utf-8'))
+
+    def test_fileobj_outlives_content(self):
+        user = 'user1'
+        body = '<elem>data0</elem>'
+        expected = self._expected(user, body, items=None).encode('utf-8')
+        with RestoreContent(user, False) as response:
+            response.append(body.encode('utf-8'))
+            fileobj = response.get_fileobj()
+        with fileobj:
+            fileobj.seek(0, os.SEEK_END)
+            self.assertEqual(fileobj.tell(), len(expected))
+            fileobj.seek(len(expected) - len(body) - 25)
+            self.assertEqual(fileobj.read(), expected[-len(body) - 25:])
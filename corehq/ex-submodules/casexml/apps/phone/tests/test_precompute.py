@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from casexml.apps.case.tests.util import delete_all_sync_logs
+from casexml.apps.phone.models import SyncLogSQL
+from casexml.apps.phone.precompute import (
+    PRECOMPUTE_LEAD,
+    get_predicted_syncs,
+    precompute_restore,
+)
+from casexml.apps.phone.restore_caching import PrecomputedRestoreCache
+from casexml.apps.phone.tests.utils import create_restore_user
+from casexml.apps.phone.utils import MockDevice
+from corehq.apps.domain.models import Domain
+from corehq.apps.users.dbaccessors import delete_all_users
+from corehq.util.test_utils import flag_enabled
+
+
+class PrecomputeRestoreTest(TestCase):
+
+    def setUp(self):
+        self.domain = 'precompute-restore'
+        self.project = Domain(name=self.domain)
+        self.project.save()
+        self.addCleanup(self.project.delete)
+        self.addCleanup(delete_all_users)
+        self.addCleanup(delete_all_sync_logs)
+        self.user = create_restore_user(domain=self.domain)
+
+    def test_get_predicted_syncs(self):
+        device = MockDevice(self.project, self.user)
+        other = MockDevice(self.project, self.user)
+        now = datetime.utcnow()
+        sync_time = now + PRECOMPUTE_LEAD + timedelta(minutes=10)
+        for days in [1, 2, 4]:
+            self._sync_at(device, sync_time - timedelta(days=days))
+        for days in [1, 3]:
+            self._sync_at(other, sync_time - timedelta(days=days))
+        self._sync_at(other, sync_time - timedelta(days=2, hours=2))
+
+        self.assertEqual(get_predicted_syncs(self.domain, now), [(self.user.user_id, device.id)])
+
+    def test_predicted_syncs_use_fetch_time_of_precomputed_restores(self):
+        device = MockDevice(self.project, self.user)
+        now = datetime.utcnow()
+        sync_time = now + PRECOMPUTE_LEAD + timedelta(minutes=10)
+        for days in [1, 2, 3]:
+            self._sync_at(device, sync_time - timedelta(days=days), is_precomputed=True)
+        # not fetched by the device
+        self.assertEqual(get_predicted_syncs(self.domain, now), [])
+
+        # precomputed an hour before the device fetched them
+        for sync_log in SyncLogSQL.objects.filter(device_id=device.id):
+            sync_log.fetched_date = sync_log.date
+            sync_log.date -= timedelta(hours=1)
+            sync_log.save()
+        self.assertEqual(get_predicted_syncs(self.domain, now), [(self.user.user_id, device.id)])
+
+    @flag_enabled('PRECOMPUTE_RESTORES')
+    def test_precomputed_restore_is_served_from_cache(self):
+        device = MockDevice(self.project, self.user)
+        device.change_cases(create=True, case_id='first')
+        device.sync()
+        self.assertFalse(precompute_restore(self.domain, self.user.user_id, device.id))
+
+        other = MockDevice(self.project, self.user)
+        other.change_cases(create=True, case_id='second')
+        other.post_changes()
+        later = datetime.utcnow() + timedelta(hours=1)
+        self.assertTrue(precompute_restore(self.domain, self.user.user_id, device.id, now=later))
+        precomputed = PrecomputedRestoreCache(self.domain, self.user.user_id, device.id).get_value()
+        self.assertEqual(precomputed['base'], device.last_sync.restore_id)
+        # precompute again from the sync log the device has, not the unfetched one
+        self.assertFalse(precompute_restore(self.domain, self.user.user_id, device.id, now=later))
+
+        sync = device.sync()
+        self.assertIn('second', sync.cases)
+        self.assertEqual(sync.restore_id, precomputed['sync_log_id'])
+        self.assertIsNone(PrecomputedRestoreCache(self.domain, self.user.user_id, device.id).get_value())
+        sync_log = SyncLogSQL.objects.get(synclog_id=sync.restore_id)
+        self.assertTrue(sync_log.is_precomputed)
+        self.assertIsNotNone(sync_log.fetched_date)
+
+    @staticmethod
+    def _sync_at(device, date, **fields):
+        device.sync()
+        SyncLogSQL.objects.filter(synclog_id=device.last_sync.restore_id).update(date=date, **fields)
@@ -1,13 +1,15 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from casexml.apps.case.mock import CaseBlock
-from casexml.apps.phone.checksum import EMPTY_HASH, CaseStateHash
+from casexml.apps.phone.checksum import EMPTY_HASH, CaseStateHash, Checksum
 from casexml.apps.case.xml import V1
 from casexml.apps.case.tests.util import delete_all_sync_logs, delete_all_xforms, delete_all_cases
 from casexml.apps.phone.exceptions import BadStateException
+from casexml.apps.phone.models import SimplifiedSyncLog
 from casexml.apps.phone.tests.utils import create_restore_user
 from casexml.apps.phone.utils import MockDevice
 from corehq.apps.domain.models import Domain
 from corehq.apps.users.dbaccessors import delete_all_users
+from corehq.form_processor.models import CommCareCaseIndex
 from corehq.form_processor.tests.utils import sharded
 
 
@@ -92,3 +94,52 @@ class StateHashTest(TestCase):
         self.device.id = 'WebAppsLogin'
         self.device.sync(state_hash=str(bad_hash))
         self.assertEqual(set(self.device.last_sync.cases), {"abc123", "123abc"})
+
+
+class IncrementalStateHashTest(SimpleTestCase):
+
+    def test_set_case_ids_on_phone(self):
+        sync_log = SimplifiedSyncLog()
+        sync_log.set_case_ids_on_phone({'a', 'b', 'c'})
+        self.assertEqual(sync_log.case_ids_hash, Checksum(['a', 'b', 'c']).hexdigest())
+
+    def test_set_case_ids_on_phone_from_previous_sync_log(self):
+        previous = SimplifiedSyncLog()
+        previous.set_case_ids_on_phone({'a', 'b', 'c'})
+        sync_log = SimplifiedSyncLog()
+        sync_log.set_case_ids_on_phone({'b', 'c', 'd'}, previous)
+        self.assertEqual(sync_log.get_state_hash(), CaseStateHash(Checksum(['b', 'c', 'd']).hexdigest()))
+
+    def test_set_case_ids_on_phone_with_indices(self):
+        sync_log = SimplifiedSyncLog()
+        sync_log.index_tree.set_index('old', 'parent', 'a')
+        sync_log.set_case_ids_on_phone({'a', 'b', 'c'}, indices={
+            'b': [CommCareCaseIndex(case_id='b', identifier='parent', referenced_id='a',
+                                    relationship_id=CommCareCaseIndex.CHILD)],
+            'c': [
+                CommCareCaseIndex(case_id='c', identifier='host', referenced_id='b',
+                                  relationship_id=CommCareCaseIndex.EXTENSION),
+                CommCareCaseIndex(case_id='c', identifier='removed', referenced_id=''),
+            ],
+            'gone': [CommCareCaseIndex(case_id='gone', identifier='parent', referenced_id='a')],
+        })
+        self.assertEqual(sync_log.index_tree.indices, {'b': {'parent': 'a'}})
+        self.assertEqual(sync_log.extension_index_tree.indices, {'c': {'host': 'b'}})
+
+    def test_hash_follows_added_and_purged_cases(self):
+        sync_log = SimplifiedSyncLog(case_ids_on_phone={'a', 'b'}, dependent_case_ids_on_phone={'b'})
+        sync_log.get_state_hash()
+        sync_log._add_primary_case('c')
+        sync_log.purge('b')
+        self.assertEqual(sync_log.case_ids_on_phone, {'a', 'c'})
+        self.assertEqual(sync_log.case_ids_hash, Checksum(['a', 'c']).hexdigest())
+        sync_log.purge('a')
+        sync_log.purge('c')
+        self.assertEqual(sync_log.get_state_hash(), CaseStateHash(EMPTY_HASH))
+
+    def test_assigning_case_ids_resets_hash(self):
+        sync_log = SimplifiedSyncLog()
+        sync_log.set_case_ids_on_phone({'a'})
+        sync_log.case_ids_on_phone = {'b'}
+        self.assertIsNone(sync_log.case_ids_hash)
+        self.assertEqual(sync_log.get_state_hash(), CaseStateHash(Checksum(['b']).hexdigest()))
@@ -1,6 +1,6 @@
 import os
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest.mock import patch
 from xml.etree import cElementTree as ElementTree
 
@@ -14,7 +14,8 @@ from casexml.apps.case.mock import (
     CaseStructure,
 )
 from casexml.apps.case.tests.util import TEST_DOMAIN_NAME
-from casexml.apps.case.xml import V1, V2
+from casexml.apps.case.xml import V1, V2, V2_NAMESPACE
+from casexml.apps.phone.data_providers.case import livequery
 from casexml.apps.phone.exceptions import RestoreException
 from casexml.apps.phone.models import (
     LOG_FORMAT_LIVEQUERY,
@@ -2045,3 +2046,66 @@ class TestUpdatesToSynclog(BaseSyncTest):
         result = self.device.sync()
         self.assertNotIn("host", result.cases)
         self.assertNotIn("claim", result.cases)
+
+
+@sharded
+@flag_enabled('RESTORE_CASE_XML_CACHE')
+class CaseXMLCacheSyncTest(BaseSyncTest):
+
+    def test_cached_case_xml_is_reused(self):
+        case_id = uuid.uuid4().hex
+        self.device.post_changes(case_id=case_id, create=True, update={"greeting": "Hello!"})
+        first = self.device.sync(restore_id='')
+        with patch('casexml.apps.phone.data_providers.case.livequery.get_xml_for_response') as get_xml:
+            second = self.device.sync(restore_id='')
+        get_xml.assert_not_called()
+        self.assertEqual(
+            ElementTree.tostring(first.xml.find('{%s}case' % V2_NAMESPACE)),
+            ElementTree.tostring(second.xml.find('{%s}case' % V2_NAMESPACE)),
+        )
+
+    def test_modified_case_is_not_served_from_cache(self):
+        case_id = uuid.uuid4().hex
+        self.device.post_changes(case_id=case_id, create=True, update={"greeting": "Hello!"})
+        self.device.sync(restore_id='')
+        self.device.post_changes(case_id=case_id, update={"greeting": "Goodbye!"})
+        sync = self.device.sync(restore_id='')
+        self.assertEqual(sync.cases[case_id].update, {"greeting": "Goodbye!"})
+
+
+@flag_enabled('SHARED_RESTORE_CASE_PAYLOAD')
+class SharedCasePayloadMultiUserSyncTest(MultiUserSyncTest):
+
+    @patch('casexml.apps.phone.data_providers.case.livequery.CASE_GRAPH_SNAPSHOT_MARGIN', timedelta(0))
+    def test_shared_case_payload_is_reused(self):
+        shared_id = uuid.uuid4().hex
+        own_id = uuid.uuid4().hex
+        self.guy.post_changes(case_id=shared_id, create=True)
+        self.ferrel.post_changes(case_id=own_id, create=True, owner_id=self.other_user.user_id)
+        self.assertEqual(set(self.guy.sync(restore_id='').cases), {shared_id})
+
+        with patch('casexml.apps.phone.data_providers.case.livequery._walk_case_graph',
+                   wraps=livequery._walk_case_graph) as walk:
+            sync = self.ferrel.sync(restore_id='')
+        self.assertEqual(set(sync.cases), {shared_id, own_id})
+        # only the cases owned by the user are walked
+        walk.assert_called_once()
+        self.assertEqual(sync.log.case_ids_on_phone, {shared_id, own_id})
+        self.assertEqual(sync.log.dependent_case_ids_on_phone, set())
+
+    @patch('casexml.apps.phone.data_providers.case.livequery.CASE_GRAPH_SNAPSHOT_MARGIN', timedelta(0))
+    def test_shared_case_payload_indices(self):
+        parent = CaseStructure(case_id=uuid.uuid4().hex, attrs={'create': True})
+        child = CaseStructure(
+            case_id=uuid.uuid4().hex,
+            attrs={'create': True},
+            indices=[CaseIndex(parent, identifier='parent', relationship='child')],
+        )
+        self.guy.post_changes(child)
+        expected_tree = {child.case_id: {'parent': parent.case_id}}
+        # the shared payload is built by the first sync and reused by the second
+        for device in [self.guy, self.ferrel]:
+            sync = device.sync(restore_id='')
+            self.assertEqual(set(sync.cases), {parent.case_id, child.case_id})
+            self.assertEqual(sync.log.index_tree.indices, expected_tree)
+            self.assertEqual(sync.log.extension_index_tree.indices, {})
@@ -0,0 +1,50 @@
+import uuid
+
+from django.test import SimpleTestCase
+
+from casexml.apps.phone.synclog_encoding import (
+    compact_sync_log_doc,
+    expand_sync_log_doc,
+)
+
+
+class SyncLogEncodingTest(SimpleTestCase):
+
+    def test_round_trip(self):
+        hex_id = uuid.uuid4().hex
+        dashed_id = str(uuid.uuid4())
+        doc = {
+            '_id': 'abc',
+            'domain': 'test',
+            'case_ids_on_phone': [hex_id, dashed_id, 'other-id', hex_id.upper(), 'ñ'],
+            'dependent_case_ids_on_phone': ['other-id'],
+            'closed_cases': [],
+            'index_tree': {'doc_type': 'IndexTree', 'indices': {
+                dashed_id: {'parent': 'other-id', 'mother': hex_id},
+            }},
+            'extension_index_tree': {'doc_type': 'IndexTree', 'indices': {
+                'ñ': {'host': dashed_id},
+            }},
+        }
+        light_doc, data = compact_sync_log_doc(doc)
+        self.assertEqual(light_doc, {'_id': 'abc', 'domain': 'test'})
+
+        expanded = expand_sync_log_doc(light_doc, memoryview(data))
+        self.assertEqual(set(expanded['case_ids_on_phone']), set(doc['case_ids_on_phone']))
+        expanded['case_ids_on_phone'] = doc['case_ids_on_phone']
+        self.assertEqual(expanded, doc)
+
+    def test_empty(self):
+        light_doc, data = compact_sync_log_doc({'_id': 'abc'})
+        self.assertEqual(expand_sync_log_doc(light_doc, data), {
+            '_id': 'abc',
+            'case_ids_on_phone': [],
+            'dependent_case_ids_on_phone': [],
+            'closed_cases': [],
+            'index_tree': {'doc_type': 'IndexTree', 'indices': {}},
+            'extension_index_tree': {'doc_type': 'IndexTree', 'indices': {}},
+        })
+
+    def test_unknown_version(self):
+        with self.assertRaises(ValueError):
+            expand_sync_log_doc({}, b'\x00')
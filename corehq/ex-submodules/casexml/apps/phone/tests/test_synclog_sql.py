@@ -2,7 +2,14 @@ from datetime import datetime
 
 from django.test import TestCase
 
-from casexml.apps.phone.models import SyncLogSQL, SimplifiedSyncLog
+from casexml.apps.phone.models import (
+    IndexTree,
+    SimplifiedSyncLog,
+    SyncLogSQL,
+    get_properly_wrapped_sync_log,
+)
+
+from corehq.util.test_utils import flag_enabled
 
 
 class SyncLogQueryTest(TestCase):
@@ -28,3 +35,37 @@ class SyncLogQueryTest(TestCase):
         with self.assertNumQueries(1):
             # previously this was 2 queries, fetch + update
             synclog.save()
+
+
+@flag_enabled('COMPACT_SYNCLOG_ENCODING')
+class CompactSyncLogTest(TestCase):
+
+    def tearDown(self):
+        SyncLogSQL.objects.all().delete()
+        super().tearDown()
+
+    def test_round_trip(self):
+        synclog = SimplifiedSyncLog(
+            domain='test',
+            user_id='user1',
+            date=datetime(2015, 7, 1, 0, 0),
+            case_ids_on_phone={'child', 'parent', 'host', 'ext'},
+            dependent_case_ids_on_phone={'parent'},
+            index_tree=IndexTree(indices={'child': {'parent': 'parent'}}),
+            extension_index_tree=IndexTree(indices={'ext': {'host': 'host'}}),
+            closed_cases={'child'},
+        )
+        synclog.save()
+
+        row = SyncLogSQL.objects.get(synclog_id=synclog._id)
+        self.assertIsNotNone(row.doc_compact)
+        self.assertNotIn('case_ids_on_phone', row.doc)
+        self.assertEqual(row.doc['user_id'], 'user1')
+
+        loaded = get_properly_wrapped_sync_log(synclog._id)
+        self.assertEqual(loaded.case_ids_on_phone, {'child', 'parent', 'host', 'ext'})
+        self.assertEqual(loaded.dependent_case_ids_on_phone, {'parent'})
+        self.assertEqual(loaded.closed_cases, {'child'})
+        self.assertEqual(loaded.index_tree.indices, {'child': {'parent': 'parent'}})
+        self.assertEqual(loaded.extension_index_tree.indices, {'ext': {'host': 'host'}})
+        self.assertEqual(loaded.get_state_hash(), synclog.get_state_hash())
@@ -15,6 +15,9 @@ ATTACHMENT_NAME = "form.xml"
 
 MAGIC_PROPERTY = 'xml_submission_file'
 
+# maximum number of forms in one batch submission
+MAX_BATCH_SUBMISSION_SIZE = 500
+
 RESERVED_WORDS = [TAG_TYPE, TAG_XML, TAG_VERSION, TAG_UIVERSION, TAG_NAMESPACE,
                   TAG_NAME, TAG_META, ATTACHMENT_NAME, 'case', MAGIC_PROPERTY]
 
@@ -1,5 +1,9 @@
 from django.conf import settings
-from couchforms.const import MAGIC_PROPERTY, VALID_ATTACHMENT_FILE_EXTENSIONS
+from couchforms.const import (
+    MAGIC_PROPERTY,
+    MAX_BATCH_SUBMISSION_SIZE,
+    VALID_ATTACHMENT_FILE_EXTENSIONS,
+)
 
 
 class CouchFormException(Exception):
@@ -87,3 +91,20 @@ class AttachmentSizeTooLarge(BadSubmissionRequest):
             f"Attachment exceeds {settings.MAX_UPLOAD_SIZE_ATTACHMENT/(1024*1024):,.0f}MB size limit\n",
             413
         )
+
+
+class BatchAttachmentError(UnprocessableFormSubmission):
+    def __init__(self):
+        super().__init__(
+            "Forms with attachments cannot be submitted in a batch. Submit "
+            "them individually instead.\n",
+            422
+        )
+
+
+class BatchTooLarge(BadSubmissionRequest):
+    def __init__(self):
+        super().__init__(
+            f"A batch submission may contain at most {MAX_BATCH_SUBMISSION_SIZE} forms\n",
+            413
+        )
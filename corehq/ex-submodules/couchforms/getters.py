@@ -1,10 +1,16 @@
 from django.utils.datastructures import MultiValueDictKeyError
-from couchforms.const import MAGIC_PROPERTY, VALID_ATTACHMENT_FILE_EXTENSIONS
+from couchforms.const import (
+    MAGIC_PROPERTY,
+    MAX_BATCH_SUBMISSION_SIZE,
+    VALID_ATTACHMENT_FILE_EXTENSIONS,
+)
 import logging
 from datetime import datetime
 from django.conf import settings
 
 from couchforms.exceptions import (
+    BatchAttachmentError,
+    BatchTooLarge,
     EmptyPayload,
     MultipartEmptyPayload,
     MultipartFilenameError,
@@ -17,7 +23,7 @@ from dimagi.utils.parsing import string_to_utc_datetime
 from dimagi.utils.web import get_ip, get_site_domain, IP_RE
 
 
-__all__ = ['get_path', 'get_instance_and_attachment',
+__all__ = ['get_path', 'get_instance_and_attachment', 'get_batch_instances',
            'get_location', 'get_received_on', 'get_date_header',
            'get_submit_ip', 'get_last_sync_token', 'get_openrosa_headers']
 
@@ -74,6 +80,36 @@ def get_instance_and_attachment(request):
     return instance, attachments
 
 
+def get_batch_instances(request):
+    """Get the form instances of a batch submission, in submission order
+
+    A batch is a multipart request with one ``MAGIC_PROPERTY`` part per
+    form. Forms with attachments cannot be submitted in a batch.
+    """
+    if not request.META['CONTENT_TYPE'].startswith('multipart/form-data'):
+        raise MultipartFilenameError()
+    if list(request.POST):
+        raise MultimediaBug("Received a submission with POST.keys()")
+    if set(request.FILES) - {MAGIC_PROPERTY}:
+        raise BatchAttachmentError()
+    instance_files = request.FILES.getlist(MAGIC_PROPERTY)
+    if not instance_files:
+        raise MultipartFilenameError()
+    if len(instance_files) > MAX_BATCH_SUBMISSION_SIZE:
+        raise BatchTooLarge()
+    instances = []
+    for instance_file in instance_files:
+        if instance_file.size > settings.MAX_UPLOAD_SIZE:
+            raise PayloadTooLarge()
+        if not _valid_instance_file_extension(instance_file):
+            raise InvalidSubmissionFileExtensionError()
+        instance = instance_file.read()
+        if not instance:
+            raise MultipartEmptyPayload()
+        instances.append(instance)
+    return instances
+
+
 def _valid_instance_file_extension(file):
     return _valid_file_extension(file.name, ['xml'])
 
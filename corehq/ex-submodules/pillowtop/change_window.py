@@ -0,0 +1,92 @@
+"""
+Coalescing of repeated changes to the same document across chunks
+
+Bulk case imports and auto update rules can publish many changes for the
+same document within a few seconds. Pillows fetch the latest version of
+a document when they process a change, so processing only the last of
+those changes gives the same result as processing all of them.
+
+A ``ChangeWindow`` holds changes back for a limited time or number of
+subsequent changes. A change to a document that already has a change in
+the window replaces it, keeping the position of the first change so
+that documents that change continuously are still processed regularly.
+
+Changes in the window have been read from the change feed but not
+processed, so the checkpoint must not move past them:
+``ChangeWindow.hold_back`` limits a Kafka checkpoint sequence to the
+offsets of the changes in the window.
+"""
+import time
+from collections import namedtuple
+
+WindowedChange = namedtuple('WindowedChange', ['change', 'added', 'position'])
+
+
+class ChangeWindow:
+    """Window in which repeated changes to a document are coalesced
+
+    :param max_age: Seconds a change may be held back.
+    :param max_changes: Number of changes that may be read after a change
+        before it is released.
+    """
+
+    def __init__(self, max_age=0, max_changes=0):
+        assert max_age or max_changes, "the window must be bounded"
+        self.max_age = max_age
+        self.max_changes = max_changes
+        self._changes = {}  # ordered by when the first change to each document was added
+        self._position = 0
+
+    def __len__(self):
+        return len(self._changes)
+
+    def add(self, change):
+        """Add a change to the window
+
+        :returns: ``True`` if it replaced a change to the same document.
+        """
+        self._position += 1
+        windowed = self._changes.get(change.id)
+        if windowed is not None:
+            self._changes[change.id] = windowed._replace(change=change)
+            return True
+        self._changes[change.id] = WindowedChange(change, time.monotonic(), self._position)
+        return False
+
+    def pop_expired(self):
+        """Remove and return changes that may not be held back any longer"""
+        now = time.monotonic()
+        expired = []
+        for doc_id, windowed in self._changes.items():
+            if not (
+                (self.max_age and now - windowed.added >= self.max_age)
+                or (self.max_changes and self._position - windowed.position >= self.max_changes)
+            ):
+                # changes added later expire later
+                break
+            expired.append(doc_id)
+        return [self._changes.pop(doc_id).change for doc_id in expired]
+
+    def pop_all(self):
+        """Remove and return all changes in the window"""
+        changes = [windowed.change for windowed in self._changes.values()]
+        self._changes.clear()
+        return changes
+
+    def hold_back(self, sequence):
+        """Limit a checkpoint sequence to the changes in the window
+
+        :param sequence: dict of Kafka offsets by topic and partition to
+            resume reading from, or ``None``.
+        :returns: ``sequence`` with the offset of each partition no
+            greater than that of its changes in the window, so that they
+            are read again if the pillow restarts.
+        """
+        if sequence is None or not self._changes:
+            return sequence
+        held = dict(sequence)
+        for windowed in self._changes.values():
+            change = windowed.change
+            topic_partition = (change.topic, change.partition)
+            held[topic_partition] = min(held.get(topic_partition, change.sequence_id), change.sequence_id)
+        return held
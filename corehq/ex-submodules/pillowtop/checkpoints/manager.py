@@ -141,17 +141,17 @@ class PillowCheckpointEventHandler(ChangeEventHandler):
     def get_new_seq(self, change):
         return change['seq']
 
-    def update_checkpoint(self, change, context):
+    def update_checkpoint(self, change, context, new_seq=None):
         if self.should_update_checkpoint(context):
             context.reset()
-            self.checkpoint.update_to(self.get_new_seq(change))
+            self.checkpoint.update_to(self.get_new_seq(change) if new_seq is None else new_seq)
             self.last_update = datetime.utcnow()
             if self.checkpoint_callback:
                 self.checkpoint_callback.checkpoint_updated()
             return True
         elif self.last_log is None or (datetime.utcnow() - self.last_log).total_seconds() > 10:
             self.last_log = datetime.utcnow()
-            pillow_logging.info("Heartbeat: %s", self.get_new_seq(change))
+            pillow_logging.info("Heartbeat: %s", self.get_new_seq(change) if new_seq is None else new_seq)
 
         return False
 
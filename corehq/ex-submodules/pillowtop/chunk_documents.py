@@ -0,0 +1,53 @@
+"""
+Documents loaded once for a chunk of changes and shared by the processors
+that handle it.
+
+A pillow that prefetches documents makes them available while it
+processes the chunk, so that lookups of the same documents by different
+processors, for example UCR ``related_doc`` expressions, do not query
+the document stores again.
+"""
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class ChunkDocuments:
+    """Documents by doc type and id"""
+
+    def __init__(self, docs=()):
+        self._docs = {}
+        self.add(docs)
+
+    def add(self, docs):
+        for doc in docs:
+            self._docs[(doc.get('doc_type'), doc['_id'])] = doc
+
+    def get(self, doc_type, doc_id):
+        return self._docs.get((doc_type, doc_id))
+
+    def __len__(self):
+        return len(self._docs)
+
+
+@contextmanager
+def active_chunk_documents(documents):
+    """Make documents available to ``get_chunk_document`` in this block"""
+    previous = getattr(_local, 'documents', None)
+    _local.documents = documents
+    try:
+        yield
+    finally:
+        _local.documents = previous
+
+
+def get_chunk_document(doc_type, doc_id):
+    """Get a document loaded for the chunk being processed
+
+    :returns: The document or ``None`` if it was not loaded.
+    """
+    documents = getattr(_local, 'documents', None)
+    if documents is None:
+        return None
+    return documents.get(doc_type, doc_id)
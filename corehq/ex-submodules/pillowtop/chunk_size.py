@@ -0,0 +1,83 @@
+"""
+Adaptive chunk size for pillows that process changes in batches
+
+The chunk size grows while the pillow is behind and the processing time
+per change is stable, which makes draining a backlog cheaper since most
+of the cost of a chunk (document fetches, ES bulk requests, UCR queries)
+does not grow linearly with its size. The chunk size is halved when the
+processing time per change spikes or a chunk has errors, so that slow
+backends are not pushed harder and failed chunks are smaller to retry.
+"""
+import math
+
+# weight of the latest chunk in the average processing time per change
+SMOOTHING = 0.2
+# processing time per change, relative to the average, above which the
+# chunk size is not increased
+STABLE_RATIO = 1.25
+# processing time per change, relative to the average, above which the
+# chunk size is decreased
+SPIKE_RATIO = 2
+GROWTH_FACTOR = 1.5
+
+
+class AdaptiveChunkSize:
+    """Chunk size that adapts to change lag, processing time and errors
+
+    :param initial_size: Chunk size to start with. The chunk size grows
+        back to this size without lag after it has been reduced.
+    :param max_size: Largest chunk size.
+    :param min_size: Smallest chunk size.
+    :param lag_threshold: Age, in seconds, of the oldest change in a chunk
+        above which the pillow is considered to be behind.
+    """
+
+    def __init__(self, initial_size, max_size, min_size=1, lag_threshold=60):
+        assert 0 < min_size <= initial_size <= max_size, (min_size, initial_size, max_size)
+        self.size = self.initial_size = initial_size
+        self.max_size = max_size
+        self.min_size = min_size
+        self.lag_threshold = lag_threshold
+        self.time_per_change = None
+
+    def update(self, num_changes, processing_time, lag, has_errors=False, num_processed=None):
+        """Update the chunk size after processing a chunk
+
+        :param num_changes: Number of changes in the chunk as it was read.
+        :param processing_time: Seconds spent processing the chunk.
+        :param lag: Age, in seconds, of the oldest change in the chunk.
+        :param has_errors: Whether any change in the chunk failed.
+        :param num_processed: Number of changes processed, if fewer than
+            ``num_changes`` because repeated changes to a document were
+            dropped. Defaults to ``num_changes``.
+        :returns: The new chunk size.
+        """
+        if not num_changes:
+            return self.size
+        if has_errors:
+            # the processing time of failed chunks says nothing about the backends
+            self._shrink()
+            return self.size
+
+        time_per_change = processing_time / (num_processed or num_changes)
+        average = self.time_per_change
+        if average is None:
+            self.time_per_change = time_per_change
+        else:
+            self.time_per_change = SMOOTHING * time_per_change + (1 - SMOOTHING) * average
+
+        if average is not None and time_per_change > average * SPIKE_RATIO:
+            self._shrink()
+        elif num_changes >= self.size and (average is None or time_per_change <= average * STABLE_RATIO):
+            # a full chunk means more changes are waiting to be processed
+            if lag > self.lag_threshold:
+                self._grow(self.max_size)
+            elif self.size < self.initial_size:
+                self._grow(self.initial_size)
+        return self.size
+
+    def _grow(self, limit):
+        self.size = min(limit, math.ceil(self.size * GROWTH_FACTOR))
+
+    def _shrink(self):
+        self.size = max(self.min_size, self.size // 2)
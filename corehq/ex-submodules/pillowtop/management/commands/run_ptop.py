@@ -89,6 +89,53 @@ class Command(BaseCommand):
             help="The batch size for this pillow. Some pillows process changes in bulk, "
             "setting this value to 1 will process each change as it comes in.",
         )
+        parser.add_argument(
+            '--max-processor-chunk-size',
+            action='store',
+            dest='max_processor_chunk_size',
+            default=0,
+            type=int,
+            help="Enables adaptive batch sizes up to this size for pillows that support it. "
+            "Batches grow from --processor-chunk-size while the pillow is behind and shrink "
+            "when processing slows down or fails.",
+        )
+        parser.add_argument(
+            '--change-window-seconds',
+            action='store',
+            dest='change_window_seconds',
+            default=0,
+            type=int,
+            help="Hold changes back for up to this many seconds so that repeated changes to "
+            "the same document are processed once. Only supported by the case pillow.",
+        )
+        parser.add_argument(
+            '--change-window-size',
+            action='store',
+            dest='change_window_size',
+            default=0,
+            type=int,
+            help="Hold changes back until up to this many more changes have been read so that "
+            "repeated changes to the same document are processed once. Only supported by the "
+            "case pillow.",
+        )
+        parser.add_argument(
+            '--rebalance-partitions',
+            action='store_true',
+            dest='rebalance_partitions',
+            default=False,
+            help="Assign Kafka partitions to the processes of this pillow based on their lag "
+            "and throughput rather than statically. Only supported by the case pillow. All "
+            "processes of the pillow must use this option.",
+        )
+        parser.add_argument(
+            '--pipeline-depth',
+            action='store',
+            dest='pipeline_depth',
+            default=0,
+            type=int,
+            help="Number of chunks to read ahead while a chunk is processed. Only supported "
+            "by pillows with batch processors. The default, 0, processes chunks one at a time.",
+        )
         parser.add_argument(
             '--dedicated-migration-process',
             action='store_true',
@@ -137,6 +184,11 @@ class Command(BaseCommand):
                 processor_chunk_size=options['processor_chunk_size'],
                 dedicated_migration_process=options['dedicated_migration_process'],
                 exclude_ucrs=options['exclude_ucrs'].split(),
+                pipeline_depth=options['pipeline_depth'],
+                max_processor_chunk_size=options['max_processor_chunk_size'],
+                rebalance_partitions=options['rebalance_partitions'],
+                change_window_seconds=options['change_window_seconds'],
+                change_window_size=options['change_window_size'],
             )
             sys.exit()
         else:
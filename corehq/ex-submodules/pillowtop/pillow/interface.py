@@ -1,7 +1,9 @@
+import threading
 import time
 from abc import ABCMeta, abstractmethod
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, namedtuple
 from datetime import datetime
+from queue import Empty, Full, Queue
 
 from django.conf import settings
 from memoized import memoized
@@ -14,10 +16,13 @@ from corehq.util.metrics.const import MPM_MAX
 from corehq.util.timer import TimingContext
 from dimagi.utils.logging import notify_exception
 from kafka import TopicPartition
+from pillowtop.change_window import ChangeWindow
+from pillowtop.chunk_documents import ChunkDocuments, active_chunk_documents
+from pillowtop.chunk_size import AdaptiveChunkSize
 from pillowtop.const import CHECKPOINT_MIN_WAIT
 from pillowtop.dao.exceptions import DocumentMissingError
-from pillowtop.utils import force_seq_int
-from pillowtop.exceptions import PillowtopCheckpointReset
+from pillowtop.utils import bulk_fetch_changes_docs, force_seq_int
+from pillowtop.exceptions import PillowConfigError, PillowtopCheckpointReset
 from pillowtop.logger import pillow_logging
 
 
@@ -51,6 +56,27 @@ class ConstructedPillow:
 
     :param name: unique identifier for this pillow
     :param checkpoint: a PillowCheckpoint instance dealing with checkpoints
+    :param pipeline_depth: number of chunks that may be read from the change
+        feed, with their documents fetched, while an earlier chunk is being
+        processed. Zero processes chunks one after another. Only applies to
+        pillows with batch processors.
+    :param prefetch_documents: fetch the documents of each chunk before it is
+        processed and share them with all processors of the chunk through
+        ``pillowtop.chunk_documents``. Pipelined pillows always prefetch.
+    :param related_docs_fetcher: function that takes the documents of a chunk
+        and returns other documents its processors are expected to look up,
+        which are then shared in the same way.
+    :param max_processor_chunk_size: enables adaptive chunk sizing when it is
+        larger than ``processor_chunk_size``. The chunk size then grows up to
+        this size while the pillow is behind, and is reduced when processing
+        slows down or fails (see ``pillowtop.chunk_size``).
+    :param change_window_seconds: seconds for which changes may be held back
+        so that repeated changes to the same document are processed once
+        (see ``pillowtop.change_window``). Only applies to pillows with batch
+        processors that read from Kafka.
+    :param change_window_size: number of changes that may be read while a
+        change is held back. The window is bounded by both limits if both
+        are set.
     """
 
     # set to true to disable saving pillow retry errors
@@ -60,12 +86,25 @@ class ConstructedPillow:
 
     def __init__(self, name, checkpoint, change_feed, processor, process_num=0,
                  change_processed_event_handler=None, processor_chunk_size=0,
-                 is_dedicated_migration_process=False):
+                 is_dedicated_migration_process=False, pipeline_depth=0,
+                 prefetch_documents=False, related_docs_fetcher=None, max_processor_chunk_size=0,
+                 change_window_seconds=0, change_window_size=0):
         self.pillow_id = name
         self.process_num = process_num
         self.checkpoint = checkpoint
         self.change_feed = change_feed
         self.processor_chunk_size = processor_chunk_size
+        self.adaptive_chunk_size = None
+        if processor_chunk_size and max_processor_chunk_size > processor_chunk_size:
+            self.adaptive_chunk_size = AdaptiveChunkSize(processor_chunk_size, max_processor_chunk_size)
+        self.pipeline_depth = pipeline_depth
+        self.prefetch_documents = prefetch_documents
+        self.related_docs_fetcher = related_docs_fetcher
+        self.change_window = None
+        if change_window_seconds or change_window_size:
+            if change_feed.sequence_format != 'json':
+                raise PillowConfigError("Change windows require a change feed with Kafka offsets")
+            self.change_window = ChangeWindow(change_window_seconds, change_window_size)
         if isinstance(processor, list):
             self.processors = processor
         else:
@@ -126,9 +165,9 @@ class ConstructedPillow:
                 processor.run_migrations()
             time.sleep(10)
 
-    def _update_checkpoint(self, change, context):
+    def _update_checkpoint(self, change, context, new_seq=None):
         if change and context:
-            updated = self.update_checkpoint(change, context)
+            updated = self.update_checkpoint(change, context, new_seq)
         else:
             updated = self.checkpoint.touch(min_interval=CHECKPOINT_MIN_WAIT)
         if updated:
@@ -159,6 +198,12 @@ class ConstructedPillow:
             batch processors. If there are batch processors, checkpoint is updated
             at the end of the batch, otherwise is updated for every change.
         """
+        if self.batch_processors:
+            if self.pipeline_depth:
+                return self._process_changes_pipelined(since, forever)
+            if self.change_window is not None:
+                return self._process_chunks(self._iter_chunks(since, forever))
+
         context = PillowRuntimeContext(changes_seen=0)
         changes_chunk = []
 
@@ -172,7 +217,7 @@ class ConstructedPillow:
                 if change is not None:
                     context.changes_seen += 1
                     changes_chunk.append(change)
-                chunk_full = len(changes_chunk) == self.processor_chunk_size
+                chunk_full = len(changes_chunk) >= self.processor_chunk_size
                 # change is None means consumer timeout -> process partial chunk to avoid lag
                 if chunk_full or (change is None and changes_chunk):
                     self._batch_process_with_error_handling(changes_chunk)
@@ -189,19 +234,146 @@ class ConstructedPillow:
             self._batch_process_with_error_handling(changes_chunk)
             self._update_checkpoint(changes_chunk[-1], context)
 
-    def _batch_process_with_error_handling(self, changes_chunk):
+    def _process_changes_pipelined(self, since, forever):
+        """
+        Process chunks of changes while the following chunks are read
+
+            A reader thread consumes the change feed, fetches the documents
+            of each chunk and queues it with the checkpoint sequence of its
+            last change. At most ``pipeline_depth`` chunks are queued. The
+            checkpoint is only updated once a chunk has been fully processed,
+            so a restart resumes from the first incompletely processed chunk.
+        """
+        reader = ChangesChunkReader(self, since, forever)
+        reader.start()
+        try:
+            self._process_chunks(reader)
+        finally:
+            reader.stop()
+
+    def _process_chunks(self, chunks):
+        """
+        Process chunks of changes and update the checkpoint after each one
+
+            :param chunks: iterable of ``ChangesChunk``.
+        """
+        context = PillowRuntimeContext(changes_seen=0)
+        for chunk in chunks:
+            if not chunk.changes:
+                self._update_checkpoint(None, None)
+                self._record_timeout_in_datadog()
+                continue
+            context.changes_seen += len(chunk.changes)
+            self._batch_process_with_error_handling(chunk.changes, chunk.documents)
+            self._update_checkpoint(chunk.changes[-1], context, chunk.sequence)
+
+    def _iter_chunks(self, since, forever, prefetch_documents=False):
+        """
+        Yield ``ChangesChunk`` with the checkpoint sequence computed when read
+        """
+        for changes in self._iter_changes_chunks(since, forever):
+            sequence = documents = None
+            if changes:
+                if prefetch_documents:
+                    documents = self._prefetch_documents(changes)
+                # computed here because it may query the change feed's consumer
+                sequence = self.get_checkpoint_sequence(changes[-1])
+                if self.change_window is not None:
+                    sequence = self.change_window.hold_back(sequence)
+            yield ChangesChunk(changes, sequence, documents)
+
+    def _iter_changes_chunks(self, since, forever):
+        """
+        Group changes from the change feed into chunks of processor_chunk_size
+
+            Yields a partial chunk when the consumer times out, or an empty
+            chunk if there are no changes waiting to be processed.
+
+            Changes are passed through the change window if there is one, in
+            which case chunks are made of the changes released by the window.
+            All changes in the window are released when the consumer times out.
+        """
+        window = self.change_window
+        if window is not None:
+            # left over from an interrupted run, read again from the checkpoint
+            window.pop_all()
+        changes_chunk = []
+        coalesced = 0
+        for change in self.change_feed.iter_changes(since=since or None, forever=forever):
+            if change is not None:
+                if window is None:
+                    changes_chunk.append(change)
+                else:
+                    coalesced += window.add(change)
+                    changes_chunk.extend(window.pop_expired())
+                if len(changes_chunk) < self.processor_chunk_size:
+                    continue
+            elif window is not None:
+                changes_chunk.extend(window.pop_all())
+            if coalesced:
+                self._record_coalesced_changes_in_datadog(coalesced)
+                coalesced = 0
+            yield changes_chunk
+            changes_chunk = []
+        if window is not None:
+            changes_chunk.extend(window.pop_all())
+        if coalesced:
+            self._record_coalesced_changes_in_datadog(coalesced)
+        if changes_chunk:
+            yield changes_chunk
+
+    def _prefetch_documents(self, changes_chunk):
+        """
+        Fetch the documents of a chunk of changes, and their related documents
+
+            :returns: ``ChunkDocuments`` with the documents that were fetched.
+            Errors are logged rather than raised since processors will fetch
+            any missing documents themselves.
+        """
+        documents = ChunkDocuments()
+        changes = [
+            change for change in self._deduplicate_changes(changes_chunk)
+            if change.document_store is not None
+        ]
+        try:
+            bad_changes, docs = bulk_fetch_changes_docs(changes)
+            documents.add(docs)
+            if self.related_docs_fetcher is not None:
+                documents.add(self.related_docs_fetcher(docs))
+        except Exception:
+            pillow_logging.exception("[%s %s] Error prefetching documents", self.pillow_id, self.process_num)
+        return documents
+
+    def get_checkpoint_sequence(self, change):
+        if self._change_processed_event_handler is not None:
+            return self._change_processed_event_handler.get_new_seq(change)
+        return None
+
+    def _batch_process_with_error_handling(self, changes_chunk, documents=None):
         """
         Process given chunk in batch mode first on batch-processors
             and only latter on serial processors one by one, so that
             docs can be fetched only once while batch processing in bulk
             and cached via change.get_document for serial processors.
             For the relookup to be avoided at least one batch processor under
-            should use change.set_document after docs are fetched in bulk
+            should use change.set_document after docs are fetched in bulk,
+            or the pillow should prefetch documents.
 
             If there is an exception in chunked processing, falls back
             to serial processing.
+
+            :param documents: ``ChunkDocuments`` already fetched for the chunk.
         """
+        if documents is None and self.prefetch_documents and changes_chunk:
+            documents = self._prefetch_documents(changes_chunk)
+        with active_chunk_documents(documents):
+            self._batch_process_chunk(changes_chunk)
+
+    def _batch_process_chunk(self, changes_chunk):
         processing_time = 0
+        has_errors = False
+        # before duplicates are dropped, for the size of the chunk that was read
+        changes_read = changes_chunk
 
         def reprocess_serially(chunk, processor):
             for change in chunk:
@@ -227,9 +399,11 @@ class ConstructedPillow:
                         details={'change_ids': [c.id for c in changes_chunk]},
                     )
                     self._record_batch_exception_in_datadog(processor)
+                    has_errors = True
                     # fall back to processing one by one
                     reprocess_serially(changes_chunk, processor)
                 else:
+                    has_errors = has_errors or bool(retry_changes or change_exceptions)
                     # fall back to processing one by one for failed changes
                     for change, exception in change_exceptions:
                         handle_pillow_error(self, change, exception)
@@ -239,6 +413,15 @@ class ConstructedPillow:
         for change in changes_chunk:
             processing_time += self.process_with_error_handling(change)
         self._record_datadog_metrics(changes_chunk, processing_time)
+        if self.adaptive_chunk_size is not None:
+            self._update_chunk_size(changes_read, len(changes_chunk), processing_time, has_errors)
+
+    def _update_chunk_size(self, changes_read, num_processed, processing_time, has_errors):
+        lag = (datetime.utcnow() - changes_read[0].metadata.publish_timestamp).total_seconds()
+        self.processor_chunk_size = self.adaptive_chunk_size.update(
+            len(changes_read), processing_time, lag, has_errors, num_processed=num_processed)
+        metrics_gauge('commcare.change_feed.processor_chunk_size', self.processor_chunk_size,
+                      tags={'pillow_name': self.get_name()}, multiprocess_mode=MPM_MAX)
 
     def process_with_error_handling(self, change, processor=None):
         # process given change on all serial processors or given processor.
@@ -268,12 +451,14 @@ class ConstructedPillow:
         for processor in processors:
             processor.process_change(change)
 
-    def update_checkpoint(self, change, context):
+    def update_checkpoint(self, change, context, new_seq=None):
         """
+        :param new_seq: sequence to update the checkpoint to, if it was
+            computed when the change was read
         :return: True if checkpoint was updated otherwise False
         """
         if self._change_processed_event_handler is not None:
-            return self._change_processed_event_handler.update_checkpoint(change, context)
+            return self._change_processed_event_handler.update_checkpoint(change, context, new_seq)
         return False
 
     def _normalize_checkpoint_sequence(self):
@@ -353,6 +538,11 @@ class ConstructedPillow:
         metrics_gauge('commcare.change_feed.chunked.max_change_lag', 0,
                       tags={'pillow_name': name}, multiprocess_mode=MPM_MAX)
 
+    def _record_coalesced_changes_in_datadog(self, count):
+        metrics_counter('commcare.change_feed.changes.coalesced', count, tags={
+            'pillow_name': self.get_name(),
+        })
+
     def _record_batch_exception_in_datadog(self, processor):
         metrics_counter(
             "commcare.change_feed.batch_processor_exceptions",
@@ -418,14 +608,86 @@ class ConstructedPillow:
         return unique
 
 
+class ChangesChunk(namedtuple('ChangesChunk', ['changes', 'sequence', 'documents'])):
+    """
+    A chunk of changes, the checkpoint sequence after its last change and
+    the documents fetched for it
+    """
+
+
+class ChangesChunkReader:
+    """
+    Reads chunks of changes for a pillow in a thread
+
+    Iterating over the reader yields chunks in order and raises any
+    error that stopped the thread.
+    """
+    _end = object()
+
+    def __init__(self, pillow, since, forever):
+        self.pillow = pillow
+        self.since = since
+        self.forever = forever
+        self.queue = Queue(maxsize=pillow.pipeline_depth)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._read, name=f'{pillow.pillow_id}-{pillow.process_num}-reader', daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        while self.thread.is_alive():
+            # make room in case the thread is waiting to add a chunk
+            try:
+                self.queue.get(timeout=0.1)
+            except Empty:
+                pass
+        self.thread.join()
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is self._end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _read(self):
+        pillow = self.pillow
+        try:
+            for chunk in pillow._iter_chunks(self.since, self.forever, prefetch_documents=True):
+                if not self._put(chunk):
+                    return
+            self._put(self._end)
+        except Exception as err:
+            self._put(err)
+        finally:
+            cleanup_connections(pillow.pillow_id)
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except Full:
+                pass
+        return False
+
+
 class ChangeEventHandler(metaclass=ABCMeta):
     """
     A change-event-handler object used in constructed pillows.
     """
 
     @abstractmethod
-    def update_checkpoint(self, change, context):
+    def update_checkpoint(self, change, context, new_seq=None):
         """
+        :param new_seq: sequence to update the checkpoint to. Defaults to
+            ``get_new_seq(change)``.
         :return: True if checkpoint was updated otherwise False
         """
         pass
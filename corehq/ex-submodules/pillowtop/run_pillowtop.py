@@ -20,6 +20,11 @@ def run_pillow_by_name(
     processor_chunk_size,
     dedicated_migration_process=False,
     exclude_ucrs=(),
+    pipeline_depth=0,
+    max_processor_chunk_size=0,
+    rebalance_partitions=False,
+    change_window_seconds=0,
+    change_window_size=0,
 ):
     assert 0 <= process_number < num_processes
     assert processor_chunk_size
@@ -30,6 +35,16 @@ def run_pillow_by_name(
     }
     if exclude_ucrs:
         options['exclude_ucrs'] = exclude_ucrs
+    if pipeline_depth:
+        options['pipeline_depth'] = pipeline_depth
+    if max_processor_chunk_size:
+        options['max_processor_chunk_size'] = max_processor_chunk_size
+    if rebalance_partitions:
+        options['rebalance_partitions'] = rebalance_partitions
+    if change_window_seconds:
+        options['change_window_seconds'] = change_window_seconds
+    if change_window_size:
+        options['change_window_size'] = change_window_size
 
     if gevent_workers is not None:
         if gevent_workers < 2:
@@ -0,0 +1,50 @@
+from unittest.mock import patch
+
+from testil import Config
+
+from ..change_window import ChangeWindow
+
+
+def change(id, offset, partition=0):
+    return Config(id=id, sequence_id=offset, topic='case', partition=partition)
+
+
+def test_coalesces_changes_to_same_document():
+    window = ChangeWindow(max_changes=10)
+    assert not window.add(change('a', 1))
+    assert not window.add(change('b', 2))
+    assert window.add(change('a', 3))
+    assert [(c.id, c.sequence_id) for c in window.pop_all()] == [('a', 3), ('b', 2)]
+    assert len(window) == 0
+
+
+def test_releases_changes_after_max_changes():
+    window = ChangeWindow(max_changes=2)
+    released = []
+    for num, doc_id in enumerate('abacd'):
+        window.add(change(doc_id, num))
+        released.extend((c.id, c.sequence_id) for c in window.pop_expired())
+    assert released == [('a', 2), ('b', 1)]
+    assert len(window) == 2
+
+
+def test_releases_changes_after_max_age():
+    window = ChangeWindow(max_age=5)
+    with patch('pillowtop.change_window.time.monotonic', return_value=100):
+        window.add(change('a', 1))
+    with patch('pillowtop.change_window.time.monotonic', return_value=103):
+        window.add(change('b', 2))
+        assert window.pop_expired() == []
+    with patch('pillowtop.change_window.time.monotonic', return_value=105):
+        assert [c.id for c in window.pop_expired()] == ['a']
+
+
+def test_hold_back_checkpoint_sequence():
+    window = ChangeWindow(max_changes=10)
+    window.add(change('a', 5, partition=0))
+    window.add(change('b', 7, partition=0))
+    window.add(change('a', 9, partition=0))
+    window.add(change('c', 3, partition=1))
+    sequence = {('case', 0): 12, ('case', 1): 4, ('case', 2): 8}
+    assert window.hold_back(sequence) == {('case', 0): 7, ('case', 1): 3, ('case', 2): 8}
+    assert window.hold_back(None) is None
@@ -0,0 +1,50 @@
+import pytest
+
+from ..chunk_size import AdaptiveChunkSize
+
+
+def test_grows_while_behind():
+    chunk_size = AdaptiveChunkSize(10, 40, lag_threshold=60)
+    sizes = [chunk_size.update(chunk_size.size, chunk_size.size * 0.01, lag=120) for i in range(5)]
+    assert sizes == [15, 23, 35, 40, 40]
+
+
+@pytest.mark.parametrize("num_changes, lag", [
+    (5, 120),  # partial chunk: no more changes waiting
+    (10, 30),  # not behind
+])
+def test_does_not_grow(num_changes, lag):
+    chunk_size = AdaptiveChunkSize(10, 40, lag_threshold=60)
+    assert chunk_size.update(num_changes, num_changes * 0.01, lag=lag) == 10
+
+
+def test_does_not_grow_when_processing_slows_down():
+    chunk_size = AdaptiveChunkSize(10, 40)
+    chunk_size.update(10, 0.1, lag=120)
+    assert chunk_size.update(15, 0.3, lag=120) == 15
+
+
+def test_shrinks_on_latency_spike():
+    chunk_size = AdaptiveChunkSize(10, 40)
+    chunk_size.update(10, 0.1, lag=120)
+    assert chunk_size.update(15, 1.5, lag=120) == 7
+
+
+def test_shrinks_on_errors():
+    chunk_size = AdaptiveChunkSize(10, 40)
+    sizes = [chunk_size.update(10, 0.1, lag=120, has_errors=True) for i in range(5)]
+    assert sizes == [5, 2, 1, 1, 1]
+    assert chunk_size.time_per_change is None
+
+
+def test_recovers_initial_size_without_lag():
+    chunk_size = AdaptiveChunkSize(10, 40)
+    chunk_size.update(10, 0.1, lag=0, has_errors=True)
+    sizes = [chunk_size.update(chunk_size.size, chunk_size.size * 0.01, lag=0) for i in range(3)]
+    assert sizes == [8, 10, 10]
+
+
+def test_full_chunk_with_duplicates():
+    chunk_size = AdaptiveChunkSize(10, 40)
+    assert chunk_size.update(10, 0.04, lag=120, num_processed=4) == 15
+    assert chunk_size.time_per_change == 0.01
@@ -1,8 +1,10 @@
+from datetime import datetime, timedelta
 from unittest.mock import Mock, patch
 
 import pytest
 from testil import Config
 
+from pillowtop.chunk_documents import get_chunk_document
 from pillowtop.exceptions import PillowtopCheckpointReset
 
 from ..pillow.interface import ConstructedPillow
@@ -97,6 +99,223 @@ def test_process_changes(cfg, expected_calls):
     assert calls == expected_calls
 
 
+@pytest.mark.parametrize("cfg, expected_calls", [
+    (cfg(changes=[1, 2, 3], chunk_size=2), [
+        "batch [1, 2]",
+        "checkpoint 2 seen=2 seq=2",
+        "batch [3]",
+        "checkpoint 3 seen=3 seq=3",
+    ]),
+    (cfg(changes=[1, None, None, 2], chunk_size=2), [
+        "batch [1]",
+        "checkpoint 1 seen=1 seq=1",
+        "checkpoint None",
+        "batch [2]",
+        "checkpoint 2 seen=2 seq=2",
+    ]),
+    (cfg(changes=[]), []),
+])
+def test_process_changes_pipelined(cfg, expected_calls):
+    class feed:
+        def iter_changes(**args):
+            for change in cfg.changes:
+                read.append(change)
+                yield change
+
+    def batch_proc(changes, documents=None):
+        calls.append(f"batch {changes}")
+
+    def checkpoint(change, context, new_seq=None):
+        seen = "" if context is None else f" seen={context.changes_seen} seq={new_seq}"
+        calls.append(f"checkpoint {change}{seen}")
+
+    pillow = ConstructedPillow(
+        name='TestPillow',
+        checkpoint=Mock(),
+        change_feed=feed,
+        processor=Config(supports_batch_processing=True),
+        processor_chunk_size=cfg.chunk_size,
+        pipeline_depth=1,
+    )
+    calls = []
+    read = []
+    with (
+        patch.object(pillow, '_batch_process_with_error_handling', batch_proc),
+        patch.object(pillow, '_prefetch_documents'),
+        patch.object(pillow, 'get_checkpoint_sequence', lambda change: change),
+        patch.object(pillow, '_record_timeout_in_datadog'),
+        patch.object(pillow, '_update_checkpoint', checkpoint),
+        patch('pillowtop.pillow.interface.cleanup_connections'),
+    ):
+        pillow.process_changes(since=None, forever=cfg.forever)
+    assert calls == expected_calls
+    assert read == cfg.changes
+
+
+def test_process_changes_pipelined_error():
+    class feed:
+        def iter_changes(**args):
+            yield 1
+            raise ValueError("feed error")
+
+    pillow = ConstructedPillow(
+        name='TestPillow',
+        checkpoint=Mock(),
+        change_feed=feed,
+        processor=Config(supports_batch_processing=True),
+        processor_chunk_size=1,
+        pipeline_depth=1,
+    )
+    batches = []
+    with (
+        patch.object(pillow, '_batch_process_with_error_handling', lambda changes, docs: batches.append(changes)),
+        patch.object(pillow, '_prefetch_documents'),
+        patch.object(pillow, 'get_checkpoint_sequence'),
+        patch.object(pillow, '_update_checkpoint'),
+        patch('pillowtop.pillow.interface.cleanup_connections'),
+        pytest.raises(ValueError, match="feed error"),
+    ):
+        pillow.process_changes(since=None, forever=True)
+    assert batches == [[1]]
+
+
+def test_batch_process_shares_prefetched_documents():
+    def fetch_docs(changes):
+        docs = [{'_id': c.id, 'doc_type': 'Doc'} for c in changes]
+        return set(), docs
+
+    def fetch_related(docs):
+        return [{'_id': f"{doc['_id']}-parent", 'doc_type': 'Parent'} for doc in docs]
+
+    def process_changes_chunk(changes):
+        found.extend([
+            get_chunk_document('Doc', 'a'),
+            get_chunk_document('Parent', 'a-parent'),
+            get_chunk_document('Parent', 'b'),
+        ])
+        return [], []
+
+    found = []
+    pillow = ConstructedPillow(
+        name='TestPillow',
+        checkpoint=Mock(),
+        change_feed=None,
+        processor=Config(supports_batch_processing=True, process_changes_chunk=process_changes_chunk),
+        processor_chunk_size=2,
+        prefetch_documents=True,
+        related_docs_fetcher=fetch_related,
+    )
+    changes = [Config(id='a', document_store=Mock()), Config(id='b', document_store=Mock())]
+    with (
+        patch('pillowtop.pillow.interface.bulk_fetch_changes_docs', fetch_docs),
+        patch.object(pillow, 'process_with_error_handling', return_value=0),
+        patch.object(pillow, '_record_datadog_metrics'),
+    ):
+        pillow._batch_process_with_error_handling(changes)
+    assert found == [
+        {'_id': 'a', 'doc_type': 'Doc'},
+        {'_id': 'a-parent', 'doc_type': 'Parent'},
+        None,
+    ]
+    assert get_chunk_document('Doc', 'a') is None
+
+
+@pytest.mark.parametrize("failed, expected_size", [(False, 15), (True, 5)])
+def test_batch_process_adapts_chunk_size(failed, expected_size):
+    def process_changes_chunk(changes):
+        return (changes if failed else []), []
+
+    pillow = ConstructedPillow(
+        name='TestPillow',
+        checkpoint=Mock(),
+        change_feed=None,
+        processor=Config(supports_batch_processing=True, process_changes_chunk=process_changes_chunk),
+        processor_chunk_size=10,
+        max_processor_chunk_size=100,
+    )
+    published = datetime.utcnow() - timedelta(hours=1)
+    changes = [Config(id=i, metadata=Config(publish_timestamp=published)) for i in range(10)]
+    with (
+        patch.object(pillow, 'process_with_error_handling', return_value=0),
+        patch.object(pillow, '_record_datadog_metrics'),
+        patch('pillowtop.pillow.interface.metrics_gauge') as metrics_gauge,
+    ):
+        pillow._batch_process_with_error_handling(changes)
+    assert pillow.processor_chunk_size == expected_size
+    assert metrics_gauge.call_args.args == ('commcare.change_feed.processor_chunk_size', expected_size)
+
+
+def test_batch_process_full_chunk_with_duplicates():
+    processed = []
+
+    def process_changes_chunk(changes):
+        processed.extend(changes)
+        return [], []
+
+    pillow = ConstructedPillow(
+        name='TestPillow',
+        checkpoint=Mock(),
+        change_feed=None,
+        processor=Config(supports_batch_processing=True, process_changes_chunk=process_changes_chunk),
+        processor_chunk_size=10,
+        max_processor_chunk_size=100,
+    )
+    published = datetime.utcnow() - timedelta(hours=1)
+    changes = [Config(id=i % 4, metadata=Config(publish_timestamp=published)) for i in range(10)]
+    with (
+        patch.object(pillow, 'process_with_error_handling', return_value=0),
+        patch.object(pillow, '_record_datadog_metrics'),
+        patch('pillowtop.pillow.interface.metrics_gauge'),
+    ):
+        pillow._batch_process_with_error_handling(changes)
+    assert len(processed) == 4
+    assert pillow.processor_chunk_size == 15
+
+
+def test_process_changes_with_change_window():
+    class feed:
+        sequence_format = 'json'
+
+        def iter_changes(**args):
+            for num, doc_id in enumerate(['a', 'b', 'a', 'a', 'c', None, 'd']):
+                yield None if doc_id is None else Config(id=doc_id, sequence_id=num, topic='case', partition=0)
+
+    def batch_proc(changes, documents=None):
+        calls.append(f"batch {[(c.id, c.sequence_id) for c in changes]}")
+
+    def checkpoint(change, context, new_seq=None):
+        calls.append(f"checkpoint {new_seq}")
+
+    pillow = ConstructedPillow(
+        name='TestPillow',
+        checkpoint=Mock(),
+        change_feed=feed,
+        processor=Config(supports_batch_processing=True),
+        processor_chunk_size=1,
+        change_window_size=3,
+    )
+    calls = []
+    with (
+        patch.object(pillow, '_batch_process_with_error_handling', batch_proc),
+        patch.object(pillow, 'get_checkpoint_sequence', lambda change: {('case', 0): 10}),
+        patch.object(pillow, '_record_coalesced_changes_in_datadog'),
+        patch.object(pillow, '_update_checkpoint', checkpoint),
+    ):
+        pillow.process_changes(since=None, forever=False)
+    assert calls == [
+        # b and c are still in the window
+        "batch [('a', 3)]",
+        "checkpoint {('case', 0): 1}",
+        "batch [('b', 1)]",
+        "checkpoint {('case', 0): 4}",
+        # consumer timeout
+        "batch [('c', 4)]",
+        "checkpoint {('case', 0): 10}",
+        "batch [('d', 6)]",
+        "checkpoint {('case', 0): 10}",
+    ]
+
+
 def test_run_should_continue_on_checkpoint_reset():
     class Stop(Exception):
         pass
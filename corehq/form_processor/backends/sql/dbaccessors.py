@@ -3,7 +3,7 @@ import itertools
 import operator
 import struct
 from abc import ABCMeta, abstractmethod, abstractproperty
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 from uuid import UUID
 
 from django.conf import settings
@@ -30,6 +30,7 @@ from corehq.form_processor.models import (
     LedgerValue,
     XFormInstance,
 )
+from corehq.form_processor.models.util import bulk_save
 from corehq.form_processor.utils.sql import fetchall_as_namedtuple
 from corehq.sql_db.config import plproxy_config
 from corehq.sql_db.util import (
@@ -463,13 +464,7 @@ class LedgerAccessorSQL(AbstractLedgerAccessor):
             return
 
         try:
-            if stock_result and stock_result.cases_with_deprecated_transactions:
-                db_cases = split_list_by_db_partition(stock_result.cases_with_deprecated_transactions)
-                for db_name, case_ids in db_cases:
-                    LedgerTransaction.objects.using(db_name).filter(
-                        case_id__in=case_ids,
-                        form_id=stock_result.xform.form_id
-                    ).delete()
+            LedgerAccessorSQL._delete_deprecated_transactions(stock_result)
 
             for ledger_value in ledger_values:
                 transactions_to_save = ledger_value.get_live_tracked_models(LedgerTransaction)
@@ -483,6 +478,49 @@ class LedgerAccessorSQL(AbstractLedgerAccessor):
         except InternalError as e:
             raise LedgerSaveError(e)
 
+    @staticmethod
+    def bulk_save_ledger_values(ledger_values, stock_result=None):
+        """Save ledger values with their transactions
+
+        Equivalent to ``save_ledger_values``, but the rows of each table
+        are written with one multi-row statement per database rather than
+        one statement per row.
+        """
+        if not ledger_values and not (stock_result and stock_result.cases_with_deprecated_transactions):
+            return
+
+        ledger_values_by_db = defaultdict(list)
+        for ledger_value in ledger_values:
+            ledger_values_by_db[ledger_value.db].append(ledger_value)
+
+        try:
+            LedgerAccessorSQL._delete_deprecated_transactions(stock_result)
+
+            for db_name, db_ledger_values in ledger_values_by_db.items():
+                transactions_to_save = [
+                    trans
+                    for ledger_value in db_ledger_values
+                    for trans in ledger_value.get_live_tracked_models(LedgerTransaction)
+                ]
+                with transaction.atomic(using=db_name, savepoint=False):
+                    bulk_save(db_name, LedgerValue, db_ledger_values)
+                    bulk_save(db_name, LedgerTransaction, transactions_to_save)
+
+                for ledger_value in db_ledger_values:
+                    ledger_value.clear_tracked_models()
+        except InternalError as e:
+            raise LedgerSaveError(e)
+
+    @staticmethod
+    def _delete_deprecated_transactions(stock_result):
+        if stock_result and stock_result.cases_with_deprecated_transactions:
+            db_cases = split_list_by_db_partition(stock_result.cases_with_deprecated_transactions)
+            for db_name, case_ids in db_cases:
+                LedgerTransaction.objects.using(db_name).filter(
+                    case_id__in=case_ids,
+                    form_id=stock_result.xform.form_id
+                ).delete()
+
     @staticmethod
     def get_ledger_transactions_for_case(case_id, section_id=None, entry_id=None):
         return list(LedgerTransaction.objects.plproxy_raw(
@@ -569,6 +607,108 @@ class LedgerAccessorSQL(AbstractLedgerAccessor):
         except InternalError as e:
             raise LedgerSaveError(e)
 
+    @staticmethod
+    def rebuild_ledgers(ledger_references):
+        """Rebuild ledger values and their transactions from the transaction history
+
+        Equivalent to replaying each ledger's transactions in report date
+        order (see ``LedgerProcessorSQL._rebuild_ledger_value_from_transactions``)
+        but the balances are computed with window functions and written
+        with one statement per database, so many ledgers can be rebuilt
+        per query. Ledger values without any transactions are deleted.
+
+        :param ledger_references: list of ``UniqueLedgerReference``
+        :return: tuple of two sets of ``UniqueLedgerReference``: ledgers
+        whose value or transactions changed, and ledgers that were deleted
+        """
+        from corehq.form_processor.parsers.ledgers.helpers import UniqueLedgerReference
+        rebuild_sql = """
+        WITH ledgers AS (
+            SELECT * FROM unnest(%(case_ids)s::text[], %(section_ids)s::text[], %(entry_ids)s::text[])
+                AS ledgers (case_id, section_id, entry_id)
+        ), ordered AS (
+            SELECT tx.id, tx.case_id, tx.section_id, tx.entry_id, tx.report_date,
+                CASE WHEN tx.type = %(balance)s THEN tx.updated_balance ELSE tx.delta END AS quantity,
+                -- each balance report starts a new group that ignores the preceding transactions
+                COUNT(*) FILTER (WHERE tx.type = %(balance)s) OVER ledger_history AS balance_group
+            FROM form_processor_ledgertransaction tx
+            JOIN ledgers ON (
+                tx.case_id = ledgers.case_id
+                AND tx.section_id = ledgers.section_id
+                AND tx.entry_id = ledgers.entry_id
+            )
+            WINDOW ledger_history AS (PARTITION BY tx.case_id, tx.section_id, tx.entry_id
+                                      ORDER BY tx.report_date, tx.id)
+        ), balances AS (
+            SELECT *, SUM(quantity) OVER (
+                PARTITION BY case_id, section_id, entry_id, balance_group ORDER BY report_date, id
+            )::bigint AS new_balance
+            FROM ordered
+        ), computed AS (
+            SELECT *,
+                new_balance - COALESCE(LAG(new_balance) OVER ledger_history, 0) AS new_delta,
+                ROW_NUMBER() OVER (PARTITION BY case_id, section_id, entry_id
+                                   ORDER BY report_date DESC, id DESC) AS position_from_end
+            FROM balances
+            WINDOW ledger_history AS (PARTITION BY case_id, section_id, entry_id ORDER BY report_date, id)
+        ), updated_transactions AS (
+            UPDATE form_processor_ledgertransaction tx
+            SET delta = computed.new_delta, updated_balance = computed.new_balance
+            FROM computed
+            WHERE tx.id = computed.id
+                AND (tx.delta <> computed.new_delta OR tx.updated_balance <> computed.new_balance)
+            RETURNING tx.case_id, tx.section_id, tx.entry_id
+        ), updated_values AS (
+            UPDATE form_processor_ledgervalue lv
+            SET balance = computed.new_balance
+            FROM computed
+            WHERE computed.position_from_end = 1
+                AND lv.case_id = computed.case_id
+                AND lv.section_id = computed.section_id
+                AND lv.entry_id = computed.entry_id
+                AND lv.balance <> computed.new_balance
+            RETURNING lv.case_id, lv.section_id, lv.entry_id
+        ), deleted_values AS (
+            DELETE FROM form_processor_ledgervalue lv
+            USING ledgers
+            WHERE lv.case_id = ledgers.case_id
+                AND lv.section_id = ledgers.section_id
+                AND lv.entry_id = ledgers.entry_id
+                AND NOT EXISTS (
+                    SELECT 1 FROM form_processor_ledgertransaction tx
+                    WHERE tx.case_id = lv.case_id
+                        AND tx.section_id = lv.section_id
+                        AND tx.entry_id = lv.entry_id
+                )
+            RETURNING lv.case_id, lv.section_id, lv.entry_id
+        )
+        SELECT FALSE AS deleted, * FROM updated_transactions
+        UNION SELECT FALSE AS deleted, * FROM updated_values
+        UNION SELECT TRUE AS deleted, * FROM deleted_values
+        """
+        refs_by_case = defaultdict(list)
+        for ref in ledger_references:
+            refs_by_case[ref.case_id].append(ref)
+
+        updated = set()
+        deleted = set()
+        try:
+            for db_name, case_ids in split_list_by_db_partition(list(refs_by_case)):
+                refs = [ref for case_id in case_ids for ref in refs_by_case[case_id]]
+                with LedgerTransaction.get_cursor_for_partition_db(db_name) as cursor:
+                    cursor.execute(rebuild_sql, {
+                        'case_ids': [ref.case_id for ref in refs],
+                        'section_ids': [ref.section_id for ref in refs],
+                        'entry_ids': [ref.entry_id for ref in refs],
+                        'balance': LedgerTransaction.TYPE_BALANCE,
+                    })
+                    for row in fetchall_as_namedtuple(cursor):
+                        ref = UniqueLedgerReference(row.case_id, row.section_id, row.entry_id)
+                        (deleted if row.deleted else updated).add(ref)
+        except InternalError as e:
+            raise LedgerSaveError(e)
+        return updated, deleted
+
     @staticmethod
     def get_ledger_transactions_for_form(form_id, limit_to_cases):
         for db_name, case_ids in split_list_by_db_partition(limit_to_cases):
@@ -1,3 +1,4 @@
+from corehq import toggles
 from corehq.apps.commtrack.processing import compute_ledger_values
 from corehq.form_processor.backends.sql.dbaccessors import LedgerAccessorSQL
 from corehq.form_processor.change_publishers import publish_ledger_v2_saved, publish_ledger_v2_deleted
@@ -5,6 +6,7 @@ from corehq.form_processor.exceptions import LedgerValueNotFound
 from corehq.form_processor.interfaces.ledger_processor import LedgerProcessorInterface, StockModelUpdateResult, \
     LedgerDBInterface
 from corehq.form_processor.models import LedgerValue, LedgerTransaction
+from corehq.form_processor.parsers.ledgers.helpers import UniqueLedgerReference
 from corehq.util.metrics.load_counters import ledger_load_counter
 
 
@@ -19,6 +21,19 @@ class LedgerDBSQL(LedgerDBInterface):
         except LedgerValueNotFound:
             return None
 
+    def _get_ledgers(self, unique_ledger_references):
+        ledger_values = LedgerAccessorSQL.get_ledger_values_for_cases(
+            list({ref.case_id for ref in unique_ledger_references}),
+            section_ids=list({ref.section_id for ref in unique_ledger_references}),
+            entry_ids=list({ref.entry_id for ref in unique_ledger_references}),
+        )
+        # the query matches any combination of the case, section and entry ids
+        return {
+            ledger_value.ledger_reference: ledger_value
+            for ledger_value in ledger_values
+            if ledger_value.ledger_reference in unique_ledger_references
+        }
+
 
 class LedgerProcessorSQL(LedgerProcessorInterface):
     """
@@ -34,6 +49,12 @@ class LedgerProcessorSQL(LedgerProcessorInterface):
             for deprecated_helper in deprecated_helpers
             for deprecated_transaction in deprecated_helper.transactions
         }
+        if toggles.BATCH_LEDGER_PROCESSING.enabled(self.domain, toggles.NAMESPACE_DOMAIN):
+            ledger_db.populate(ledgers_needing_rebuild | {
+                stock_trans.ledger_reference
+                for helper in stock_report_helpers
+                for stock_trans in helper.transactions
+            })
 
         updated_ledgers = {}
         for helper in stock_report_helpers:
@@ -112,6 +133,15 @@ class LedgerProcessorSQL(LedgerProcessorInterface):
 
     @classmethod
     def hard_rebuild_ledgers(cls, domain, case_id, section_id, entry_id):
+        if toggles.SET_BASED_LEDGER_REBUILD.enabled(domain, toggles.NAMESPACE_DOMAIN):
+            ref = UniqueLedgerReference(case_id, section_id, entry_id)
+            updated, deleted = LedgerAccessorSQL.rebuild_ledgers([ref])
+            if deleted:
+                publish_ledger_v2_deleted(domain, case_id, section_id, entry_id)
+            else:
+                # consumption is recomputed from the transactions when the change is processed
+                publish_ledger_v2_saved(LedgerValue(domain=domain, **ref._asdict()))
+            return
         transactions = LedgerAccessorSQL.get_ledger_transactions_for_case(case_id, section_id, entry_id)
         if not transactions:
             LedgerAccessorSQL.delete_ledger_values(case_id, section_id, entry_id)
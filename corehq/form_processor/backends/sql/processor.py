@@ -16,6 +16,7 @@ from corehq.form_processor.change_publishers import (
     publish_form_saved, publish_case_saved, publish_ledger_v2_saved)
 from corehq.form_processor.exceptions import CaseNotFound, KafkaPublishingError
 from corehq.form_processor.interfaces.processor import CaseUpdateMetadata
+from corehq.form_processor.form_id_filter import form_id_filter
 from corehq.form_processor.models import (
     XFormInstance, CaseTransaction,
     CommCareCase, FormEditRebuild, Attachment, XFormOperation)
@@ -57,6 +58,8 @@ class FormProcessorSQL(object):
 
     @classmethod
     def is_duplicate(cls, xform_id, domain=None):
+        if not form_id_filter.might_contain(xform_id):
+            return False
         return XFormInstance.objects.form_exists(xform_id, domain=domain)
 
     @classmethod
@@ -115,12 +118,19 @@ class FormProcessorSQL(object):
 
                 XFormInstance.objects.save_new_form(processed_forms.submitted)
                 if cases:
-                    for case in cases:
-                        case.save(with_tracked_models=True)
+                    domain = processed_forms.submitted.domain
+                    if toggles.BULK_SAVE_CASES.enabled(domain, toggles.NAMESPACE_DOMAIN):
+                        CommCareCase.objects.save_cases(cases)
+                    else:
+                        for case in cases:
+                            case.save(with_tracked_models=True)
 
                 if stock_result:
                     ledgers_to_save = stock_result.models_to_save
-                    LedgerAccessorSQL.save_ledger_values(ledgers_to_save, stock_result)
+                    if toggles.BATCH_LEDGER_PROCESSING.enabled(stock_result.domain, toggles.NAMESPACE_DOMAIN):
+                        LedgerAccessorSQL.bulk_save_ledger_values(ledgers_to_save, stock_result)
+                    else:
+                        LedgerAccessorSQL.save_ledger_values(ledgers_to_save, stock_result)
 
             if cases:
                 sort_submissions = toggles.SORT_OUT_OF_ORDER_FORM_SUBMISSIONS_SQL.enabled(
@@ -254,7 +264,10 @@ class FormProcessorSQL(object):
                     )
         else:
             xform = xforms[0]
-            for case_update in get_case_updates(xform):
+            case_updates = get_case_updates(xform)
+            if toggles.BATCH_CASE_LOCKS.enabled(xform.domain, toggles.NAMESPACE_DOMAIN):
+                case_db.populate([case_update.id for case_update in case_updates if case_update.id])
+            for case_update in case_updates:
                 case_update_meta = case_db.get_case_from_case_update(case_update, xform)
                 if case_update_meta.case:
                     case_id = case_update_meta.case.case_id
@@ -302,7 +315,11 @@ class FormProcessorSQL(object):
     @staticmethod
     def _rebuild_case_from_transactions(case, detail, updated_xforms=None):
         strategy = SqlCaseUpdateStrategy(case)
-        transactions = strategy.get_transactions_for_rebuild(updated_xforms)
+        use_snapshots = strategy.can_use_snapshots()
+        if use_snapshots:
+            transactions, snapshot = strategy.get_transactions_for_incremental_rebuild(updated_xforms)
+        else:
+            transactions, snapshot = strategy.get_transactions_for_rebuild(updated_xforms), None
 
         rebuild_transaction = CaseTransaction.rebuild_transaction(case, detail)
         if updated_xforms:
@@ -312,7 +329,8 @@ class FormProcessorSQL(object):
             # we're rebuilding because a form was un-archived
             unarchived_form_id = detail.form_id
         strategy.rebuild_from_transactions(
-            transactions, rebuild_transaction, unarchived_form_id=unarchived_form_id
+            transactions, rebuild_transaction, unarchived_form_id=unarchived_form_id,
+            snapshot=snapshot, take_snapshots=use_snapshots,
         )
         return case, rebuild_transaction
 
@@ -325,6 +343,36 @@ class FormProcessorSQL(object):
     def form_has_case_transactions(form_id):
         return CaseTransaction.objects.exists_for_form(form_id)
 
+    @staticmethod
+    def get_cases_with_locks(case_ids):
+        """Get existing cases, each locked
+
+        Only cases that exist are locked. Locks are acquired in order of
+        case id so that processes locking overlapping sets of cases
+        cannot deadlock, and the cases are read again once locked. If a
+        lock cannot be acquired because of a Redis error the case is
+        read without it, like ``get_case_with_lock`` does.
+
+        :returns: tuple(cases, locks)
+        """
+        existing_ids = sorted(case.case_id for case in CommCareCase.objects.get_cases(list(case_ids)))
+        if not existing_ids:
+            return [], []
+        locks = []
+        try:
+            for case_id in existing_ids:
+                lock = CommCareCase.get_obj_lock_by_id(case_id)
+                try:
+                    locks.append(acquire_lock(lock, degrade_gracefully=False, blocking=True))
+                except redis.RedisError:
+                    pass
+            cases = CommCareCase.objects.get_cases(existing_ids)
+        except BaseException:
+            for lock in locks:
+                release_lock(lock, degrade_gracefully=True)
+            raise
+        return cases, locks
+
     @staticmethod
     def get_case_with_lock(case_id, lock=False, wrap=False):
         try:
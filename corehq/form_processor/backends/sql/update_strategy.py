@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import sys
+from datetime import datetime
 from functools import cmp_to_key
 
 from django.utils.translation import gettext as _
@@ -24,6 +26,7 @@ from corehq import toggles
 from corehq.form_processor.exceptions import StockProcessingError
 from corehq.form_processor.models import (
     CaseAttachment,
+    CaseSnapshot,
     CaseTransaction,
     CommCareCaseIndex,
     CommCareCase,
@@ -39,6 +42,15 @@ from corehq.util.soft_assert import soft_assert
 
 reconciliation_soft_assert = soft_assert('@'.join(['dmiller', 'dimagi.com']))
 
+# number of transactions between the snapshots taken while rebuilding a case
+CASE_SNAPSHOT_INTERVAL = 100
+# case fields reset by a rebuild and set from the transactions applied
+CASE_SNAPSHOT_FIELDS = (
+    'type', 'name', 'owner_id', 'external_id', 'location_id', 'case_json',
+    'opened_on', 'opened_by', 'modified_on', 'modified_by', 'closed', 'closed_on', 'closed_by',
+)
+CASE_SNAPSHOT_DATETIME_FIELDS = ('opened_on', 'modified_on', 'closed_on')
+
 
 def _validate_length(length):
     def __inner(value):
@@ -187,25 +199,33 @@ class SqlCaseUpdateStrategy(UpdateStrategy):
             return
 
         for index_update in action.indices:
-            if self.case.has_index(index_update.identifier):
-                # update
-                index = self.case.get_index(index_update.identifier)
-                index.referenced_type = index_update.referenced_type
-                index.referenced_id = index_update.referenced_id
-                index.relationship = index_update.relationship
-                self.case.track_update(index)
-            else:
-                # no id, no index
-                if index_update.referenced_id:
-                    index = CommCareCaseIndex(
-                        domain=self.case.domain,
-                        case=self.case,
-                        identifier=index_update.identifier,
-                        referenced_type=index_update.referenced_type,
-                        referenced_id=index_update.referenced_id,
-                        relationship=index_update.relationship
-                    )
-                    self.case.track_create(index)
+            self._update_index(
+                index_update.identifier,
+                index_update.referenced_type,
+                index_update.referenced_id,
+                index_update.relationship,
+            )
+
+    def _update_index(self, identifier, referenced_type, referenced_id, relationship):
+        if self.case.has_index(identifier):
+            # update
+            index = self.case.get_index(identifier)
+            index.referenced_type = referenced_type
+            index.referenced_id = referenced_id
+            index.relationship = relationship
+            self.case.track_update(index)
+        else:
+            # no id, no index
+            if referenced_id:
+                index = CommCareCaseIndex(
+                    domain=self.case.domain,
+                    case=self.case,
+                    identifier=identifier,
+                    referenced_type=referenced_type,
+                    referenced_id=referenced_id,
+                    relationship=relationship
+                )
+                self.case.track_create(index)
 
     def _apply_attachments_action(self, attachment_action, xform):
         if not toggles.MM_CASE_PROPERTIES.enabled(self.case.domain):
@@ -259,12 +279,17 @@ class SqlCaseUpdateStrategy(UpdateStrategy):
         self.case.closed_on = None
         self.case.closed_by = ''
 
-    def rebuild_from_transactions(self, transactions, rebuild_transaction, unarchived_form_id=None):
+    def rebuild_from_transactions(self, transactions, rebuild_transaction, unarchived_form_id=None,
+                                  snapshot=None, take_snapshots=False):
         """
         :param transactions:        The transactions required to rebuild the case
         :param rebuild_transaction: The transaction to add for this rebuild
         :param unarchived_form_id:  If this rebuild was triggered by a form being unarchived then this is
                                     its ID.
+        :param snapshot:            ``CaseSnapshot`` to resume the rebuild from. Only the transactions
+                                    following it are applied.
+        :param take_snapshots:      Take a snapshot of the case every ``CASE_SNAPSHOT_INTERVAL``
+                                    transactions.
         """
         already_deleted = False
         if self.case.is_deleted:
@@ -284,13 +309,26 @@ class SqlCaseUpdateStrategy(UpdateStrategy):
         original_indices = {index.identifier: index for index in self.case.indices}
         original_attachments = {attach.name: attach for attach in self.case.get_attachments()}
 
-        real_transactions = []
-        for transaction in transactions:
+        start = 0
+        relevant_count = 0
+        if snapshot:
+            self._restore_snapshot(snapshot)
+            start = snapshot.transaction_count
+            relevant_count = snapshot.relevant_count
+
+        digest = hashlib.sha1()
+        for count, transaction in enumerate(transactions, start=1):
+            if take_snapshots:
+                _update_transactions_digest(digest, transaction)
+            if count <= start:
+                continue
             if transaction.is_form_transaction and transaction.is_relevant:
                 self._apply_form_transaction(transaction)
-                real_transactions.append(transaction)
+                relevant_count += 1
                 if not transaction.is_saved():
                     self.case.track_create(transaction)
+            if take_snapshots and count % CASE_SNAPSHOT_INTERVAL == 0 and count < len(transactions):
+                self.case.track_create(self._get_snapshot(count, digest.hexdigest(), relevant_count))
 
         self._delete_old_related_models(
             original_indices,
@@ -302,12 +340,47 @@ class SqlCaseUpdateStrategy(UpdateStrategy):
             key="name",
         )
 
-        self.case.deleted = already_deleted or not bool(real_transactions)
+        self.case.deleted = already_deleted or not relevant_count
 
         self.case.track_create(rebuild_transaction)
         if not self.case.modified_on:
             self.case.modified_on = rebuild_transaction.server_date
 
+    def _get_snapshot(self, transaction_count, transactions_digest, relevant_count):
+        fields = {}
+        for name in CASE_SNAPSHOT_FIELDS:
+            value = getattr(self.case, name)
+            if name == 'case_json':
+                value = dict(value)
+            elif name in CASE_SNAPSHOT_DATETIME_FIELDS and value is not None:
+                value = value.isoformat()
+            fields[name] = value
+        # indices updated by the transactions applied so far
+        indices = {
+            index.identifier: {
+                'identifier': index.identifier,
+                'referenced_type': index.referenced_type,
+                'referenced_id': index.referenced_id,
+                'relationship': index.relationship,
+            }
+            for index in self.case.get_live_tracked_models(CommCareCaseIndex)
+        }
+        return CaseSnapshot(
+            case=self.case,
+            transaction_count=transaction_count,
+            transactions_digest=transactions_digest,
+            relevant_count=relevant_count,
+            state={'fields': fields, 'indices': list(indices.values())},
+        )
+
+    def _restore_snapshot(self, snapshot):
+        for name, value in snapshot.state['fields'].items():
+            if name in CASE_SNAPSHOT_DATETIME_FIELDS and value is not None:
+                value = datetime.fromisoformat(value)
+            setattr(self.case, name, value)
+        for index in snapshot.state['indices']:
+            self._update_index(**index)
+
     def reconcile_transactions_if_necessary(self):
         if self.case.check_transaction_order():
             return False
@@ -369,12 +442,92 @@ class SqlCaseUpdateStrategy(UpdateStrategy):
         self._fetch_case_transaction_forms(transactions, updated_xforms)
         return transactions
 
-    def _fetch_case_transaction_forms(self, transactions, updated_xforms=None):
+    def can_use_snapshots(self):
+        """Whether rebuilds of this case may take and resume from snapshots
+
+        Snapshots do not record attachments, so they are not used where
+        cases can have them.
+        """
+        domain = self.case.domain
+        return (
+            toggles.CASE_REBUILD_SNAPSHOTS.enabled(domain, toggles.NAMESPACE_DOMAIN)
+            and not toggles.MM_CASE_PROPERTIES.enabled(domain)
+        )
+
+    def get_transactions_for_incremental_rebuild(self, updated_xforms=None):
+        """
+        Like ``get_transactions_for_rebuild`` but also find the latest
+        snapshot the rebuild can resume from. Forms are only fetched for
+        the transactions following that snapshot.
+
+        Snapshots that can no longer be resumed from are tracked for
+        deletion with the case.
+
+        :param updated_xforms: optional list of forms that have been changed.
+        :return: tuple(transactions, snapshot). ``snapshot`` is ``None`` if
+                 the case must be rebuilt from its first transaction.
+        """
+        transactions = CaseTransaction.objects.get_transactions_for_case_rebuild(self.case.case_id)
+        snapshot = self._get_resume_snapshot(transactions, updated_xforms)
+        start = snapshot.transaction_count if snapshot else 0
+        self._fetch_case_transaction_forms(transactions, updated_xforms, start=start)
+        return transactions, snapshot
+
+    def _get_resume_snapshot(self, transactions, updated_xforms=None):
+        """Get the latest snapshot that is still valid
+
+        A snapshot is valid if the transactions preceding it are the same,
+        in the same order, as when it was taken, none of their forms have
+        been edited or deleted since and none of them are being updated.
+        """
+        if not self.case.is_saved():
+            return None
+        snapshots = CaseSnapshot.objects.get_snapshots(self.case.case_id)
+        if not snapshots:
+            return None
+
+        updated_form_ids = {xform.form_id for xform in updated_xforms} if updated_xforms else set()
+        limit = next(
+            (i for i, tx in enumerate(transactions) if tx.form_id in updated_form_ids),
+            len(transactions)
+        )
+        digests = _get_transactions_digests(
+            transactions[:limit], {snapshot.transaction_count for snapshot in snapshots})
+        valid = [
+            snapshot for snapshot in snapshots
+            if digests.get(snapshot.transaction_count) == snapshot.transactions_digest
+        ]
+        if valid:
+            # forms edited or deleted after a snapshot was taken invalidate it
+            preceding = transactions[:valid[-1].transaction_count]
+            changed = XFormInstance.objects.get_forms_changed_since(
+                [tx.form_id for tx in preceding if tx.form_id],
+                min(snapshot.created_on for snapshot in valid),
+            )
+            changes = [
+                (count, changed[tx.form_id])
+                for count, tx in enumerate(preceding, start=1) if tx.form_id in changed
+            ]
+            valid = [
+                snapshot for snapshot in valid
+                if not any(
+                    count <= snapshot.transaction_count and changed_on > snapshot.created_on
+                    for count, changed_on in changes
+                )
+            ]
+
+        for snapshot in snapshots:
+            if snapshot not in valid:
+                self.case.track_delete(snapshot)
+        return valid[-1] if valid else None
+
+    def _fetch_case_transaction_forms(self, transactions, updated_xforms=None, start=0):
         """
         Fetch the forms for a list of transactions, caching them on each transaction
 
         :param transactions: list of ``CaseTransaction`` objects:
         :param updated_xforms: optional list of forms that have been changed.
+        :param start: index of the first transaction to fetch the form of.
         """
         form_ids = {tx.form_id for tx in transactions if tx.form_id}
         updated_xforms_map = {
@@ -382,7 +535,7 @@ class SqlCaseUpdateStrategy(UpdateStrategy):
         } if updated_xforms else {}
 
         updated_xform_ids = set(updated_xforms_map)
-        form_ids_to_fetch = list(form_ids - updated_xform_ids)
+        form_ids_to_fetch = list({tx.form_id for tx in transactions[start:] if tx.form_id} - updated_xform_ids)
         form_load_counter("rebuild_case", self.case.domain)(len(form_ids_to_fetch))
         xform_map = {
             form.form_id: form
@@ -412,7 +565,7 @@ class SqlCaseUpdateStrategy(UpdateStrategy):
             except KeyError:
                 raise XFormNotFound(form_id)
 
-        for case_transaction in transactions:
+        for case_transaction in transactions[start:]:
             if case_transaction.form_id:
                 try:
                     case_transaction.cached_form = get_form(case_transaction.form_id)
@@ -420,6 +573,21 @@ class SqlCaseUpdateStrategy(UpdateStrategy):
                     logging.error('Form not found during rebuild: %s', case_transaction.form_id)
 
 
+def _get_transactions_digests(transactions, counts):
+    """Get the digest of the first ``count`` transactions for each count"""
+    digests = {}
+    digest = hashlib.sha1()
+    for count, transaction in enumerate(transactions, start=1):
+        _update_transactions_digest(digest, transaction)
+        if count in counts:
+            digests[count] = digest.hexdigest()
+    return digests
+
+
+def _update_transactions_digest(digest, transaction):
+    digest.update(f"{transaction.form_id}\n".encode('utf-8'))
+
+
 def _transaction_sort_key_function(case):
 
     def transaction_cmp(first_transaction, second_transaction):
@@ -52,6 +52,8 @@ class AbstractCaseDbCache(metaclass=ABCMeta):
             raise ValueError('Currently locking only supports explicitly wrapping cases!')
         self.locks = []
         self._changed = set()
+        # IDs of cases found not to exist by populate
+        self._missing = set()
         # this is used to allow casedb to be re-entrant. Each new context pushes the parent context locks
         # onto this stack and restores them when the context exits
         self.lock_stack = []
@@ -91,6 +93,8 @@ class AbstractCaseDbCache(metaclass=ABCMeta):
             raise IllegalCaseId('case_id must not be empty')
         if case_id in self.cache:
             return self.cache[case_id]
+        if case_id in self._missing:
+            return None
 
         case, lock = self.processor_interface.get_case_with_lock(case_id, self.lock, self.wrap)
         if lock:
@@ -106,6 +110,7 @@ class AbstractCaseDbCache(metaclass=ABCMeta):
             self._track_load()
         self._validate_case(case)
         self.cache[case_id] = case
+        self._missing.discard(case_id)
 
     def in_cache(self, case_id):
         return case_id in self.cache
@@ -115,10 +120,21 @@ class AbstractCaseDbCache(metaclass=ABCMeta):
         Populates a set of IDs in the cache in bulk.
         Use this if you know you are going to need to access these later for performance gains.
         Does NOT overwrite what is already in the cache if there is already something there.
+
+        If this cache locks cases, all existing cases are locked with
+        one batch of reads rather than a read per case. Cases that do
+        not exist are not locked, so getting them to create them needs
+        no lock or read at all.
         """
-        case_ids = list(set(case_ids) - set(self.cache.keys()))
-        for case in self._iter_cases(case_ids):
+        case_ids = list(set(case_ids) - set(self.cache.keys()) - self._missing)
+        if self.lock:
+            cases, locks = self.processor_interface.get_cases_with_locks(case_ids)
+            self.locks.extend(locks)
+        else:
+            cases = self._iter_cases(case_ids)
+        for case in cases:
             self.set(_get_id_for_case(case), case)
+        self._missing.update(case_id for case_id in case_ids if case_id not in self.cache)
 
     @abstractmethod
     def _iter_cases(self, case_ids):
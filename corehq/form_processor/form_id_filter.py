@@ -0,0 +1,207 @@
+"""
+Bloom filter of the ids of all saved forms
+
+Submissions check whether their form id already exists before they are
+processed. Almost all form ids are new, so a filter that can answer
+"definitely not saved" lets those submissions skip the database lookup.
+
+The filter is a bitmap in redis sized by ``settings.FORM_ID_FILTER_BITS``.
+Form ids are added before a form is saved with a new id, and the
+``build_form_id_filter`` management command adds the ids of existing
+forms and then marks the filter complete.
+
+The filter is only consulted while it is known to be complete, and any
+doubt about that falls back to the database lookup:
+
+- Each build has an epoch, kept in ``FormIdFilterState`` in the database.
+  A complete filter stores its epoch in the first bytes of the bitmap,
+  so a filter that was evicted from redis (or recreated by adding ids
+  after that) no longer matches the complete epoch.
+- Form ids that could not be added increment the epoch in the database,
+  where a redis outage cannot lose the record. The filter is then not
+  used again until it is rebuilt, and a build that was running at the
+  time cannot be marked complete.
+- The complete epoch is cached by each process for ``STATE_CACHE_SECONDS``,
+  and is read again before an id is reported as not saved, so that an id
+  that could not be added by another process is never reported as new.
+  An id that could not be added also clears the epoch from the bitmap
+  when redis is available.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.db import router, transaction
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from corehq.form_processor.models import XFormInstance
+from corehq.util.metrics import metrics_counter
+from corehq.util.models import FormIdFilterState
+
+logger = logging.getLogger(__name__)
+
+NUM_HASHES = 7
+REDIS_KEY_PREFIX = "form-id-filter"
+# bytes at the start of the bitmap that hold the epoch of a complete filter
+EPOCH_BYTES = 8
+STATE_CACHE_SECONDS = 60
+# redis strings, and so bitmaps, are limited to 512MB
+MAX_BITMAP_BITS = 2 ** 32
+MAX_FILTER_BITS = MAX_BITMAP_BITS - EPOCH_BYTES * 8
+
+
+@checks.register('settings')
+def check_form_id_filter_bits(app_configs, **kwargs):
+    if settings.FORM_ID_FILTER_BITS > MAX_FILTER_BITS:
+        return [checks.Error(
+            f'settings.FORM_ID_FILTER_BITS must not be more than {MAX_FILTER_BITS}, '
+            'the size of a redis bitmap less the bytes that hold the epoch'
+        )]
+    return []
+
+
+class FormIdFilter:
+
+    def __init__(self):
+        self._state_cache = None
+
+    @property
+    def num_bits(self):
+        return settings.FORM_ID_FILTER_BITS
+
+    @property
+    def enabled(self):
+        # a filter too big for redis is reported by check_form_id_filter_bits
+        return 0 < self.num_bits <= MAX_FILTER_BITS
+
+    @property
+    def key(self):
+        # a filter of a different size needs a different key
+        return f"{REDIS_KEY_PREFIX}_{self.num_bits}"
+
+    def add(self, form_ids):
+        """Add form ids to the filter
+
+        :returns: ``False`` if the ids could not be added. The filter is
+        then incomplete until it is rebuilt. Raises if that could not be
+        recorded either, so that the forms are not saved.
+        """
+        if not self.enabled or not form_ids:
+            return True
+        pipe = get_redis_connection().pipeline(transaction=False)
+        for form_id in form_ids:
+            for offset in self._get_offsets(form_id):
+                pipe.setbit(self.key, offset, 1)
+        try:
+            pipe.execute()
+        except RedisError:
+            logger.exception("Could not add form ids to the form id filter")
+            self._invalidate()
+            self._clear_epoch()
+            return False
+        return True
+
+    def might_contain(self, form_id):
+        """Check whether a form with this id might have been saved
+
+        :returns: ``False`` only if no form with this id has been saved.
+        """
+        if not self.enabled:
+            return True
+        complete_epoch = self._get_complete_epoch()
+        if complete_epoch is None:
+            return True
+        pipe = get_redis_connection().pipeline(transaction=False)
+        pipe.getrange(self.key, 0, EPOCH_BYTES - 1)
+        for offset in self._get_offsets(form_id):
+            pipe.getbit(self.key, offset)
+        try:
+            epoch, *bits = pipe.execute()
+        except RedisError:
+            self._state_cache = None
+            return True
+        if epoch != self._pack_epoch(complete_epoch):
+            return True
+        found = all(bits)
+        if not found and self._get_complete_epoch(cached=False) != complete_epoch:
+            # the id may have failed to be added since the epoch was cached
+            return True
+        metrics_counter('commcare.form_id_filter.lookups', tags={'found': found})
+        return found
+
+    def start_build(self):
+        """Start building the filter
+
+        :returns: the epoch of the build, to be passed to ``mark_complete``.
+        """
+        return self._invalidate()
+
+    def mark_complete(self, epoch):
+        """Mark the filter complete once all form ids have been added
+
+        :returns: ``False`` if form ids could not be added to the filter
+        or another build was started since ``epoch`` started.
+        """
+        get_redis_connection().setrange(self.key, 0, self._pack_epoch(epoch))
+        updated = FormIdFilterState.objects.filter(key=self.key, epoch=epoch).update(complete=True)
+        self._state_cache = None
+        return bool(updated)
+
+    def clear(self):
+        self._invalidate()
+        get_redis_connection().delete(self.key)
+
+    def _invalidate(self):
+        with transaction.atomic(using=router.db_for_write(FormIdFilterState)):
+            state, _ = FormIdFilterState.objects.select_for_update().get_or_create(key=self.key)
+            state.epoch += 1
+            state.complete = False
+            state.save()
+        self._state_cache = None
+        return state.epoch
+
+    def _clear_epoch(self):
+        try:
+            get_redis_connection().setrange(self.key, 0, self._pack_epoch(0))
+        except RedisError:
+            logger.exception("Could not clear the epoch of the form id filter")
+
+    def _get_complete_epoch(self, cached=True):
+        now = time.monotonic()
+        if (
+            not cached or self._state_cache is None
+            or self._state_cache[0] != self.key or self._state_cache[2] < now
+        ):
+            epoch = FormIdFilterState.objects.filter(
+                key=self.key, complete=True,
+            ).values_list('epoch', flat=True).first()
+            self._state_cache = (self.key, epoch, now + STATE_CACHE_SECONDS)
+        return self._state_cache[1]
+
+    @staticmethod
+    def _pack_epoch(epoch):
+        return epoch.to_bytes(EPOCH_BYTES, 'big')
+
+    def _get_offsets(self, form_id):
+        # double hashing: k offsets from two independent 64 bit hashes,
+        # after the bytes that hold the epoch
+        digest = hashlib.sha1(form_id.encode('utf-8')).digest()
+        hash1 = int.from_bytes(digest[:8], 'big')
+        hash2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [EPOCH_BYTES * 8 + (hash1 + i * hash2) % self.num_bits for i in range(NUM_HASHES)]
+
+
+form_id_filter = FormIdFilter()
+
+
+@receiver(pre_save, sender=XFormInstance)
+def add_form_id_to_filter(sender, instance, raw=False, **kwargs):
+    # added before the form is saved so that a failure after this
+    # leaves a false positive rather than a false negative
+    if raw or not instance.is_saved() or instance.form_id_updated():
+        form_id_filter.add([instance.form_id])
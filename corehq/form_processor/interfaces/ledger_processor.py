@@ -44,6 +44,18 @@ class LedgerDBInterface(metaclass=ABCMeta):
         ledger = self.get_ledger(unique_ledger_reference)
         return ledger.stock_on_hand if ledger else 0
 
+    def populate(self, unique_ledger_references):
+        """
+        Load a set of ledgers in bulk. Use this if you know you are going
+        to need them later. Ledgers that do not exist are cached as such.
+        """
+        references = set(unique_ledger_references) - set(self._ledgers)
+        if not references:
+            return
+        ledgers = self._get_ledgers(references)
+        for reference in references:
+            self._ledgers[reference] = ledgers.get(reference)
+
     @abstractmethod
     def get_ledgers_for_case(self, case_id):
         pass
@@ -52,6 +64,13 @@ class LedgerDBInterface(metaclass=ABCMeta):
     def _get_ledger(self, unique_ledger_reference):
         pass
 
+    @abstractmethod
+    def _get_ledgers(self, unique_ledger_references):
+        """
+        :returns: dict of reference to ledger for the ledgers that exist.
+        """
+        pass
+
 
 class LedgerProcessorInterface(metaclass=ABCMeta):
     def __init__(self, domain):
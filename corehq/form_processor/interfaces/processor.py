@@ -218,6 +218,16 @@ class FormProcessorInterface(object):
         return self.processor.get_case_with_lock(case_id, lock, wrap)
 
 
+    def get_cases_with_locks(self, case_ids):
+        """
+        Get existing cases, each with a Redis lock. Cases that do not
+        exist are not locked.
+
+        :return: tuple(cases, locks)
+        """
+        return self.processor.get_cases_with_locks(case_ids)
+
+
 def _list_to_processed_forms_tuple(forms):
     """
     :param forms: List of forms (either 1 or 2)
@@ -0,0 +1,286 @@
+"""
+Benchmark form submission processing
+
+Replays a corpus of synthetic forms through ``SubmissionPost`` and
+reports the duration of each stage recorded in its ``TimingContext``
+along with the number of SQL queries per submission. Run it against a
+local database before and after a change to compare the results:
+
+    ./manage.py benchmark_submissions bench-domain --output before.json
+    ./manage.py benchmark_submissions bench-domain --compare before.json
+"""
+import json
+import statistics
+import uuid
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+
+from django.core.management import BaseCommand
+from django.db import connections
+from django.template.loader import render_to_string
+
+from casexml.apps.case.mock import CaseBlock
+from dimagi.utils.parsing import json_format_datetime
+
+from corehq.apps.hqcase.utils import SYSTEM_FORM_XMLNS
+from corehq.apps.receiverwrapper.util import submit_form_locally
+from corehq.form_processor.backends.sql.dbaccessors import LedgerAccessorSQL
+from corehq.form_processor.models import CommCareCase, XFormInstance
+from corehq.util.decorators import require_debug_true
+from corehq.util.timer import TimingContext
+
+LEDGER_XMLNS = 'http://commcarehq.org/ledger/v1'
+
+
+class Command(BaseCommand):
+    help = "Benchmark form submission processing with synthetic forms."
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain', help='Domain to submit forms to.')
+        parser.add_argument('--scenario', dest='scenarios', action='append', choices=list(SCENARIOS),
+                            help='Scenario to run. May be repeated. Defaults to all scenarios.')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Number of measured submissions per scenario.')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Number of unmeasured submissions per scenario run first.')
+        parser.add_argument('--cases', type=int, default=50,
+                            help='Number of cases in each many_cases form.')
+        parser.add_argument('--ledgers', type=int, default=50,
+                            help='Number of ledger entries in each ledgers form.')
+        parser.add_argument('--output', help='Write results to this JSON file.')
+        parser.add_argument('--compare', help='Compare results with those in this JSON file.')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Do not delete the forms, cases and ledgers created.')
+
+    @require_debug_true()
+    def handle(self, domain, scenarios, iterations, warmup, output, compare, keep_data, **options):
+        corpus = Corpus(domain, cases_per_form=options['cases'], ledgers_per_form=options['ledgers'])
+        results = {}
+        try:
+            for name in scenarios or SCENARIOS:
+                scenario = SCENARIOS[name]
+                for i in range(warmup):
+                    scenario(corpus)
+                samples = [scenario(corpus) for i in range(iterations)]
+                results[name] = summarize(samples)
+                self.stdout.write(format_summary(name, results[name]))
+        finally:
+            if not keep_data:
+                corpus.delete_data()
+
+        if output:
+            with open(output, 'w', encoding='utf-8') as fh:
+                json.dump({'date': datetime.utcnow().isoformat(), 'results': results}, fh, indent=2)
+        if compare:
+            with open(compare, encoding='utf-8') as fh:
+                baseline = json.load(fh)['results']
+            self.stdout.write(format_comparison(baseline, results))
+
+
+class Corpus:
+    """Generates synthetic forms and tracks what they create"""
+
+    def __init__(self, domain, cases_per_form, ledgers_per_form):
+        self.domain = domain
+        self.cases_per_form = cases_per_form
+        self.ledgers_per_form = ledgers_per_form
+        self.form_ids = set()
+        self.case_ids = set()
+
+    def form(self, case_blocks, form_id=None):
+        form_id = form_id or uuid.uuid4().hex
+        self.form_ids.add(form_id)
+        now = json_format_datetime(datetime.utcnow())
+        return form_id, render_to_string('hqcase/xml/case_block.xml', {
+            'xmlns': SYSTEM_FORM_XMLNS,
+            'case_block': ''.join(case_blocks),
+            'time': now,
+            'uid': form_id,
+            'username': 'benchmark',
+            'user_id': 'benchmark',
+            'device_id': 'benchmark_submissions',
+        })
+
+    def case_block(self, case_id=None, **kwargs):
+        case_id = case_id or uuid.uuid4().hex
+        self.case_ids.add(case_id)
+        kwargs.setdefault('create', True)
+        if kwargs['create']:
+            kwargs.setdefault('case_type', 'benchmark')
+            kwargs.setdefault('case_name', 'benchmark %s' % case_id)
+        return CaseBlock(case_id=case_id, **kwargs).as_text()
+
+    def balance_blocks(self, case_id):
+        date = json_format_datetime(datetime.utcnow())
+        return [
+            f'<balance xmlns="{LEDGER_XMLNS}" entity-id="{case_id}" date="{date}" section-id="stock">'
+            f'<entry id="product{i}" quantity="{i}" /></balance>'
+            for i in range(self.ledgers_per_form)
+        ]
+
+    def delete_data(self):
+        case_ids = list(self.case_ids)
+        for case_id in case_ids:
+            LedgerAccessorSQL.delete_ledger_values(case_id)
+        CommCareCase.objects.hard_delete_cases(self.domain, case_ids, publish_changes=False)
+        XFormInstance.objects.hard_delete_forms(self.domain, list(self.form_ids), publish_changes=False)
+
+
+def simple(corpus):
+    form_id, xml = corpus.form([corpus.case_block()])
+    return submit(corpus, xml)
+
+
+def many_cases(corpus):
+    form_id, xml = corpus.form([corpus.case_block() for i in range(corpus.cases_per_form)])
+    return submit(corpus, xml)
+
+
+def ledgers(corpus):
+    case_id = uuid.uuid4().hex
+    form_id, xml = corpus.form([corpus.case_block(case_id)] + corpus.balance_blocks(case_id))
+    return submit(corpus, xml)
+
+
+def edit(corpus):
+    case_id = uuid.uuid4().hex
+    form_id, xml = corpus.form([corpus.case_block(case_id)])
+    submit(corpus, xml)
+    form_id, xml = corpus.form([corpus.case_block(case_id, update={'edited': 'yes'})], form_id)
+    return submit(corpus, xml)
+
+
+def duplicate(corpus):
+    form_id, xml = corpus.form([corpus.case_block()])
+    submit(corpus, xml)
+    return submit(corpus, xml)
+
+
+SCENARIOS = {
+    'simple': simple,
+    'many_cases': many_cases,
+    'ledgers': ledgers,
+    'edit': edit,
+    'duplicate': duplicate,
+}
+
+
+def submit(corpus, xml):
+    """Submit a form and measure it
+
+    :returns: Dict with the submission's total duration, the duration of
+    each stage and the number of queries it made.
+    """
+    timing_context = TimingContext('submission')
+    with count_queries() as queries, timing_context:
+        result = submit_form_locally(xml, corpus.domain, max_wait=None, timing_context=timing_context)
+    # duplicates and the deprecated copies of edited forms get new ids
+    corpus.form_ids.add(result.xform.form_id)
+    if getattr(result.xform, 'deprecated_form_id', None):
+        corpus.form_ids.add(result.xform.deprecated_form_id)
+    return {
+        'duration': timing_context.root.duration,
+        'stages': get_stage_durations(timing_context.root),
+        'queries': queries.count,
+    }
+
+
+def get_stage_durations(timer):
+    """Get durations by stage path, e.g. ``save_models/post_save_actions``
+
+    Stages named after a form or case, like signal receivers, are
+    combined into one stage.
+    """
+    durations = defaultdict(float)
+
+    def add(timer, prefix):
+        for sub in timer.subs:
+            path = prefix + sub.name.split(' ', 1)[0]
+            durations[path] += sub.duration or 0
+            add(sub, path + '/')
+
+    add(timer, '')
+    return dict(durations)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def summarize(samples):
+    stages = defaultdict(list)
+    for sample in samples:
+        for path, duration in sample['stages'].items():
+            stages[path].append(duration)
+    return {
+        'count': len(samples),
+        'duration': _stats([s['duration'] for s in samples]),
+        'queries': _stats([s['queries'] for s in samples]),
+        'stages': {path: _stats(values) for path, values in stages.items()},
+    }
+
+
+def _stats(values):
+    values = sorted(values)
+    return {
+        'mean': statistics.mean(values),
+        'p50': values[len(values) // 2],
+        'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+        'max': values[-1],
+    }
+
+
+def format_summary(name, summary):
+    lines = [
+        f"{name}: {summary['count']} submissions, "
+        f"{summary['queries']['mean']:.1f} queries per submission",
+        f"  {'stage':<60} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}",
+        _format_stats_line('total', summary['duration']),
+    ]
+    lines.extend(
+        _format_stats_line(path, stats, indent=path.count('/') + 1)
+        for path, stats in summary['stages'].items()
+    )
+    return '\n'.join(lines)
+
+
+def _format_stats_line(path, stats, indent=0):
+    name = '  ' * indent + path.rsplit('/', 1)[-1]
+    return f"  {name:<60} {stats['mean'] * 1000:9.1f} {stats['p50'] * 1000:9.1f} {stats['p95'] * 1000:9.1f}"
+
+
+def format_comparison(baseline, results):
+    lines = [f"  {'scenario / stage':<60} {'before ms':>10} {'after ms':>10} {'change':>8}"]
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        lines.append(_format_change_line(name, before['duration'], summary['duration']))
+        for path, stats in summary['stages'].items():
+            if path in before['stages']:
+                lines.append(_format_change_line('  ' + path, before['stages'][path], stats))
+        lines.append(
+            f"  {'  queries':<60} {before['queries']['mean']:10.1f} {summary['queries']['mean']:10.1f}"
+        )
+    return '\n'.join(lines)
+
+
+def _format_change_line(label, before, after):
+    change = (after['mean'] - before['mean']) / before['mean'] * 100 if before['mean'] else 0
+    return f"  {label:<60} {before['mean'] * 1000:10.1f} {after['mean'] * 1000:10.1f} {change:+7.1f}%"
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from corehq.form_processor.backends.sql.dbaccessors import (
+    FormReindexAccessor,
+    iter_all_ids_chunked,
+)
+from corehq.form_processor.form_id_filter import form_id_filter
+
+
+class Command(BaseCommand):
+    help = """Add the ids of all saved forms to the form id filter and mark it complete.
+
+    FORM_ID_FILTER_BITS must be set on all web and celery processes before
+    this runs so that forms saved while it runs are also added.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true',
+                            help='Clear the filter before adding form ids.')
+
+    def handle(self, clear, **options):
+        if not form_id_filter.enabled:
+            raise CommandError('FORM_ID_FILTER_BITS is not set')
+
+        if clear:
+            form_id_filter.clear()
+        epoch = form_id_filter.start_build()
+
+        accessor = FormReindexAccessor(include_deleted=True)
+        processed = 0
+        for form_ids in iter_all_ids_chunked(accessor):
+            if not form_id_filter.add(form_ids):
+                raise CommandError('Could not add form ids to the filter')
+            processed += len(form_ids)
+            if processed % 100000 < len(form_ids):
+                self.stdout.write('[progress] %s form ids added' % processed)
+
+        if not form_id_filter.mark_complete(epoch):
+            raise CommandError('Form ids could not be added to the filter while it was built. '
+                               'Run this command again.')
+        self.stdout.write('%s form ids added to a filter of %s bits' % (processed, settings.FORM_ID_FILTER_BITS))
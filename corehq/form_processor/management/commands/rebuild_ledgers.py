@@ -0,0 +1,68 @@
+"""
+Rebuild all ledgers in a domain from their transactions
+
+Ledgers are rebuilt in chunks with one query per chunk (see
+``LedgerAccessorSQL.rebuild_ledgers``). Changes are published for the
+ledgers whose values or transactions changed and for ledgers that were
+deleted because they no longer have any transactions.
+
+    ./manage.py rebuild_ledgers my-domain --chunk-size 1000
+"""
+from django.core.management.base import BaseCommand
+
+from corehq.form_processor.backends.sql.dbaccessors import (
+    LedgerAccessorSQL,
+    LedgerReindexAccessor,
+)
+from corehq.form_processor.change_publishers import (
+    publish_ledger_v2_deleted,
+    publish_ledger_v2_saved,
+)
+from corehq.form_processor.models import LedgerValue
+from corehq.form_processor.parsers.ledgers.helpers import UniqueLedgerReference
+
+
+class Command(BaseCommand):
+    help = "Rebuild all ledgers in a domain from their transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain')
+        parser.add_argument('-d', '--db_name', dest='db_names', action='append',
+                            help='Django DB alias to run on. May be repeated. Defaults to all databases.')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of ledgers to rebuild per query.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the ledgers that would be rebuilt.')
+
+    def handle(self, domain, db_names, chunk_size, dry_run, **options):
+        accessor = LedgerReindexAccessor(domain=domain, limit_db_aliases=db_names)
+        total_updated = total_deleted = 0
+        for db_name in accessor.sql_db_aliases:
+            processed = 0
+            for refs in iter_ledger_references_chunked(accessor, db_name, chunk_size):
+                processed += len(refs)
+                if not dry_run:
+                    updated, deleted = LedgerAccessorSQL.rebuild_ledgers(refs)
+                    publish_changes(domain, updated, deleted)
+                    total_updated += len(updated)
+                    total_deleted += len(deleted)
+                self.stdout.write('[progress] [%s] %s ledgers' % (db_name, processed))
+            self.stdout.write('[progress] [%s] Complete' % db_name)
+
+        if dry_run:
+            return
+        self.stdout.write('%s ledgers updated, %s ledgers deleted' % (total_updated, total_deleted))
+
+
+def iter_ledger_references_chunked(accessor, db_name, chunk_size):
+    docs = list(accessor.get_doc_ids(db_name, limit=chunk_size))
+    while docs:
+        yield [UniqueLedgerReference.from_id(doc.doc_id) for doc in docs]
+        docs = list(accessor.get_doc_ids(db_name, last_doc_pk=docs[-1].primary_key, limit=chunk_size))
+
+
+def publish_changes(domain, updated, deleted):
+    for ref in updated:
+        publish_ledger_v2_saved(LedgerValue(domain=domain, **ref._asdict()))
+    for ref in deleted:
+        publish_ledger_v2_deleted(domain, **ref._asdict())
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.14 on 2026-10-18 12:00
+
+import django.db.models.deletion
+import jsonfield.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_processor', '0100_remove_commcarecaseindex_form_proces_domain_7afdfe_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_count', models.PositiveIntegerField()),
+                ('transactions_digest', models.CharField(max_length=40)),
+                ('relevant_count', models.PositiveIntegerField()),
+                ('state', jsonfield.fields.JSONField(default=dict)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('case', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                           related_name='snapshot_set', related_query_name='snapshot',
+                                           to='form_processor.commcarecase', to_field='case_id')),
+            ],
+            options={
+                'db_table': 'form_processor_casesnapshot',
+                'unique_together': {('case', 'transaction_count')},
+            },
+        ),
+    ]
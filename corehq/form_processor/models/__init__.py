@@ -1,6 +1,7 @@
 from .attachment import Attachment, AttachmentContent  # noqa: F401
 from .cases import (  # noqa: F401
     CaseAttachment,
+    CaseSnapshot,
     CaseTransaction,
     CommCareCase,
     CommCareCaseIndex,
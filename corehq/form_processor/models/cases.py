@@ -3,7 +3,7 @@ import json
 import mimetypes
 import os
 import uuid
-from collections import OrderedDict, namedtuple
+from collections import OrderedDict, defaultdict, namedtuple
 from datetime import datetime
 
 from django.db import DatabaseError, models, transaction
@@ -44,6 +44,7 @@ from .forms import XFormInstance
 from .mixin import CaseToXMLMixin, IsImageMixin, SaveStateMixin
 from .util import (
     attach_prefetch_models,
+    bulk_save,
     fetchall_as_namedtuple,
     sort_with_id_list,
 )
@@ -212,6 +213,24 @@ class CommCareCaseManager(RequireDBManager):
             )
             return dict(cursor)
 
+    def get_last_modified_dates_and_deleted(self, domain, case_ids):
+        """
+        Given a list of case IDs, return a dict where the ids are keys and the
+        values are two-tuples `(server_modified_on, deleted)`. Unlike
+        `get_last_modified_dates` this includes whether the case is deleted.
+        Case ids that do not exist are not included.
+        """
+        result = {}
+        for db_name, case_ids_chunk in split_list_by_db_partition(case_ids):
+            result.update(
+                (case_id, (server_modified_on, deleted))
+                for case_id, server_modified_on, deleted in CommCareCase.objects
+                .using(db_name)
+                .filter(domain=domain, case_id__in=case_ids_chunk)
+                .values_list('case_id', 'server_modified_on', 'deleted')
+            )
+        return result
+
     def get_case_xform_ids(self, case_id):
         with self.model.get_plproxy_cursor(readonly=True) as cursor:
             cursor.execute(
@@ -294,6 +313,19 @@ class CommCareCaseManager(RequireDBManager):
 
         return deleted_count
 
+    def save_cases(self, cases):
+        """Save cases with their tracked models
+
+        Equivalent to ``case.save(with_tracked_models=True)`` for each case,
+        but the rows of each table are written with one multi-row statement
+        per database rather than one statement per row.
+        """
+        cases_by_db = defaultdict(list)
+        for case in cases:
+            cases_by_db[case.db].append(case)
+        for db_name, db_cases in cases_by_db.items():
+            _save_cases_with_tracked_models(db_name, db_cases)
+
     @staticmethod
     def publish_deleted_cases(domain, case_ids):
         from ..change_publishers import publish_case_deleted
@@ -778,6 +810,8 @@ class CommCareCase(PartitionedModel, models.Model, RedisLockableMixIn,
         index_ids_to_delete = [index.id for index in self.get_tracked_models_to_delete(CommCareCaseIndex)]
         attachments_to_save = self.get_tracked_models_to_create(CaseAttachment)
         attachment_ids_to_delete = [att.id for att in self.get_tracked_models_to_delete(CaseAttachment)]
+        snapshots_to_save = self.get_tracked_models_to_create(CaseSnapshot)
+        snapshot_ids_to_delete = [snapshot.id for snapshot in self.get_tracked_models_to_delete(CaseSnapshot)]
         for attachment in attachments_to_save:
             if attachment.is_saved():
                 raise CaseSaveError(
@@ -806,6 +840,11 @@ class CommCareCase(PartitionedModel, models.Model, RedisLockableMixIn,
 
                 CaseAttachment.objects.using(self.db).filter(id__in=attachment_ids_to_delete).delete()
 
+                # delete first: replacement snapshots may reuse transaction counts
+                CaseSnapshot.objects.using(self.db).filter(id__in=snapshot_ids_to_delete).delete()
+                for snapshot in snapshots_to_save:
+                    snapshot.save()
+
                 self.clear_tracked_models()
         except DatabaseError as e:
             raise CaseSaveError(e)
@@ -836,6 +875,56 @@ class CommCareCase(PartitionedModel, models.Model, RedisLockableMixIn,
         db_table = 'form_processor_commcarecasesql'
 
 
+def _save_cases_with_tracked_models(db_name, cases):
+    transactions = []
+    indices = []
+    index_ids_to_delete = []
+    attachments = []
+    attachment_ids_to_delete = []
+    snapshots = []
+    snapshot_ids_to_delete = []
+    for case in cases:
+        transactions.extend(case.get_live_tracked_models(CaseTransaction))
+        for index in case.get_live_tracked_models(CommCareCaseIndex):
+            index.domain = case.domain  # ensure domain is set on indices
+            indices.append(index)
+        index_ids_to_delete.extend(index.id for index in case.get_tracked_models_to_delete(CommCareCaseIndex))
+        for attachment in case.get_tracked_models_to_create(CaseAttachment):
+            if attachment.is_saved():
+                raise CaseSaveError(
+                    f"Updating attachments is not supported. case id={case.case_id}, "
+                    f"attachment id={attachment.attachment_id}"
+                )
+            attachments.append(attachment)
+        attachment_ids_to_delete.extend(att.id for att in case.get_tracked_models_to_delete(CaseAttachment))
+        snapshots.extend(case.get_tracked_models_to_create(CaseSnapshot))
+        snapshot_ids_to_delete.extend(snapshot.id for snapshot in case.get_tracked_models_to_delete(CaseSnapshot))
+
+    try:
+        with transaction.atomic(using=db_name, savepoint=False):
+            # cases first: related rows need their primary keys
+            bulk_save(db_name, CommCareCase, cases)
+            bulk_save(db_name, CaseTransaction, transactions)
+            # prevent changing identifier
+            bulk_save(db_name, CommCareCaseIndex, indices,
+                      update_fields=['referenced_id', 'referenced_type', 'relationship_id'])
+            if index_ids_to_delete:
+                CommCareCaseIndex.objects.using(db_name).filter(id__in=index_ids_to_delete).delete()
+            if attachments:
+                CaseAttachment.objects.using(db_name).bulk_create(attachments)
+            if attachment_ids_to_delete:
+                CaseAttachment.objects.using(db_name).filter(id__in=attachment_ids_to_delete).delete()
+            # delete first: replacement snapshots may reuse transaction counts
+            if snapshot_ids_to_delete:
+                CaseSnapshot.objects.using(db_name).filter(id__in=snapshot_ids_to_delete).delete()
+            if snapshots:
+                CaseSnapshot.objects.using(db_name).bulk_create(snapshots)
+            for case in cases:
+                case.clear_tracked_models()
+    except DatabaseError as e:
+        raise CaseSaveError(e)
+
+
 def get_index_map(indices):
     return {
         index.identifier: {
@@ -982,6 +1071,20 @@ class CommCareCaseIndexManager(RequireDBManager):
         query = self.partitioned_query(case_id)
         return list(query.filter(case_id=case_id, domain=domain))
 
+    def get_indices_for_cases(self, domain, case_ids):
+        """Get the (forward) indices of multiple cases
+
+        :param case_ids: A list of case ids.
+        :returns: A list of CommCareCaseIndex objects.
+        """
+        assert isinstance(case_ids, list), case_ids
+        if not case_ids:
+            return []
+        return list(self.plproxy_raw(
+            'SELECT * FROM get_multiple_cases_indices(%s, %s)',
+            [domain, case_ids],
+        ))
+
     def get_related_indices(self, domain, case_ids, exclude_indices=None):
         """Get indices (forward and reverse) for the given set of case ids.
 
@@ -1543,6 +1646,54 @@ class CaseTransaction(PartitionedModel, SaveStateMixin, models.Model):
         ]
 
 
+class CaseSnapshotManager(RequireDBManager):
+
+    def get_snapshots(self, case_id):
+        return list(
+            self.partitioned_query(case_id)
+            .filter(case_id=case_id)
+            .order_by('transaction_count')
+        )
+
+
+class CaseSnapshot(PartitionedModel, SaveStateMixin, models.Model):
+    """State of a case part way through rebuilding it from its transactions
+
+    A snapshot records the case after the first ``transaction_count``
+    transactions, in rebuild order, have been applied. A later rebuild
+    resumes from the latest snapshot whose transactions are unchanged,
+    which is checked with ``transactions_digest``, so that only the
+    forms of the transactions that follow it are fetched and applied.
+    """
+    partition_attr = 'case_id'
+    objects = CaseSnapshotManager()
+
+    case = models.ForeignKey(
+        'CommCareCase', to_field='case_id', db_index=False,
+        related_name="snapshot_set", related_query_name="snapshot",
+        on_delete=models.CASCADE,
+    )
+    transaction_count = models.PositiveIntegerField()
+    transactions_digest = models.CharField(max_length=40)
+    # number of the transactions that were relevant to the case
+    relevant_count = models.PositiveIntegerField()
+    state = JSONField(default=dict)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    def __repr__(self):
+        return (
+            "CaseSnapshot("
+            "case_id='{self.case_id}', "
+            "transaction_count={self.transaction_count}, "
+            "relevant_count={self.relevant_count})"
+        ).format(self=self)
+
+    class Meta(object):
+        unique_together = ("case", "transaction_count")
+        db_table = 'form_processor_casesnapshot'
+        app_label = "form_processor"
+
+
 class CaseTransactionDetail(JsonObject):
     _type = None
 
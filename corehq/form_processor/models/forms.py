@@ -99,6 +99,24 @@ class XFormInstanceManager(RequireDBManager):
         for chunk in chunked(form_ids, 100):
             yield from self.get_forms([_f for _f in chunk if _f])
 
+    def get_forms_changed_since(self, form_ids, since):
+        """Get the forms that were edited or deleted after a date
+
+        :param form_ids: list of form_ids to check.
+        :returns: dict of form id to the date the form last changed.
+        """
+        changed = {}
+        for db_name, split_form_ids in split_list_by_db_partition(form_ids):
+            for chunked_form_ids in chunked(split_form_ids, BATCH_SIZE):
+                query = (
+                    self.using(db_name)
+                    .filter(Q(edited_on__gt=since) | Q(deleted_on__gt=since), form_id__in=chunked_form_ids)
+                    .values_list('form_id', 'edited_on', 'deleted_on')
+                )
+                for form_id, edited_on, deleted_on in query:
+                    changed[form_id] = max(date for date in (edited_on, deleted_on) if date)
+        return changed
+
     @staticmethod
     def get_attachments(form_id):
         return get_blob_db().metadb.get_for_parent(form_id)
@@ -509,6 +527,9 @@ class XFormInstance(PartitionedModel, models.Model, RedisLockableMixIn,
 
     objects = XFormInstanceManager()
 
+    # parts of a submitted form read from its XML (see parsers.form.stream_xform)
+    streamed_form = None
+
     form_id = models.CharField(max_length=255, unique=True, db_index=True, default=None)
 
     domain = models.CharField(max_length=255, default=None)
@@ -680,20 +701,28 @@ class XFormInstance(PartitionedModel, models.Model, RedisLockableMixIn,
         operations += self.get_tracked_models_to_create(XFormOperation)
         return operations
 
+    @property
+    def _form_head(self):
+        """The form JSON, or only its root attributes and meta block for a
+        submitted form, which does not need the whole form converted"""
+        if self.streamed_form is not None:
+            return self.streamed_form.head
+        return self.form_data
+
     @property
     @memoized
     def metadata(self):
         from ..utils import clean_metadata
-        if const.TAG_META in self.form_data:
-            return XFormPhoneMetadata.wrap(clean_metadata(self.form_data[const.TAG_META]))
+        if const.TAG_META in self._form_head:
+            return XFormPhoneMetadata.wrap(clean_metadata(self._form_head[const.TAG_META]))
 
     @property
     def type(self):
-        return self.form_data.get(const.TAG_TYPE, "")
+        return self._form_head.get(const.TAG_TYPE, "")
 
     @property
     def name(self):
-        return self.form_data.get(const.TAG_NAME, "")
+        return self._form_head.get(const.TAG_NAME, "")
 
     @property
     def device_id(self):
@@ -45,3 +45,15 @@ def attach_prefetch_models(objects_by_id, prefetched_models, link_field_name, ca
     for obj_id in unseen:
         obj = objects_by_id[obj_id]
         setattr(obj, cached_attrib_name, [])
+
+
+def bulk_save(db_name, model_class, objects, update_fields=None):
+    """Insert new and update existing objects, one statement for each"""
+    new = [obj for obj in objects if not obj.is_saved()]
+    existing = [obj for obj in objects if obj.is_saved()]
+    if new:
+        model_class.objects.using(db_name).bulk_create(new)
+    if existing:
+        if update_fields is None:
+            update_fields = [f.name for f in model_class._meta.concrete_fields if not f.primary_key]
+        model_class.objects.using(db_name).bulk_update(existing, update_fields)
@@ -1,19 +1,31 @@
 import datetime
 import logging
+from collections import Counter
 from contextlib import contextmanager
+from io import BytesIO
 
 from ddtrace import tracer
 from django.conf import settings
+from lxml import etree
+from memoized import memoized
 
+from casexml.apps.case.xform import find_case_blocks, is_device_report
+from casexml.apps.stock.const import COMMTRACK_REPORT_XMLNS
 from corehq.form_processor.exceptions import MissingFormXml
 from corehq.form_processor.interfaces.processor import FormProcessorInterface
 from corehq.form_processor.models import Attachment, XFormInstance
+from corehq.form_processor.parsers.ledgers.form import LEDGER_TAGS
+from corehq.form_processor.submission_validation import collect_image_references
 from corehq.form_processor.utils import convert_xform_to_json, adjust_datetimes
 from corehq.form_processor.utils.metadata import scrub_form_meta
 from corehq.util.soft_assert.api import soft_assert
 from couchforms import XMLSyntaxError
 from couchforms.exceptions import MissingXMLNSError
 from dimagi.utils.couch import release_lock
+from xml2json.lib import convert_xml_to_json
+
+# "Meta" is the meta block of old forms (see scrub_form_meta)
+META_TAGS = ('meta', 'Meta')
 
 
 @contextmanager
@@ -58,8 +70,130 @@ class FormProcessingResult(object):
         return locked_form(self.submitted_form, self.interface)
 
 
+class StreamedXForm(object):
+    """The parts of a form that submission processing reads, from a
+    single streaming pass over its XML (see ``stream_xform``)
+
+    :param head: The form JSON with only the attributes of the root
+    element, ``#type`` and the meta block.
+    :param case_blocks: ``(case_block, path)`` pairs in the order that
+    ``extract_case_blocks`` finds them in the form JSON. They are
+    validated when they are extracted.
+    :param ledger_blocks: ``(report_type, ledger_json)`` pairs for the
+    outermost ledger elements of the form.
+    :param image_references: Values in the form JSON that look like
+    image filenames.
+    """
+
+    def __init__(self, xml, head, case_blocks, ledger_blocks, image_references):
+        self.xml = xml
+        self.head = head
+        self.case_blocks = case_blocks
+        self.ledger_blocks = ledger_blocks
+        self.image_references = image_references
+
+    @property
+    @memoized
+    def form_json(self):
+        """The whole form JSON, which is only converted if it is needed"""
+        return convert_xform_to_json(self.xml)
+
+
+def stream_xform(instance_xml):
+    """Read the parts of a form that submission processing needs
+
+    The form is parsed incrementally. Each child of the root element is
+    converted to JSON with xml2json as soon as it has been parsed, and
+    is discarded once its case blocks, ledger blocks and image answers
+    have been read, so memory use is proportional to the largest child
+    of the root element rather than to the form. The JSON is the same as
+    that part of ``XFormInstance.form_data``, with datetimes adjusted.
+
+    :returns: ``StreamedXForm``
+    :raises: ``XMLSyntaxError`` if the form is not valid XML.
+    """
+    if isinstance(instance_xml, str):
+        instance_xml = instance_xml.encode('utf-8')
+    has_ledgers = COMMTRACK_REPORT_XMLNS.encode('utf-8') in instance_xml
+
+    head = {}
+    meta = {}
+    case_blocks = []
+    ledger_blocks = []
+    image_references = set()
+    # xml2json puts children with the same name in a list at the position
+    # of the first of them, and case blocks are found in that order
+    name_order = {}
+    name_counts = Counter()
+    depth = 0
+    try:
+        for event, elem in etree.iterparse(BytesIO(instance_xml), events=('start', 'end')):
+            if event == 'start':
+                if not depth:
+                    root = elem
+                    root_xmlns = etree.QName(root).namespace
+                    head = _get_root_json(root)
+                    has_cases = not is_device_report(head)
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+
+            name, value = convert_xml_to_json(elem, last_xmlns=root_xmlns)
+            node = {name: value}
+            adjust_datetimes(node)
+            if name in META_TAGS:
+                meta.setdefault(name, []).append(node[name])
+            order = (name_order.setdefault(name, len(name_order)), name_counts[name])
+            name_counts[name] += 1
+            if has_cases:
+                case_blocks.extend((order, block) for block in find_case_blocks(node, []))
+            if has_ledgers:
+                ledger_blocks.extend(
+                    convert_xml_to_json(ledger, last_xmlns=COMMTRACK_REPORT_XMLNS)
+                    for ledger in _iter_outermost_ledger_elements(elem)
+                )
+            image_references |= collect_image_references(node)
+
+            elem.clear()
+            while elem.getprevious() is not None:
+                del root[0]
+    except etree.XMLSyntaxError as e:
+        raise XMLSyntaxError('Invalid XML: %s' % e)
+
+    for name, values in meta.items():
+        head[name] = values[0] if len(values) == 1 else values
+    image_references |= collect_image_references(head)
+    case_blocks.sort(key=lambda item: item[0])
+    return StreamedXForm(
+        instance_xml,
+        head,
+        case_blocks=[block for order, block in case_blocks],
+        ledger_blocks=ledger_blocks,
+        image_references=image_references,
+    )
+
+
+def _get_root_json(root):
+    name, root_json = convert_xml_to_json(etree.Element(root.tag, dict(root.attrib), nsmap=root.nsmap))
+    if not isinstance(root_json, dict):
+        # the root element has neither attributes nor a namespace
+        root_json = {}
+    adjust_datetimes(root_json)
+    root_json['#type'] = name
+    return root_json
+
+
+def _iter_outermost_ledger_elements(elem):
+    for ledger in elem.iter(*LEDGER_TAGS):
+        # the root element is never a ledger block
+        if not any(parent.getparent() is not None for parent in ledger.iterancestors(*LEDGER_TAGS)):
+            yield ledger
+
+
 @tracer.wrap(name='submission.process_form_xml')
-def process_xform_xml(domain, instance_xml, attachments=None, auth_context=None, instance_json=None):
+def process_xform_xml(domain, instance_xml, attachments=None, auth_context=None, streamed_form=None):
     """
     Create a new xform to ready to be saved to a database in a thread-safe manner
 
@@ -78,13 +212,13 @@ def process_xform_xml(domain, instance_xml, attachments=None, auth_context=None,
             instance_xml,
             attachments=attachments,
             auth_context=auth_context,
-            instance_json=instance_json,
+            streamed_form=streamed_form,
         )
     except (MissingXMLNSError, XMLSyntaxError) as e:
         return _get_submission_error(domain, instance_xml, e, auth_context)
 
 
-def _create_new_xform(domain, instance_xml, attachments=None, auth_context=None, instance_json=None):
+def _create_new_xform(domain, instance_xml, attachments=None, auth_context=None, streamed_form=None):
     """
     create but do not save an XFormInstance from an xform payload (xml_string)
     optionally set the doc _id to a predefined value (_id)
@@ -103,14 +237,13 @@ def _create_new_xform(domain, instance_xml, attachments=None, auth_context=None,
     interface = FormProcessorInterface(domain)
 
     assert attachments is not None
-    if instance_json is None:
-        instance_json = convert_xform_to_json(instance_xml)
-    if not instance_json.get('@xmlns'):
+    if streamed_form is None:
+        streamed_form = stream_xform(instance_xml)
+    form_head = streamed_form.head
+    if not form_head.get('@xmlns'):
         raise MissingXMLNSError("Form is missing a required field: XMLNS")
 
-    adjust_datetimes(instance_json)
-
-    xform = interface.new_xform(instance_json)
+    xform = interface.new_xform(form_head)
     xform.domain = domain
     xform.auth_context = auth_context
 
@@ -126,15 +259,14 @@ def _create_new_xform(domain, instance_xml, attachments=None, auth_context=None,
     #         |
     #         +-- instance.metadata
     #             |
-    #             +-- XFormInstance.form_data
-    #                 |
-    #                 +-- XFormInstance._form_json  <-- cached scrubbed instance_json
+    #             +-- XFormInstance.streamed_form.head  <-- scrubbed form_head
     #
-    # Scrub and cache `instance_json` in `XFormInstance._form_json` the way
-    # that `XFormInstance.form_data` does, so that `XFormInstance.form_data`
-    # doesn't have to fetch the form XML and convert it to JSON again.
-    scrub_form_meta(xform.form_id, instance_json)
-    xform._form_json = instance_json
+    # Scrub the meta block the way that `XFormInstance.form_data` does.
+    # Processing the form reads its meta, case and ledger blocks from
+    # `XFormInstance.streamed_form`, so the whole form is only converted
+    # to JSON if something reads `XFormInstance.form_data`.
+    scrub_form_meta(xform.form_id, form_head)
+    xform.streamed_form = streamed_form
 
     # Maps all attachments to uniform format and adds form.xml to list before storing
     attachments = [
@@ -1,10 +1,12 @@
 from collections import namedtuple
 import datetime
 from decimal import Decimal
+from io import BytesIO
 import logging
 
 import iso8601
 from django.utils.translation import gettext as _
+from lxml import etree
 
 from casexml.apps.case.const import CASE_ACTION_COMMTRACK
 from casexml.apps.case.exceptions import IllegalCaseId
@@ -112,31 +114,65 @@ def get_all_stock_report_helpers_from_form(xform):
     Given an instance of an XFormInstance, extract the ledger actions and convert
     them to StockReportHelper objects.
     """
-    form_xml = xform.get_xml_element()
-    commtrack_node_names = ('{%s}balance' % COMMTRACK_REPORT_XMLNS,
-                            '{%s}transfer' % COMMTRACK_REPORT_XMLNS)
-
-    def _extract_ledger_nodes_from_xml(node):
-        """
-        Goes through a parsed XML document and recursively pulls out any ledger XML blocks.
-        """
-        for child in node:
-            if child.tag in commtrack_node_names:
-                yield child
-            else:
-                for e in _extract_ledger_nodes_from_xml(child):
-                    yield e
-
-    for elem in _extract_ledger_nodes_from_xml(form_xml):
-        report_type, ledger_json = convert_xml_to_json(elem, last_xmlns=COMMTRACK_REPORT_XMLNS)
+    if getattr(xform, 'streamed_form', None) is not None:
+        # ledger blocks were read when the form was submitted
+        ledger_blocks = xform.streamed_form.ledger_blocks
+    else:
+        form_xml = xform.get_xml()
+        if not form_xml:
+            return
+        ledger_blocks = (
+            convert_xml_to_json(elem, last_xmlns=COMMTRACK_REPORT_XMLNS)
+            for elem in _iter_ledger_elements(form_xml)
+        )
+
+    for report_type, ledger_json in ledger_blocks:
         if ledger_json.get('@date'):
             try:
-                ledger_json['@date'] = adjust_text_to_datetime(ledger_json['@date'])
+                ledger_json = {**ledger_json, '@date': adjust_text_to_datetime(ledger_json['@date'])}
             except iso8601.ParseError:
                 pass
         yield _ledger_json_to_stock_report_helper(xform, report_type, ledger_json)
 
 
+LEDGER_TAGS = frozenset([
+    '{%s}balance' % COMMTRACK_REPORT_XMLNS,
+    '{%s}transfer' % COMMTRACK_REPORT_XMLNS,
+])
+
+
+def _iter_ledger_elements(form_xml):
+    """Parse form XML incrementally and yield its outermost ledger elements
+
+    Other elements are discarded once they have been parsed, so memory
+    use is proportional to the largest ledger block rather than to the
+    form. Forms that do not mention the ledger namespace are not parsed.
+
+    Submitted forms have their ledger blocks read by ``stream_xform``;
+    this is for forms that are loaded from the database.
+    """
+    if isinstance(form_xml, str):
+        form_xml = form_xml.encode('utf-8')
+    if COMMTRACK_REPORT_XMLNS.encode('utf-8') not in form_xml:
+        return
+
+    ledger_depth = 0
+    for event, elem in etree.iterparse(BytesIO(form_xml), events=('start', 'end')):
+        # the root element is never a ledger block
+        is_ledger = elem.tag in LEDGER_TAGS and elem.getparent() is not None
+        if event == 'start':
+            ledger_depth += is_ledger
+            continue
+        if is_ledger:
+            ledger_depth -= 1
+            if not ledger_depth:
+                yield elem
+        if not ledger_depth:
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
 def _ledger_json_to_stock_report_helper(form, report_type, ledger_json):
     domain = form.domain
     # figure out what kind of block we're dealing with
@@ -1,30 +1,50 @@
 import logging
 from collections import namedtuple
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from django.db.models import F
 
 import settings
 from casexml.apps.case.exceptions import IllegalCaseId, InvalidCaseIndex, CaseValueError, PhoneDateValueError
 from casexml.apps.case.exceptions import UsesReferrals
+from casexml.apps.case.xform import extract_case_blocks
+from casexml.apps.case.xml.parser import case_id_from_block
 from corehq.apps.commtrack.exceptions import MissingProductId
 from corehq.apps.domain_migration_flags.api import any_migrations_in_progress
 from corehq.form_processor.backends.sql.dbaccessors import LedgerAccessorSQL
 from corehq.form_processor.backends.sql.processor import FormProcessorSQL
 from corehq.form_processor.exceptions import XFormNotFound, PostSaveError, AttachmentNotFound
 from corehq.form_processor.interfaces.processor import FormProcessorInterface, ProcessedForms
-from corehq.form_processor.models import CommCareCase, XFormInstance, FormReprocessRebuild
+from corehq.form_processor.models import (
+    CaseTransaction,
+    CommCareCase,
+    FormReprocessRebuild,
+    XFormInstance,
+)
 from corehq.form_processor.submission_post import SubmissionPost
 from corehq.util.metrics.load_counters import form_load_counter
-from dimagi.utils.couch import LockManager
+from couchforms.models import UnfinishedSubmissionStub
+from dimagi.utils.couch import CriticalSection, LockManager
 
 ReprocessingResult = namedtuple('ReprocessingResult', 'form cases ledgers error')
 
 logger = logging.getLogger('reprocess')
 
+# queued post save actions stop waiting for those of earlier forms after
+# about 5 minutes (see run_queued_post_save_actions), so older stubs need
+# not be checked
+POST_SAVE_ORDER_WINDOW = timedelta(minutes=10)
+
 
 class ReprocessingError(Exception):
     pass
 
 
+def submission_stub_lock(stub_id):
+    """Lock held while a stub is reprocessed or its queued post save actions run"""
+    return CriticalSection(['reprocess_submission_%s' % stub_id])
+
+
 def reprocess_unfinished_stub(stub, save=True):
     if any_migrations_in_progress(stub.domain):
         logger.info("Ignoring stub during data migration: %s", stub.xform_id)
@@ -70,6 +90,70 @@ def reprocess_unfinished_stub_with_form(stub, form, save=True, lock=True):
     return result
 
 
+def perform_queued_post_save_actions(stub, ignore_order=False):
+    """Run the post save actions queued by ``SubmissionPost`` for a submission
+
+    Actions for a case run in the order its forms were saved: if the
+    actions of an earlier form that updated one of the form's cases are
+    still queued nothing is done unless ``ignore_order`` is true.
+
+    :returns: ``ReprocessingResult`` or ``None`` if the actions must wait
+    for those of an earlier form.
+    """
+    if any_migrations_in_progress(stub.domain):
+        # leave the stub for the reprocessing queue
+        return ReprocessingResult(None, None, None, "Data migration in progress")
+
+    try:
+        form = XFormInstance.objects.get_form(stub.xform_id, stub.domain)
+    except XFormNotFound:
+        stub.delete()
+        return ReprocessingResult(None, None, None, "Form not found for post save actions")
+    if form.is_deleted:
+        stub.delete()
+        return ReprocessingResult(form, None, None, None)
+
+    case_ids = {case_id_from_block(block) for block in extract_case_blocks(form)}
+    if not ignore_order and _has_earlier_queued_post_save_actions(stub, case_ids):
+        return None
+
+    interface = FormProcessorInterface(form.domain)
+    cache = interface.casedb_cache(
+        domain=form.domain, lock=False, deleted_ok=True, xforms=[form],
+        load_src="queued_post_save_actions",
+    )
+    with cache as casedb:
+        casedb.populate(case_ids)
+        case_models = [casedb.get(case_id) for case_id in case_ids if casedb.in_cache(case_id)]
+        try:
+            SubmissionPost.do_queued_post_save_actions(casedb, form, case_models)
+        except PostSaveError:
+            # count the failure as an attempt so that later forms for
+            # the same cases stop waiting on this one
+            UnfinishedSubmissionStub.objects.filter(id=stub.id).update(attempts=F('attempts') + 1)
+            return ReprocessingResult(form, None, None, "Error performing post save operations")
+    stub.delete()
+    return ReprocessingResult(form, case_models, None, None)
+
+
+def _has_earlier_queued_post_save_actions(stub, case_ids):
+    earlier_form_ids = list(UnfinishedSubmissionStub.objects.filter(
+        domain=stub.domain,
+        id__lt=stub.id,
+        timestamp__gte=stub.timestamp - POST_SAVE_ORDER_WINDOW,
+        saved=True,
+        attempts=0,
+    ).values_list('xform_id', flat=True))
+    if not earlier_form_ids:
+        return False
+    return any(
+        CaseTransaction.objects.partitioned_query(case_id)
+        .filter(case_id=case_id, form_id__in=earlier_form_ids)
+        .exists()
+        for case_id in case_ids
+    )
+
+
 def _perform_post_save_actions(form, save=True):
     interface = FormProcessorInterface(form.domain)
     cache = interface.casedb_cache(
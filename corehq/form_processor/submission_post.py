@@ -1,5 +1,6 @@
 import logging
 from collections import namedtuple
+from contextlib import contextmanager
 
 from ddtrace import tracer
 from django.db import IntegrityError
@@ -21,7 +22,14 @@ from casexml.apps.case.exceptions import PhoneDateValueError, IllegalCaseId, Use
 from corehq.apps.receiverwrapper.rate_limiter import report_case_usage, report_submission_usage
 from corehq.const import OPENROSA_VERSION_3
 from corehq.middleware import OPENROSA_VERSION_HEADER
-from corehq.toggles import ASYNC_RESTORE, BLOCK_SUMOLOGIC_LOGS, NAMESPACE_OTHER, SUMOLOGIC_LOGS
+from corehq.toggles import (
+    ASYNC_POST_SAVE_ACTIONS,
+    ASYNC_RESTORE,
+    BLOCK_SUMOLOGIC_LOGS,
+    DATA_REGISTRY_CASE_UPDATE_REPEATER,
+    NAMESPACE_OTHER,
+    SUMOLOGIC_LOGS,
+)
 from corehq.apps.app_manager.dbaccessors import get_current_app
 from corehq.apps.cloudcare.const import DEVICE_ID as FORMPLAYER_DEVICE_ID
 from corehq.apps.commtrack.exceptions import MissingProductId
@@ -71,7 +79,7 @@ class SubmissionPost(object):
                  location=None, submit_ip=None, openrosa_headers=None,
                  last_sync_token=None, received_on=None, date_header=None,
                  partial_submission=False, case_db=None, force_logs=False,
-                 timing_context=None, instance_json=None):
+                 timing_context=None, streamed_form=None):
         assert domain, "'domain' is required"
         assert instance, instance
         assert not isinstance(instance, HttpRequest), instance
@@ -86,7 +94,7 @@ class SubmissionPost(object):
         self.last_sync_token = last_sync_token
         self.openrosa_headers = openrosa_headers or {}
         self.instance = instance
-        self.instance_json = instance_json
+        self.streamed_form = streamed_form
         self.attachments = attachments or {}
         self.auth_context = auth_context or DefaultAuthContext()
         self.path = path
@@ -258,7 +266,7 @@ class SubmissionPost(object):
                 self.instance,
                 self.attachments,
                 self.auth_context.to_json(),
-                instance_json=self.instance_json,
+                streamed_form=self.streamed_form,
             )
             submitted_form = result.submitted_form
 
@@ -329,8 +337,16 @@ class SubmissionPost(object):
 
                         result = None
                         if stub:
-                            from corehq.form_processor.reprocess import reprocess_unfinished_stub_with_form
-                            result = reprocess_unfinished_stub_with_form(stub, existing_form, lock=False)
+                            from corehq.form_processor.reprocess import (
+                                reprocess_unfinished_stub_with_form,
+                                submission_stub_lock,
+                            )
+                            # queued post save actions of the form may be running: they
+                            # delete the stub once done, so check it again under their lock
+                            with submission_stub_lock(stub.id):
+                                stub = UnfinishedSubmissionStub.objects.filter(id=stub.id).first()
+                                if stub:
+                                    result = reprocess_unfinished_stub_with_form(stub, existing_form, lock=False)
                         elif existing_form.is_error:
                             from corehq.form_processor.reprocess import reprocess_form
                             result = reprocess_form(existing_form, lock_form=False)
@@ -457,46 +473,76 @@ class SubmissionPost(object):
                 else:
                     unfinished_submission_stub.submission_saved()
 
+                queue = self._can_queue_post_save_actions(instance, unfinished_submission_stub)
                 with self.timing_context("post_save_actions"):
                     self.do_post_save_actions(case_db, xforms, case_stock_result,
-                                              timing_context=self.timing_context)
+                                              timing_context=self.timing_context, queued=queue)
+                if queue:
+                    unfinished_submission_stub.queue_post_save_actions()
         except PostSaveError:
             return "Error performing post save operations"
 
+    @staticmethod
+    def _can_queue_post_save_actions(instance, unfinished_submission_stub):
+        """Check if the post save actions can run after the response is sent
+
+        Domains with post save actions whose results must be visible by
+        the end of the submission keep running them synchronously.
+        """
+        from corehq.apps.case_search.models import case_search_synchronous_web_apps_for_domain
+        if not unfinished_submission_stub.stub:
+            return False
+        if not ASYNC_POST_SAVE_ACTIONS.enabled(instance.domain):
+            return False
+        if DATA_REGISTRY_CASE_UPDATE_REPEATER.enabled(instance.domain):
+            # see fire_synchronous_case_repeaters
+            return False
+        return not (
+            _is_web_apps_submission(instance)
+            and case_search_synchronous_web_apps_for_domain(instance.domain)
+        )
+
     @staticmethod
     @tracer.wrap(name='submission.post_save_actions')
-    def do_post_save_actions(case_db, xforms, case_stock_result, *, timing_context=None):
+    def do_post_save_actions(case_db, xforms, case_stock_result, *, timing_context=None, queued=False):
+        """
+        :param queued: Only finalize the stock result. The remaining actions
+        are run later by ``do_queued_post_save_actions``.
+        """
         timing_context = timing_context or TimingContext()
         instance = xforms[0]
         case_db.clear_changed()
-        try:
+        with _post_save_error_handler(instance):
             case_stock_result.stock_result.finalize()
+            if not queued:
+                SubmissionPost._do_case_post_save_actions(
+                    case_db, instance, case_stock_result.case_models, timing_context)
 
-            with timing_context("index_case_search"):
-                SubmissionPost.index_case_search(instance, case_stock_result.case_models)
-
-            with timing_context("_fire_post_save_signals"):
-                SubmissionPost._fire_post_save_signals(instance, case_stock_result.case_models, timing_context)
+    @staticmethod
+    @tracer.wrap(name='submission.queued_post_save_actions')
+    def do_queued_post_save_actions(case_db, instance, case_models):
+        with _post_save_error_handler(instance):
+            SubmissionPost._do_case_post_save_actions(case_db, instance, case_models, TimingContext())
 
-            with timing_context("close_extension_cases"):
-                close_extension_cases(
-                    case_db,
-                    case_stock_result.case_models,
-                    "SubmissionPost-%s-close_extensions" % instance.form_id,
-                    instance.last_sync_token
-                )
-        except PostSaveError:
-            raise
-        except Exception:
-            notify_exception(get_request(), "Error performing post save actions during form processing", {
-                'domain': instance.domain,
-                'form_id': instance.form_id,
-            })
-            raise PostSaveError
+    @staticmethod
+    def _do_case_post_save_actions(case_db, instance, case_models, timing_context):
+        with timing_context("index_case_search"):
+            SubmissionPost.index_case_search(instance, case_models)
+
+        with timing_context("_fire_post_save_signals"):
+            SubmissionPost._fire_post_save_signals(instance, case_models, timing_context)
+
+        with timing_context("close_extension_cases"):
+            close_extension_cases(
+                case_db,
+                case_models,
+                "SubmissionPost-%s-close_extensions" % instance.form_id,
+                instance.last_sync_token
+            )
 
     @staticmethod
     def index_case_search(instance, case_models):
-        if not instance.metadata or instance.metadata.deviceID != FORMPLAYER_DEVICE_ID:
+        if not _is_web_apps_submission(instance):
             return
 
         from corehq.apps.case_search.models import case_search_synchronous_web_apps_for_domain
@@ -652,6 +698,24 @@ class SubmissionPost(object):
         return FormProcessingResult(response, device_log_form, [], [], 'device-log')
 
 
+def _is_web_apps_submission(instance):
+    return bool(instance.metadata) and instance.metadata.deviceID == FORMPLAYER_DEVICE_ID
+
+
+@contextmanager
+def _post_save_error_handler(instance):
+    try:
+        yield
+    except PostSaveError:
+        raise
+    except Exception:
+        notify_exception(get_request(), "Error performing post save actions during form processing", {
+            'domain': instance.domain,
+            'form_id': instance.form_id,
+        })
+        raise PostSaveError
+
+
 def _transform_instance_to_error(interface, exception, instance):
     error_message = '{}: {}'.format(type(exception).__name__, str(exception))
     return interface.xformerror_from_xform_instance(instance, error_message)
@@ -1,21 +1,38 @@
 import contextlib
 import datetime
+import threading
 
 from django.db.models import F
 
+_local = threading.local()
+
 
 class SubmissionProcessTracker(object):
     def __init__(self, stub=None):
         self.stub = stub
+        self.post_save_actions_queued = False
 
     def submission_saved(self):
         if self.stub:
             self.stub.saved = True
             self.stub.save()
 
+    def queue_post_save_actions(self):
+        """Leave the post save actions to ``run_queued_post_save_actions``
+
+        The stub is kept until they have run so that the reprocessing
+        queue retries them if they fail.
+        """
+        assert self.stub and self.stub.saved, self.stub
+        self.post_save_actions_queued = True
+
     def submission_fully_processed(self):
         if self.stub:
-            self.stub.delete()
+            deferred = getattr(_local, 'deferred_stubs', None)
+            if deferred is not None:
+                deferred.append(self)
+            else:
+                _complete_submissions([self])
 
 
 class ArchiveProcessTracker(object):
@@ -45,6 +62,38 @@ def unfinished_submission(instance):
     tracker.submission_fully_processed()
 
 
+@contextlib.contextmanager
+def defer_submission_completion():
+    """Keep the stubs of submissions processed in this block until it exits
+
+    Stubs are deleted, or their queued post save actions are sent to
+    celery, when the block exits without error. Otherwise they remain so
+    that the submissions are picked up by the reprocessing queue, for
+    example when changes published in a batch fail to send.
+    """
+    if getattr(_local, 'deferred_stubs', None) is not None:
+        yield
+        return
+    _local.deferred_stubs = trackers = []
+    try:
+        yield
+    finally:
+        _local.deferred_stubs = None
+    _complete_submissions(trackers)
+
+
+def _complete_submissions(trackers):
+    """Delete the stubs of processed submissions or queue their post save actions"""
+    from couchforms.models import UnfinishedSubmissionStub
+    from corehq.form_processor.tasks import run_queued_post_save_actions
+    done_ids = [t.stub.id for t in trackers if not t.post_save_actions_queued]
+    if done_ids:
+        UnfinishedSubmissionStub.objects.filter(id__in=done_ids).delete()
+    for tracker in trackers:
+        if tracker.post_save_actions_queued:
+            run_queued_post_save_actions.delay(tracker.stub.id)
+
+
 @contextlib.contextmanager
 def unfinished_archive(instance, user_id, archive):
     unfinished_archive_stub = _get_or_create_unfinished_archive_stub(
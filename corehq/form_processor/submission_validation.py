@@ -23,7 +23,11 @@ def check_image_attachments(sender, xform, **kwargs):
         name for name in xform.attachments
         if name.lower().endswith(IMAGE_EXTENSIONS)
     }
-    image_answers = _collect_image_references(xform.form_data)
+    streamed_form = getattr(xform, 'streamed_form', None)
+    if streamed_form is not None:
+        image_answers = streamed_form.image_references
+    else:
+        image_answers = collect_image_references(xform.form_data)
     if image_attachments == image_answers:
         return
 
@@ -40,7 +44,7 @@ def check_image_attachments(sender, xform, **kwargs):
         )
 
 
-def _collect_image_references(form_data):
+def collect_image_references(form_data):
     """
     Return the set of leaf string values in ``form_data`` that look like
     image filenames.
@@ -6,21 +6,29 @@ from django.conf import settings
 from celery.schedules import crontab
 
 from couchforms.models import UnfinishedSubmissionStub
-from dimagi.utils.couch import CriticalSection
 from dimagi.utils.logging import notify_exception
 
 from corehq.apps.celery import periodic_task, serial_task
-from corehq.form_processor.reprocess import reprocess_unfinished_stub
+from corehq.form_processor.reprocess import (
+    perform_queued_post_save_actions,
+    reprocess_unfinished_stub,
+    submission_stub_lock,
+)
 from corehq.util.celery_utils import no_result_task
 from corehq.util.metrics import metrics_counter, metrics_gauge
 from corehq.util.metrics.const import MPM_MAX
 
 SUBMISSION_REPROCESS_CELERY_QUEUE = 'submission_reprocessing_queue'
 
+# queued post save actions wait up to 5 minutes for those of earlier
+# forms for the same cases before running out of order
+POST_SAVE_ORDER_RETRY_DELAY = 10
+POST_SAVE_ORDER_MAX_RETRIES = 30
+
 
 @no_result_task(queue=SUBMISSION_REPROCESS_CELERY_QUEUE, acks_late=True)
 def reprocess_submission(submssion_stub_id):
-    with CriticalSection(['reprocess_submission_%s' % submssion_stub_id]):
+    with submission_stub_lock(submssion_stub_id):
         try:
             stub = UnfinishedSubmissionStub.objects.get(id=submssion_stub_id)
         except UnfinishedSubmissionStub.DoesNotExist:
@@ -34,6 +42,31 @@ def reprocess_submission(submssion_stub_id):
             })
 
 
+@no_result_task(queue=SUBMISSION_REPROCESS_CELERY_QUEUE, acks_late=True, bind=True,
+                max_retries=POST_SAVE_ORDER_MAX_RETRIES, default_retry_delay=POST_SAVE_ORDER_RETRY_DELAY)
+def run_queued_post_save_actions(self, submission_stub_id):
+    """Run the post save actions of a submission after its response was sent
+
+    If they fail the stub is left for the reprocessing queue.
+    """
+    with submission_stub_lock(submission_stub_id):
+        try:
+            stub = UnfinishedSubmissionStub.objects.get(id=submission_stub_id)
+        except UnfinishedSubmissionStub.DoesNotExist:
+            return
+
+        ignore_order = self.request.retries >= self.max_retries
+        result = perform_queued_post_save_actions(stub, ignore_order=ignore_order)
+        if result:
+            metrics_counter('commcare.submission.queued_post_save_actions.count', tags={
+                'domain': stub.domain,
+                'status': 'error' if result.error else 'success',
+                'in_order': not ignore_order,
+            })
+    if result is None:
+        raise self.retry()
+
+
 @periodic_task(run_every=crontab(minute='*/5'), queue=settings.CELERY_PERIODIC_QUEUE)
 def _reprocess_archive_stubs():
     reprocess_archive_stubs.delay()
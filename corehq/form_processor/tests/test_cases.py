@@ -169,6 +169,19 @@ class TestCommCareCaseManager(BaseCaseManagerTest):
             {case1.case_id: date1, case2.case_id: date2}
         )
 
+    def test_get_last_modified_dates_and_deleted(self):
+        date1 = datetime(1992, 1, 30, 12, 0)
+        date2 = datetime(2015, 12, 28, 5, 48)
+        case1 = _create_case(server_modified_on=date1)
+        case2 = _create_case(server_modified_on=date2, deleted=True)
+        _create_case()
+
+        self.assertEqual(
+            CommCareCase.objects.get_last_modified_dates_and_deleted(
+                DOMAIN, ['missing_case', case1.case_id, case2.case_id]),
+            {case1.case_id: (date1, False), case2.case_id: (date2, True)}
+        )
+
     def test_get_case_xform_ids(self):
         form_id = uuid.uuid4().hex
         case = _create_case(form_id=form_id)
@@ -369,6 +382,73 @@ class TestCommCareCaseManager(BaseCaseManagerTest):
         with self.assertRaises(CaseSaveError):
             case.save(with_tracked_models=True)
 
+    def test_save_cases(self):
+        cases = [create_case(DOMAIN) for i in range(3)]
+        for case in cases:
+            case.track_create(CommCareCaseIndex(
+                case=case,
+                identifier='parent',
+                referenced_type='mother',
+                referenced_id=uuid.uuid4().hex,
+                relationship_id=CommCareCaseIndex.CHILD
+            ))
+        CommCareCase.objects.save_cases(cases)
+
+        case_ids = [case.case_id for case in cases]
+        saved = CommCareCase.objects.get_cases(case_ids, ordered=True)
+        self.assertEqual([case.case_id for case in saved], case_ids)
+        for case in cases:
+            self.assertFalse(case.has_tracked_models())
+            self.assertEqual(len(CaseTransaction.objects.get_transactions(case.case_id)), 1)
+            [index] = CommCareCaseIndex.objects.get_indices(DOMAIN, case.case_id)
+            self.assertEqual(index.domain, DOMAIN)
+
+    def test_save_cases_update_existing(self):
+        case = _create_case()
+        case.track_create(CommCareCaseIndex(
+            case=case,
+            identifier='parent',
+            referenced_type='mother',
+            referenced_id=uuid.uuid4().hex,
+            relationship_id=CommCareCaseIndex.CHILD
+        ))
+        case.save(with_tracked_models=True)
+        [index] = CommCareCaseIndex.objects.get_indices(case.domain, case.case_id)
+
+        case.name = 'updated'
+        case.track_delete(index)
+        case.track_create(CaseTransaction(
+            case=case,
+            form_id=uuid.uuid4().hex,
+            server_date=datetime.utcnow(),
+            type=CaseTransaction.TYPE_FORM,
+            revoked=False,
+        ))
+        new_case = create_case(DOMAIN)
+        CommCareCase.objects.save_cases([case, new_case])
+
+        self.assertEqual(CommCareCase.objects.get_case(case.case_id).name, 'updated')
+        self.assertEqual(len(CaseTransaction.objects.get_transactions(case.case_id)), 2)
+        self.assertEqual(CommCareCaseIndex.objects.get_indices(case.domain, case.case_id), [])
+        self.assertTrue(CommCareCase.objects.get_case(new_case.case_id))
+
+    def test_save_cases_update_attachment(self):
+        case = _create_case()
+        case.track_create(CaseAttachment(
+            case=case,
+            attachment_id=uuid.uuid4().hex,
+            name='doc',
+            content_type='text/xml',
+            blob_id='129',
+            md5='123',
+        ))
+        CommCareCase.objects.save_cases([case])
+
+        [attachment] = CaseAttachment.objects.get_attachments(case.case_id)
+        case.track_create(attachment)
+        with self.assertRaises(CaseSaveError):
+            CommCareCase.objects.save_cases([case])
+
     def test_soft_delete_and_undelete(self):
         _create_case(case_id='c1')
         _create_case(case_id='c2')
@@ -1,4 +1,6 @@
 import uuid
+from unittest.mock import patch
+
 from django.test import TestCase, SimpleTestCase
 from casexml.apps.case.exceptions import IllegalCaseId
 from casexml.apps.case.mock import CaseBlock
@@ -79,6 +81,19 @@ class CaseDbCacheTest(TestCase):
             case = cache.get(id)
             self.assertEqual(str(i), case.dynamic_case_properties()['my_index'])
 
+    def testPopulateWithLocks(self):
+        case_ids = _make_some_cases(3)
+        missing_id = uuid.uuid4().hex
+        with self.interface.casedb_cache(domain='dbcache-test', lock=True, wrap=True) as cache:
+            cache.populate(case_ids + [missing_id])
+            self.assertEqual(len(cache.locks), 3)
+            for id in case_ids:
+                self.assertTrue(cache.in_cache(id))
+
+            with patch.object(self.interface.processor, 'get_case_with_lock') as get_case_with_lock:
+                self.assertIsNone(cache.get(missing_id))
+            get_case_with_lock.assert_not_called()
+
 
 class CaseDbCacheNoDbTest(SimpleTestCase):
 
@@ -0,0 +1,131 @@
+import uuid
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from corehq.apps.receiverwrapper.util import submit_form_locally
+from corehq.form_processor.form_id_filter import (
+    MAX_FILTER_BITS,
+    FormIdFilter,
+    check_form_id_filter_bits,
+    form_id_filter,
+)
+from corehq.form_processor.interfaces.processor import FormProcessorInterface
+from corehq.form_processor.models import XFormInstance
+from corehq.form_processor.tests.utils import FormProcessorTestUtils, sharded
+from corehq.form_processor.utils import get_simple_form_xml
+
+DOMAIN = 'form-id-filter'
+
+
+@sharded
+@override_settings(FORM_ID_FILTER_BITS=2 ** 16)
+class FormIdFilterTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        form_id_filter.clear()
+        self.addCleanup(form_id_filter.clear)
+        self.addCleanup(FormProcessorTestUtils.delete_all_xforms, DOMAIN)
+        self.interface = FormProcessorInterface(DOMAIN)
+
+    def build(self):
+        self.assertTrue(form_id_filter.mark_complete(form_id_filter.start_build()))
+
+    def test_incomplete_filter_might_contain_any_id(self):
+        self.assertTrue(form_id_filter.might_contain(uuid.uuid4().hex))
+
+    def test_complete_filter(self):
+        self.build()
+        form_id = uuid.uuid4().hex
+        self.assertFalse(form_id_filter.might_contain(form_id))
+
+        form_id_filter.add([form_id])
+        self.assertTrue(form_id_filter.might_contain(form_id))
+
+    def test_saved_forms_are_added(self):
+        self.build()
+        form_id = uuid.uuid4().hex
+        submit_form_locally(get_simple_form_xml(form_id), DOMAIN)
+        self.assertTrue(form_id_filter.might_contain(form_id))
+        self.assertTrue(self.interface.is_duplicate(form_id))
+
+    def test_new_form_skips_database_check(self):
+        self.build()
+        with patch.object(XFormInstance.objects, 'form_exists') as form_exists:
+            self.assertFalse(self.interface.is_duplicate(uuid.uuid4().hex))
+        form_exists.assert_not_called()
+
+    def test_duplicate_submission(self):
+        self.build()
+        xml = get_simple_form_xml(uuid.uuid4().hex)
+        submit_form_locally(xml, DOMAIN)
+        result = submit_form_locally(xml, DOMAIN)
+        self.assertTrue(result.xform.is_duplicate)
+
+    def test_add_failure_falls_back_to_database(self):
+        self.build()
+        form_id = uuid.uuid4().hex
+        with redis_unavailable():
+            self.assertFalse(form_id_filter.add([form_id]))
+        # the filter in redis still looks complete, but the failure was
+        # recorded in the database
+        self.assertNotEqual(get_redis_connection().getrange(form_id_filter.key, 0, 7), bytes(8))
+        self.assertTrue(form_id_filter.might_contain(form_id))
+        self.assertTrue(form_id_filter.might_contain(uuid.uuid4().hex))
+
+    def test_add_failure_in_another_process(self):
+        self.build()
+        other_process_filter = FormIdFilter()
+        self.assertFalse(other_process_filter.might_contain(uuid.uuid4().hex))
+        form_id = uuid.uuid4().hex
+        with redis_unavailable():
+            self.assertFalse(form_id_filter.add([form_id]))
+        # the complete epoch cached by the other process is out of date
+        self.assertIsNotNone(other_process_filter._get_complete_epoch())
+        self.assertTrue(other_process_filter.might_contain(form_id))
+
+    def test_redis_error_drops_cached_epoch(self):
+        self.build()
+        self.assertFalse(form_id_filter.might_contain(uuid.uuid4().hex))
+        with redis_unavailable():
+            self.assertTrue(form_id_filter.might_contain(uuid.uuid4().hex))
+        self.assertIsNone(form_id_filter._state_cache)
+
+    def test_add_failure_during_build(self):
+        epoch = form_id_filter.start_build()
+        with redis_unavailable():
+            form_id_filter.add([uuid.uuid4().hex])
+        self.assertFalse(form_id_filter.mark_complete(epoch))
+        self.assertTrue(form_id_filter.might_contain(uuid.uuid4().hex))
+
+    def test_evicted_filter_falls_back_to_database(self):
+        self.build()
+        form_id_filter.add([uuid.uuid4().hex])
+        get_redis_connection().delete(form_id_filter.key)
+        self.assertTrue(form_id_filter.might_contain(uuid.uuid4().hex))
+        # ids added after the eviction do not make the filter usable again
+        form_id_filter.add([uuid.uuid4().hex])
+        self.assertTrue(form_id_filter.might_contain(uuid.uuid4().hex))
+
+
+class FormIdFilterBitsTests(SimpleTestCase):
+
+    @override_settings(FORM_ID_FILTER_BITS=MAX_FILTER_BITS)
+    def test_largest_filter(self):
+        self.assertEqual(check_form_id_filter_bits(None), [])
+        self.assertTrue(FormIdFilter().enabled)
+
+    @override_settings(FORM_ID_FILTER_BITS=2 ** 32)
+    def test_filter_too_big_for_redis(self):
+        self.assertEqual(len(check_form_id_filter_bits(None)), 1)
+        self.assertFalse(FormIdFilter().enabled)
+
+
+def redis_unavailable():
+    redis = Mock()
+    redis.pipeline.return_value.execute.side_effect = RedisError
+    redis.setrange.side_effect = RedisError
+    return patch('corehq.form_processor.form_id_filter.get_redis_connection', return_value=redis)
@@ -1,7 +1,8 @@
 import uuid
 from collections import namedtuple
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from casexml.apps.case.mock import CaseFactory, CaseBlock
 from corehq.apps.commtrack.helpers import make_product
@@ -9,10 +10,11 @@ from corehq.apps.hqcase.utils import submit_case_blocks
 from corehq.form_processor.backends.sql.dbaccessors import LedgerAccessorSQL
 from corehq.form_processor.interfaces.processor import FormProcessorInterface
 from corehq.form_processor.models import CaseTransaction, CommCareCase, LedgerTransaction
+from corehq.form_processor.parsers.ledgers.form import _iter_ledger_elements
 from corehq.form_processor.parsers.ledgers.helpers import UniqueLedgerReference
 from corehq.form_processor.tests.utils import FormProcessorTestUtils, sharded
 
-from corehq.util.test_utils import softer_assert
+from corehq.util.test_utils import flag_enabled, softer_assert
 
 DOMAIN = 'ledger-tests'
 TransactionValues = namedtuple('TransactionValues', ['type', 'product_id', 'delta', 'updated_balance'])
@@ -271,3 +273,50 @@ class LedgerTests(TestCase):
         self.assertTrue(transactions[1].is_ledger_transaction)
 
         self._assert_transactions([self._expected_val(50, 50)])
+
+
+@sharded
+@flag_enabled('BATCH_LEDGER_PROCESSING')
+class BatchLedgerTests(LedgerTests):
+    """Ledger tests with the ledgers of a form loaded and saved in batches"""
+
+    def test_populate(self):
+        self._set_balance(100)
+        existing = UniqueLedgerReference(self.case.case_id, 'stock', self.product_a._id)
+        missing = UniqueLedgerReference(self.case.case_id, 'stock', self.product_b._id)
+        ledger_db = self.interface.ledger_db
+        ledger_db.populate([existing, missing])
+        with patch.object(LedgerAccessorSQL, 'get_ledger_value') as get_ledger_value:
+            self.assertEqual(ledger_db.get_current_ledger_value(existing), 100)
+            self.assertIsNone(ledger_db.get_ledger(missing))
+        get_ledger_value.assert_not_called()
+
+
+class IterLedgerElementsTest(SimpleTestCase):
+
+    def test_outermost_ledger_elements(self):
+        xml = b"""<?xml version="1.0" ?>
+        <data xmlns="http://example.com/form">
+            <question>1</question>
+            <group>
+                <n0:balance xmlns:n0="http://commcarehq.org/ledger/v1" entity-id="c1">
+                    <n0:entry id="p1" quantity="2"/>
+                </n0:balance>
+            </group>
+            <repeat><question>2</question></repeat>
+            <n0:transfer xmlns:n0="http://commcarehq.org/ledger/v1" src="c1" dest="c2">
+                <n0:entry id="p1" quantity="1"/>
+            </n0:transfer>
+        </data>"""
+        elements = [
+            (elem.tag, dict(elem.attrib), len(elem))
+            for elem in _iter_ledger_elements(xml)
+        ]
+        self.assertEqual(elements, [
+            ('{http://commcarehq.org/ledger/v1}balance', {'entity-id': 'c1'}, 1),
+            ('{http://commcarehq.org/ledger/v1}transfer', {'src': 'c1', 'dest': 'c2'}, 1),
+        ])
+
+    def test_form_without_ledgers(self):
+        xml = b'<data xmlns="http://example.com/form"><question>1</question></data>'
+        self.assertEqual(list(_iter_ledger_elements(xml)), [])
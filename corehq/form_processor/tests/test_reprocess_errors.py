@@ -13,16 +13,19 @@ from corehq.form_processor.exceptions import CaseNotFound, XFormNotFound
 from corehq.form_processor.interfaces.dbaccessors import LedgerAccessors
 from corehq.form_processor.models import CommCareCase, XFormInstance
 from corehq.form_processor.reprocess import (
+    perform_queued_post_save_actions,
     reprocess_form,
     reprocess_unfinished_stub,
     reprocess_xform_error,
 )
 from corehq.form_processor.signals import sql_case_post_save
+from corehq.form_processor.tasks import run_queued_post_save_actions
 from corehq.form_processor.tests.utils import (
     FormProcessorTestUtils,
     sharded,
 )
 from corehq.util.context_managers import catch_signal
+from corehq.util.test_utils import flag_enabled
 from couchforms.models import UnfinishedSubmissionStub
 from couchforms.signals import successful_form_received
 
@@ -543,6 +546,85 @@ class TestTransactionErrors(TransactionTestCase):
         self.assertTrue(form.is_normal)
 
 
+@sharded
+@flag_enabled('ASYNC_POST_SAVE_ACTIONS')
+class QueuedPostSaveActionsTests(TestCase):
+    domain = 'queued-post-save-actions'
+
+    def tearDown(self):
+        FormProcessorTestUtils.delete_all_cases_forms_ledgers(self.domain)
+        UnfinishedSubmissionStub.objects.filter(domain=self.domain).delete()
+        super().tearDown()
+
+    def test_post_save_actions_run_after_submission(self):
+        case_id = uuid.uuid4().hex
+        with catch_signal(sql_case_post_save) as case_handler, \
+             patch.object(run_queued_post_save_actions, 'delay') as delay:
+            form, _ = self._submit(case_id)
+        self.assertFalse(case_handler.called)
+
+        stub = UnfinishedSubmissionStub.objects.get(domain=self.domain, xform_id=form.form_id)
+        self.assertTrue(stub.saved)
+        delay.assert_called_once_with(stub.id)
+
+        with catch_signal(sql_case_post_save) as case_handler:
+            run_queued_post_save_actions(stub.id)
+        self.assertEqual(case_id, case_handler.call_args[1]['case'].case_id)
+        self.assertFalse(UnfinishedSubmissionStub.objects.filter(id=stub.id).exists())
+
+    def test_post_save_actions_run_in_case_order(self):
+        case_id = uuid.uuid4().hex
+        with patch.object(run_queued_post_save_actions, 'delay'):
+            self._submit(case_id)
+            self._submit(case_id, create=False)
+        first, second = UnfinishedSubmissionStub.objects.filter(domain=self.domain).order_by('id')
+
+        self.assertIsNone(perform_queued_post_save_actions(second))
+        self.assertIsNone(perform_queued_post_save_actions(first).error)
+        self.assertIsNone(perform_queued_post_save_actions(second).error)
+        self.assertFalse(UnfinishedSubmissionStub.objects.filter(domain=self.domain).exists())
+
+    def test_failed_post_save_actions_are_left_for_reprocessing(self):
+        from corehq.apps.receiverwrapper.tests.test_submit_errors import failing_signal_handler
+        case_id = uuid.uuid4().hex
+        with patch.object(run_queued_post_save_actions, 'delay'):
+            form, _ = self._submit(case_id)
+        stub = UnfinishedSubmissionStub.objects.get(domain=self.domain, xform_id=form.form_id)
+
+        with failing_signal_handler('signal death'):
+            result = perform_queued_post_save_actions(stub)
+        self.assertIsNotNone(result.error)
+        stub.refresh_from_db()
+        self.assertEqual(stub.attempts, 1)
+
+    def test_duplicate_submission_while_post_save_actions_run(self):
+        case_id = uuid.uuid4().hex
+        with patch.object(run_queued_post_save_actions, 'delay'):
+            form, _ = self._submit(case_id)
+        stub = UnfinishedSubmissionStub.objects.get(domain=self.domain, xform_id=form.form_id)
+
+        @contextlib.contextmanager
+        def lock_released_after_queued_actions(stub_id):
+            # the queued actions held the lock until they were done
+            run_queued_post_save_actions(stub_id)
+            yield
+
+        with (
+            catch_signal(sql_case_post_save) as case_handler,
+            patch('corehq.form_processor.reprocess.submission_stub_lock', lock_released_after_queued_actions),
+        ):
+            self._submit(case_id, form_id=form.form_id)
+        self.assertEqual(case_handler.call_count, 1)
+        self.assertFalse(UnfinishedSubmissionStub.objects.filter(id=stub.id).exists())
+
+    def _submit(self, case_id, create=True, **kwargs):
+        return submit_case_blocks(
+            CaseBlock(case_id=case_id, create=create, case_type='box').as_text(),
+            self.domain,
+            **kwargs,
+        )
+
+
 @contextlib.contextmanager
 def _patch_save_to_raise_error(test_class):
     sql_patch = patch(
@@ -0,0 +1,90 @@
+from django.test import SimpleTestCase
+
+from casexml.apps.case.xform import extract_case_blocks
+from corehq.form_processor.parsers.form import stream_xform
+from corehq.form_processor.submission_validation import collect_image_references
+from corehq.form_processor.utils import adjust_datetimes, convert_xform_to_json
+from couchforms import XMLSyntaxError
+
+FORM_XML = b"""<?xml version="1.0" ?>
+<data xmlns="http://example.com/form" name="Visit" version="3" uiVersion="1">
+    <photo>visit.jpg</photo>
+    <n0:case xmlns:n0="http://commcarehq.org/case/transaction/v2"
+            case_id="c1" date_modified="2024-01-02T03:04:05.000+02:00">
+        <n0:update><n0:visited>2024-01-02T03:04:05.000+02:00</n0:visited></n0:update>
+    </n0:case>
+    <child>
+        <n0:case xmlns:n0="http://commcarehq.org/case/transaction/v2" case_id="r1"/>
+        <child_photo>child1.jpg</child_photo>
+    </child>
+    <group>
+        <n0:case xmlns:n0="http://commcarehq.org/case/transaction/v2" case_id="g1"/>
+        <n1:balance xmlns:n1="http://commcarehq.org/ledger/v1" entity-id="c1" date="2024-01-02">
+            <n1:entry id="p1" quantity="2"/>
+        </n1:balance>
+    </group>
+    <child>
+        <n0:case xmlns:n0="http://commcarehq.org/case/transaction/v2" case_id="r2"/>
+    </child>
+    <n1:transfer xmlns:n1="http://commcarehq.org/ledger/v1" src="c1" dest="c2">
+        <n1:entry id="p1" quantity="1"/>
+    </n1:transfer>
+    <n2:meta xmlns:n2="http://openrosa.org/jr/xforms">
+        <n2:deviceID>device</n2:deviceID>
+        <n2:timeEnd>2024-01-02T03:04:05.000+02:00</n2:timeEnd>
+        <n2:userID>user</n2:userID>
+        <n2:instanceID>form1</n2:instanceID>
+    </n2:meta>
+</data>"""
+
+
+class StreamXFormTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.form_json = adjust_datetimes(convert_xform_to_json(FORM_XML))
+        cls.streamed_form = stream_xform(FORM_XML)
+
+    def test_head(self):
+        head = self.streamed_form.head
+        self.assertEqual(set(head), {'@xmlns', '@name', '@version', '@uiVersion', '#type', 'meta'})
+        self.assertEqual(head, {key: self.form_json[key] for key in head})
+
+    def test_case_blocks(self):
+        self.assertEqual(
+            [(block, path) for block, path in self.streamed_form.case_blocks],
+            [tuple(block) for block in extract_case_blocks(self.form_json, include_path=True)],
+        )
+
+    def test_case_blocks_are_in_form_json_order(self):
+        case_ids = [block['@case_id'] for block, path in self.streamed_form.case_blocks]
+        self.assertEqual(case_ids, ['c1', 'r1', 'r2', 'g1'])
+
+    def test_ledger_blocks(self):
+        ledger_blocks = [
+            (report_type, ledger_json.get('@entity-id') or ledger_json.get('@src'), ledger_json['entry'])
+            for report_type, ledger_json in self.streamed_form.ledger_blocks
+        ]
+        self.assertEqual(ledger_blocks, [
+            ('balance', 'c1', {'@id': 'p1', '@quantity': '2'}),
+            ('transfer', 'c1', {'@id': 'p1', '@quantity': '1'}),
+        ])
+
+    def test_image_references(self):
+        self.assertEqual(self.streamed_form.image_references, {'visit.jpg', 'child1.jpg'})
+        self.assertEqual(self.streamed_form.image_references, collect_image_references(self.form_json))
+
+    def test_form_json(self):
+        self.assertEqual(self.streamed_form.form_json, convert_xform_to_json(FORM_XML))
+
+    def test_device_report_has_no_case_blocks(self):
+        streamed_form = stream_xform(
+            b'<device_report xmlns="http://code.javarosa.org/devicereport">'
+            b'<case case_id="c1"/></device_report>'
+        )
+        self.assertEqual(streamed_form.case_blocks, [])
+
+    def test_invalid_xml(self):
+        with self.assertRaises(XMLSyntaxError):
+            stream_xform(b'<data xmlns="http://example.com/form">')
@@ -12,7 +12,7 @@ from unmagic import fixture
 from corehq.apps.receiverwrapper.util import submit_form_locally
 from corehq.form_processor.models import XFormInstance
 from corehq.form_processor.submission_validation import (
-    _collect_image_references,
+    collect_image_references,
     check_image_attachments,
 )
 from corehq.form_processor.tests.utils import FormProcessorTestUtils, sharded
@@ -108,7 +108,7 @@ def test_missing_non_image_attachments_are_ignored():
     'ext', ['.jpg', '.JPG', '.jpeg', '.png', '.gif', '.heic', '.bmp', '.webp']
 )
 def test_image_extensions_are_recognised_case_insensitively(ext):
-    refs = _collect_image_references({'q': f'photo{ext}'})
+    refs = collect_image_references({'q': f'photo{ext}'})
     assert refs == {f'photo{ext}'}
 
 
@@ -120,7 +120,7 @@ def test_nested_form_data_is_walked():
         },
         'top': 'top.png',
     }
-    assert _collect_image_references(form_data) == {
+    assert collect_image_references(form_data) == {
         'nested.jpg',
         'one.jpg',
         'two.jpg',
@@ -137,9 +137,9 @@ class TestCheckImageAttachmentsCachingFootprint(TestCase):
     during submission, and how many additional calls
     ``check_image_attachments`` itself causes.
 
-    With ``instance_json`` cached on ``xform._form_json`` during
-    ``_create_new_xform``, the form XML is parsed exactly once per
-    submission and the handler does no I/O of its own.
+    With the form streamed by ``stream_xform`` during
+    ``_create_new_xform``, the whole form is never converted to JSON
+    during submission and the handler does no I/O of its own.
     """
 
     domain = 'submission-validation-tests'
@@ -176,8 +176,8 @@ class TestCheckImageAttachmentsCachingFootprint(TestCase):
 
         # `convert_xform_to_json` is re-exported from
         # `corehq.form_processor.utils` and imported with a module-local
-        # name in `parsers.form`; patch both bindings so every call site
-        # used during submission funnels through the spy.
+        # name in `parsers.form` (for `StreamedXForm.form_json`); patch
+        # both bindings so every call site funnels through the spy.
         from corehq.form_processor import utils as form_utils
         from corehq.form_processor.parsers import form as form_parser
 
@@ -227,17 +227,16 @@ class TestCheckImageAttachmentsCachingFootprint(TestCase):
             )
 
         # Pre-handler state: What processing has already done:
-        # `_create_new_xform` parses the submitted XML once and caches
-        # the result on `xform._form_json`. Every subsequent access to
-        # `form_data` during processing (e.g. `instance.metadata` in
-        # `_invalidate_caches`) reuses that cached JSON instead of
-        # reparsing.
-        assert len(pre_handler_state['convert']) == 1, (
-            'submission processing should parse the form exactly once '
+        # `_create_new_xform` streams the submitted XML once and keeps
+        # its meta and case blocks on `xform.streamed_form`. Processing
+        # (e.g. `instance.metadata` in `_invalidate_caches`) reads those
+        # instead of converting the whole form.
+        assert len(pre_handler_state['convert']) == 0, (
+            'submission processing should not convert the whole form '
             'before the signal fires'
         )
-        # The handler reads `xform.form_data`, which returns the cached
-        # `_form_json`, so the handler adds no extra parse.
+        # The handler reads the image answers found while streaming the
+        # form, so the handler adds no parse.
         handler_convert_calls = len(convert_calls) - len(
             pre_handler_state['convert']
         )
@@ -245,10 +244,10 @@ class TestCheckImageAttachmentsCachingFootprint(TestCase):
             'handler must not trigger an additional XML-to-JSON parse'
         )
 
-        # `_form_json` is populated up-front from the raw XML the
-        # submission was parsed from, so `form_data` never has to call
-        # `get_xml()`. The handler therefore does not trigger any
-        # `form.xml` blob fetch on its own.
+        # `streamed_form` is populated up-front from the raw XML the
+        # submission was parsed from, so `form_data` is never read and
+        # `get_xml()` is not called. The handler therefore does not
+        # trigger any `form.xml` blob fetch on its own.
         form_xml_fetches_total = [
             name for name in get_attachment_calls if name == 'form.xml'
         ]
@@ -18,6 +18,7 @@ from corehq.apps.change_feed.consumer.feed import (
     KafkaChangeFeed,
     KafkaCheckpointEventHandler,
 )
+from corehq.apps.change_feed.consumer.partitions import PartitionCoordinator
 from corehq.apps.change_feed.topics import CASE_TOPICS
 from corehq.apps.es.cases import case_adapter
 from corehq.apps.userreports.data_source_providers import (
@@ -33,6 +34,7 @@ from corehq.apps.data_interfaces.pillow import CaseDeduplicationProcessor
 from corehq.messaging.pillow import CaseMessagingSyncProcessor
 from corehq.pillows.base import is_couch_change_for_sql_domain
 from corehq.pillows.case_search import get_case_search_processor
+from corehq.pillows.related_docs import get_related_case_docs
 from corehq.util.doc_processor.sql import SqlDocumentProvider
 
 pillow_logging = logging.getLogger("pillowtop")
@@ -78,6 +80,11 @@ def get_case_pillow(
     processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE,
     topics=None,
     dedicated_migration_process=False,
+    pipeline_depth=0,
+    max_processor_chunk_size=0,
+    rebalance_partitions=False,
+    change_window_seconds=0,
+    change_window_size=0,
     **kwargs,
 ):
     """Return a pillow that processes cases. The processors include, UCR and elastic processors
@@ -87,14 +94,17 @@ def get_case_pillow(
       - :py:class:`pillowtop.processors.elastic.BulkElasticProcessor`
       - :py:func:`corehq.pillows.case_search.get_case_search_processor`
       - :py:class:`corehq.messaging.pillow.CaseMessagingSyncProcessor`
+
+    With ``rebalance_partitions`` the Kafka partitions are assigned to the
+    pillow processes based on their load (see
+    :py:mod:`corehq.apps.change_feed.consumer.partitions`).
+
+    With ``change_window_seconds`` or ``change_window_size`` repeated changes
+    to the same case are coalesced (see :py:mod:`pillowtop.change_window`).
     """
     if topics:
         assert set(topics).issubset(CASE_TOPICS), "This is a pillow to process cases only"
     topics = topics or CASE_TOPICS
-    change_feed = KafkaChangeFeed(
-        topics, client_id=pillow_id, num_processes=num_processes, process_num=process_num,
-        dedicated_migration_process=dedicated_migration_process
-    )
     run_migrations = (process_num == 0)  # only first process runs migrations
     ucr_processor = get_ucr_processor(
         data_source_providers=[
@@ -118,6 +128,11 @@ def get_case_pillow(
     checkpoint_id = "{}-{}-{}-{}".format(
         pillow_id, case_adapter.index_name, case_search_processor.adapter.index_name, 'messaging-sync')
     checkpoint = KafkaPillowCheckpoint(checkpoint_id, topics)
+    change_feed = KafkaChangeFeed(
+        topics, client_id=pillow_id, num_processes=num_processes, process_num=process_num,
+        dedicated_migration_process=dedicated_migration_process,
+        partition_coordinator=PartitionCoordinator(checkpoint_id) if rebalance_partitions else None,
+    )
     event_handler = KafkaCheckpointEventHandler(
         checkpoint=checkpoint, checkpoint_frequency=1000, change_feed=change_feed,
         checkpoint_callback=ucr_processor
@@ -130,6 +145,9 @@ def get_case_pillow(
     if not skip_ucr:
         # this option is useful in tests to avoid extra UCR setup where unneccessary
         processors = [ucr_processor, ucr_dr_processor] + processors
+    related_docs_fetcher = None
+    if settings.PILLOW_PREFETCH_RELATED_CASES and not skip_ucr:
+        related_docs_fetcher = get_related_case_docs
     return ConstructedPillow(
         name=pillow_id,
         change_feed=change_feed,
@@ -137,6 +155,12 @@ def get_case_pillow(
         change_processed_event_handler=event_handler,
         processor=processors,
         processor_chunk_size=processor_chunk_size,
+        pipeline_depth=pipeline_depth,
+        max_processor_chunk_size=max_processor_chunk_size,
+        change_window_seconds=change_window_seconds,
+        change_window_size=change_window_size,
+        prefetch_documents=True,
+        related_docs_fetcher=related_docs_fetcher,
         process_num=process_num,
         is_dedicated_migration_process=dedicated_migration_process and run_migrations
     )
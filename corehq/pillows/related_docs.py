@@ -0,0 +1,51 @@
+"""
+Related documents to fetch along with a chunk of pillow changes
+
+See ``pillowtop.chunk_documents``.
+"""
+from collections import defaultdict
+
+from casexml.apps.case.xform import extract_case_blocks
+from casexml.apps.case.xml.parser import case_id_from_block
+
+from corehq.form_processor.models import CommCareCase, CommCareCaseIndex
+
+
+def get_related_case_docs(docs):
+    """Get the cases that are commonly looked up while processing forms and cases
+
+    These are the cases updated by forms and the cases referenced by the
+    indices of cases. Cases that are already in ``docs`` are skipped.
+    """
+    loaded = {doc['_id'] for doc in docs}
+    case_ids_by_domain = defaultdict(set)
+    for doc in docs:
+        domain = doc.get('domain')
+        if not domain:
+            continue
+        case_ids_by_domain[domain].update(_get_related_case_ids(doc))
+
+    related = []
+    for domain, case_ids in case_ids_by_domain.items():
+        case_ids = [case_id for case_id in case_ids - loaded if case_id]
+        related.extend(_get_case_docs(domain, case_ids))
+    return related
+
+
+def _get_related_case_ids(doc):
+    if doc.get('doc_type') == 'XFormInstance':
+        return {case_id_from_block(block) for block in extract_case_blocks(doc)}
+    if doc.get('doc_type') == 'CommCareCase':
+        return {index['referenced_id'] for index in doc.get('indices', [])}
+    return set()
+
+
+def _get_case_docs(domain, case_ids):
+    if not case_ids:
+        return []
+    # fetch indices in bulk, to_json would otherwise query them per case
+    indices = CommCareCaseIndex.objects.get_indices_for_cases(domain, case_ids)
+    # attach_prefetch_models groups consecutive indices by case
+    indices.sort(key=lambda index: index.case_id)
+    cases = CommCareCase.objects.get_cases(case_ids, prefetched_indices=indices)
+    return [case.to_json() for case in cases if case.domain == domain]
@@ -0,0 +1,98 @@
+import uuid
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from casexml.apps.case.mock import CaseFactory, CaseIndex, CaseStructure
+from casexml.apps.case.tests.util import delete_all_cases, delete_all_xforms
+
+from corehq.form_processor.models import (
+    CommCareCase,
+    CommCareCaseIndex,
+    XFormInstance,
+)
+from corehq.form_processor.tests.utils import sharded
+from corehq.pillows.related_docs import _get_case_docs, get_related_case_docs
+
+
+@sharded
+class GetRelatedCaseDocsTest(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.domain = uuid.uuid4().hex
+        self.factory = CaseFactory(domain=self.domain)
+        self.addCleanup(delete_all_cases)
+        self.addCleanup(delete_all_xforms)
+
+    def test_parent_cases(self):
+        child, parent = self._create_child_and_parent()
+        docs = get_related_case_docs([child.to_json()])
+        self.assertEqual([doc['_id'] for doc in docs], [parent.case_id])
+
+    def test_cases_of_forms(self):
+        child, parent = self._create_child_and_parent()
+        form = XFormInstance.objects.get_form(child.xform_ids[0], self.domain)
+        docs = get_related_case_docs([form.to_json()])
+        self.assertEqual({doc['_id'] for doc in docs}, {child.case_id, parent.case_id})
+
+    def test_loaded_cases_are_skipped(self):
+        child, parent = self._create_child_and_parent()
+        docs = get_related_case_docs([child.to_json(), parent.to_json()])
+        self.assertEqual(docs, [])
+
+    def test_other_domain(self):
+        child, parent = self._create_child_and_parent()
+        doc = child.to_json()
+        doc['domain'] = 'other-domain'
+        self.assertEqual(get_related_case_docs([doc]), [])
+
+    def test_indices_of_related_cases(self):
+        grandchild_id = uuid.uuid4().hex
+        child_id = uuid.uuid4().hex
+        parent_id = uuid.uuid4().hex
+        self.factory.create_or_update_case(CaseStructure(
+            case_id=grandchild_id,
+            indices=[CaseIndex(CaseStructure(
+                case_id=child_id,
+                indices=[CaseIndex(CaseStructure(case_id=parent_id, attrs={'create': True}))],
+                attrs={'create': True},
+            ))],
+            attrs={'create': True},
+        ))
+        grandchild = CommCareCase.objects.get_case(grandchild_id, self.domain)
+        [child] = get_related_case_docs([grandchild.to_json()])
+        self.assertEqual([index['referenced_id'] for index in child['indices']], [parent_id])
+
+    def test_indices_not_grouped_by_case(self):
+        case_id = uuid.uuid4().hex
+        other_id = uuid.uuid4().hex
+        self.factory.create_or_update_cases([
+            CaseStructure(case_id=case_id, attrs={'create': True}, indices=[
+                CaseIndex(CaseStructure(attrs={'create': True})),
+                CaseIndex(CaseStructure(attrs={'create': True}), relationship='extension'),
+            ]),
+            CaseStructure(case_id=other_id, attrs={'create': True}, indices=[
+                CaseIndex(CaseStructure(attrs={'create': True})),
+            ]),
+        ])
+        indices = CommCareCaseIndex.objects.get_indices_for_cases(self.domain, [case_id, other_id])
+        [first, second] = [index for index in indices if index.case_id == case_id]
+        [other] = [index for index in indices if index.case_id == other_id]
+        with patch.object(CommCareCaseIndex.objects, 'get_indices_for_cases', return_value=[first, other, second]):
+            docs = _get_case_docs(self.domain, [case_id, other_id])
+        num_indices = {doc['_id']: len(doc['indices']) for doc in docs}
+        self.assertEqual(num_indices, {case_id: 2, other_id: 1})
+
+    def _create_child_and_parent(self):
+        child_id = uuid.uuid4().hex
+        parent_id = uuid.uuid4().hex
+        self.factory.create_or_update_case(CaseStructure(
+            case_id=child_id,
+            indices=[CaseIndex(CaseStructure(case_id=parent_id, attrs={'create': True}))],
+            attrs={'create': True},
+        ))
+        return (
+            CommCareCase.objects.get_case(child_id, self.domain),
+            CommCareCase.objects.get_case(parent_id, self.domain),
+        )
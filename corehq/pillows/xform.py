@@ -33,6 +33,7 @@ from corehq.apps.userreports.data_source_providers import (
 from corehq.apps.userreports.pillow import get_ucr_processor
 from corehq.form_processor.backends.sql.dbaccessors import FormReindexAccessor
 from corehq.pillows.base import is_couch_change_for_sql_domain
+from corehq.pillows.related_docs import get_related_case_docs
 from corehq.pillows.user import UnknownUsersProcessor
 from corehq.util.doc_processor.sql import SqlDocumentProvider
 
@@ -137,6 +138,8 @@ def get_xform_pillow(
         processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE,
         topics=None,
         dedicated_migration_process=False,
+        pipeline_depth=0,
+        max_processor_chunk_size=0,
         **kwargs,
 ):
     """Generic XForm change processor
@@ -191,6 +194,9 @@ def get_xform_pillow(
         processors.append(form_meta_processor)
     if not skip_ucr:
         processors.append(ucr_processor)
+    related_docs_fetcher = None
+    if settings.PILLOW_PREFETCH_RELATED_CASES and not skip_ucr:
+        related_docs_fetcher = get_related_case_docs
 
     return ConstructedPillow(
         name=pillow_id,
@@ -199,6 +205,10 @@ def get_xform_pillow(
         change_processed_event_handler=event_handler,
         processor=processors,
         processor_chunk_size=processor_chunk_size,
+        pipeline_depth=pipeline_depth,
+        max_processor_chunk_size=max_processor_chunk_size,
+        prefetch_documents=True,
+        related_docs_fetcher=related_docs_fetcher,
         process_num=process_num,
         is_dedicated_migration_process=dedicated_migration_process and (process_num == 0)
     )
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+from corehq.sql_db.operations import RawSQLMigration
+
+migrator = RawSQLMigration(('corehq', 'sql_accessors', 'sql_templates'), {})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sql_accessors', '0070_livequery_without_exclusions'),
+        ('form_processor', '0101_casesnapshot'),
+    ]
+
+    operations = [
+        migrator.get_migration('hard_delete_cases_3.sql'),
+    ]
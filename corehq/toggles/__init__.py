@@ -2552,3 +2552,121 @@ CHUNKED_LIVEQUERY = FeatureRelease(
     namespaces=[NAMESPACE_DOMAIN],
     owner='Daniel Miller',
 )
+
+LIVEQUERY_CASE_GRAPH_CACHE = FeatureRelease(
+    slug='livequery_case_graph_cache',
+    label='LiveQuery variant: reuse a cached case graph for owner sets whose cases have not changed.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+RESTORE_CASE_XML_CACHE = FeatureRelease(
+    slug='restore_case_xml_cache',
+    label='Restore: reuse serialized case XML across restores until the case is modified.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+SHARED_RESTORE_CASE_PAYLOAD = FeatureRelease(
+    slug='shared_restore_case_payload',
+    label='Restore: build the group and location owned case payload of initial restores once and '
+          'share it between users with the same owners.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+COMPACT_SYNCLOG_ENCODING = FeatureRelease(
+    slug='compact_synclog_encoding',
+    label='Store the case state of sync logs in a compact binary encoding rather than JSON.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+PARALLEL_RESTORE_FIXTURES = FeatureRelease(
+    slug='parallel_restore_fixtures',
+    label='Restore: run fixture providers concurrently.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+PRECOMPUTE_RESTORES = FeatureRelease(
+    slug='precompute_restores',
+    label='Restore: generate restores ahead of time for devices that usually sync at the same time of day.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+BATCH_FORM_SUBMISSIONS = FeatureRelease(
+    slug='batch_form_submissions',
+    label='Accept batches of forms in a single submission request.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+BULK_SAVE_CASES = FeatureRelease(
+    slug='bulk_save_cases',
+    label='Form processing: save the cases of a form with one statement per table.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+ASYNC_POST_SAVE_ACTIONS = FeatureRelease(
+    slug='async_post_save_actions',
+    label='Form processing: run form post save actions in a task after responding to the submission.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+BATCH_CASE_LOCKS = FeatureRelease(
+    slug='batch_case_locks',
+    label='Form processing: read and lock the cases of a form in one batch, skipping locks for new cases.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+CASE_REBUILD_SNAPSHOTS = FeatureRelease(
+    slug='case_rebuild_snapshots',
+    label='Form processing: save snapshots of cases while rebuilding them and resume later rebuilds '
+          'from the latest unaffected snapshot.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+BATCH_LEDGER_PROCESSING = FeatureRelease(
+    slug='batch_ledger_processing',
+    label='Form processing: load the ledgers of a form in one query and save them with one statement '
+          'per table.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+SET_BASED_LEDGER_REBUILD = FeatureRelease(
+    slug='set_based_ledger_rebuild',
+    label='Form processing: rebuild ledgers with window functions in the database rather than '
+          'replaying their transactions in Python.',
+    tag=TAG_RELEASE,
+    namespaces=[NAMESPACE_DOMAIN],
+    owner='Daniel Miller',
+)
+
+RESTORE_PROFILING = StaticToggle(
+    'restore_profiling',
+    'Save a timing profile of every restore',
+    TAG_INTERNAL,
+    namespaces=[NAMESPACE_DOMAIN, NAMESPACE_USER],
+    description="Profiles of slow restores are always saved. Enable this for a project or "
+                "mobile worker to save profiles of all of their restores, viewable from the "
+                "restore profiles admin page for a week.",
+)
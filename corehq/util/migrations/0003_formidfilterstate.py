@@ -0,0 +1,22 @@
+# Generated by Django 5.2.14 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('util', '0002_complaintbouncemeta_permanentbouncemeta_transientbounceemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormIdFilterState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('epoch', models.IntegerField(default=0)),
+                ('complete', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -432,3 +432,16 @@ class GetOrNoneManager(models.Manager):
             return self.get(**kwargs)
         except self.model.DoesNotExist:
             return None
+
+
+class FormIdFilterState(models.Model):
+    """State of the form id filter (see ``corehq.form_processor.form_id_filter``)
+
+    Kept in the database rather than in redis with the filter so that
+    form ids that could not be added are recorded even while redis is
+    unavailable, and so that the state survives eviction of the filter.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    # incremented when the filter is rebuilt or form ids could not be added
+    epoch = models.IntegerField(default=0)
+    complete = models.BooleanField(default=False)
@@ -0,0 +1,36 @@
+from testil import eq
+
+from corehq.util.timer import TimingContext, timing_dict_to_folded_stacks
+
+
+def test_add_count():
+    timing = TimingContext('root')
+    with timing:
+        with timing('child'):
+            timing.add_count('items', 2)
+            timing.add_count('items')
+        timing.add_count('bytes', 10)
+    timing.add_count('ignored')  # no current timer
+
+    timer_dict = timing.to_dict()
+    eq(timer_dict['counts'], {'bytes': 10})
+    eq(timer_dict['subs'][0]['counts'], {'items': 3})
+
+
+def test_timing_dict_to_folded_stacks():
+    timer_dict = {
+        'name': 'restore',
+        'duration': 1.0,
+        'subs': [
+            {'name': 'fixtures;v2', 'duration': 0.25, 'subs': []},
+            {'name': 'cases', 'duration': 0.5, 'subs': [
+                {'name': 'livequery', 'duration': 0.5, 'subs': []},
+            ]},
+        ],
+    }
+    eq(timing_dict_to_folded_stacks(timer_dict), (
+        'restore 250\n'
+        'restore;fixtures:v2 250\n'
+        'restore;cases 0\n'
+        'restore;cases;livequery 500\n'
+    ))
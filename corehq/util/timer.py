@@ -17,6 +17,7 @@ class NestableTimer(object):
         self.beginning = None
         self.end = None
         self.subs = []
+        self.counts = {}
         self.root = self if is_root else None
         self.parent = None
         self.uuid = uuid.uuid4()
@@ -65,6 +66,8 @@ class NestableTimer(object):
             'percent_parent': self.percent_of_parent,
             'subs': [sub.to_dict() for sub in self.subs]
         }
+        if self.counts:
+            timer_dict['counts'] = dict(self.counts)
         if not self.duration:
             timer_dict.update({
                 'beginning': self.beginning,
@@ -143,6 +146,12 @@ class TimingContext(object):
     def peek(self):
         return self.stack[-1]
 
+    def add_count(self, name, value=1):
+        """Add to a named count (items, bytes, etc.) on the current timer"""
+        if self.stack:
+            counts = self.peek().counts
+            counts[name] = counts.get(name, 0) + value
+
     def is_finished(self):
         return not self.stack
 
@@ -240,6 +249,28 @@ class TimerError(Exception):
     pass
 
 
+def timing_dict_to_folded_stacks(timer_dict):
+    """Convert ``TimingContext.to_dict()`` output to folded stack format
+
+    One line per timer of the form ``root;parent;name <milliseconds>``,
+    where the value is the time spent in the timer and not in any of its
+    sub-timers. This is the input format of flamegraph.pl and speedscope.
+    """
+    lines = []
+
+    def visit(timer, prefix):
+        name = (timer['name'] or '').replace(';', ':')
+        path = prefix + name
+        duration = timer['duration'] or 0
+        own_duration = duration - sum(sub['duration'] or 0 for sub in timer['subs'])
+        lines.append('{} {}'.format(path, max(0, round(own_duration * 1000))))
+        for sub in timer['subs']:
+            visit(sub, path + ';')
+
+    visit(timer_dict, '')
+    return '\n'.join(lines) + '\n'
+
+
 def time_method():
     """Decorator to get timing information on a class method
 
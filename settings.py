@@ -533,6 +533,11 @@ USER_REPORTING_METADATA_UPDATE_FREQUENCY = 15
 USER_REPORTING_METADATA_BATCH_ENABLED = False
 USER_REPORTING_METADATA_BATCH_SCHEDULE = {'timedelta': {'minutes': 5}}
 
+# Size in bits of the Bloom filter of saved form ids that lets submissions
+# of new forms skip the database check for an existing form. 0 disables it.
+# Run the build_form_id_filter management command after setting it.
+FORM_ID_FILTER_BITS = 0
+
 
 BASE_ADDRESS = 'localhost:8000'
 
@@ -823,6 +828,9 @@ RUN_FORM_META_PILLOW = True
 RUN_CASE_SEARCH_PILLOW = True
 RUN_UNKNOWN_USER_PILLOW = True
 RUN_DEDUPLICATION_PILLOW = True
+# fetch the cases related to each chunk of forms and cases along with it
+# for UCR related_doc expressions (see corehq.pillows.related_docs)
+PILLOW_PREFETCH_RELATED_CASES = False
 
 # Repeaters in the order in which they should appear in "Data Forwarding"
 REPEATER_CLASSES = [